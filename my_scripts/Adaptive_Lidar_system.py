@@ -13,6 +13,9 @@ from matplotlib.colors import LinearSegmentedColormap
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import numpy as np
+from frame_buffers import FrameBufferPool
+from boundary_shading import BoundaryShading
+from profiling_hook import ProfilingHook
 
 # ============== CONFIGURATION PARAMETERS ==============
 RMAX = 6.0  # Maximum display range in meters - EASILY ADJUSTABLE
@@ -69,53 +72,14 @@ laser.setlidaropt(ydlidar.LidarPropIntenstiy, False)
 
 scan = ydlidar.LaserScan()
 scan_count = 0
+# Preallocated working buffers for cleaning, boundary and coloring
+buffers = FrameBufferPool(WHEELCHAIR_WIDTH / 2.0, WHEELCHAIR_LENGTH / 2.0, DANGER_ZONE, CAUTION_ZONE)
+# On-demand profiling of the live loop: F9 in the window or kill -USR1 <pid>
+profiling = ProfilingHook('Adaptive_Lidar_system', fig)
+# Persistent shading patch - vertices are rewritten in place every frame
+shading = BoundaryShading(color='black', alpha=0.35, zorder=2)
 freq_text = None
 
-def get_distance_to_wheelchair_boundary(x, y):
-    """
-    Calculate the minimum distance from a point (x, y) to the wheelchair boundary.
-    The wheelchair is centered at origin with dimensions WHEELCHAIR_WIDTH x WHEELCHAIR_LENGTH.
-    """
-    half_width = WHEELCHAIR_WIDTH / 2.0
-    half_length = WHEELCHAIR_LENGTH / 2.0
-    
-    # Calculate distance to each edge
-    dx = max(abs(x) - half_width, 0)
-    dy = max(abs(y) - half_length, 0)
-    
-    # Euclidean distance to nearest point on rectangle
-    return np.sqrt(dx**2 + dy**2)
-
-def get_point_color(distance_to_boundary):
-    """
-    Return RGB color based on distance to wheelchair boundary.
-    RED (danger) -> YELLOW (caution) -> GREEN (safe)
-    """
-    if distance_to_boundary <= DANGER_ZONE:
-        # RED zone - very close, danger!
-        return np.array([1.0, 0.0, 0.0])  # Pure red
-    elif distance_to_boundary <= CAUTION_ZONE:
-        # Transition from RED to YELLOW to GREEN
-        normalized = (distance_to_boundary - DANGER_ZONE) / (CAUTION_ZONE - DANGER_ZONE)
-        
-        if normalized < 0.5:
-            # RED to YELLOW transition (0.0 to 0.5)
-            t = normalized * 2.0  # Scale to 0-1
-            r = 1.0
-            g = t  # Increase green from 0 to 1
-            b = 0.0
-        else:
-            # YELLOW to GREEN transition (0.5 to 1.0)
-            t = (normalized - 0.5) * 2.0  # Scale to 0-1
-            r = 1.0 - t  # Decrease red from 1 to 0
-            g = 1.0
-            b = 0.0
-        
-        return np.array([r, g, b])
-    else:
-        # GREEN zone - safe distance
-        return np.array([0.0, 1.0, 0.0])  # Pure green
-
 def animate(num):
     global scan_count, freq_text
     
@@ -143,59 +107,31 @@ def animate(num):
         
         # Draw the LiDAR points with distance-based color coding
         if len(angle) > 0:
-            # Convert to numpy arrays
-            angles = np.array(angle)
-            ranges = np.array(ran)
-            
-            # Normalize angles to [-pi, pi)
-            angles = ((angles + np.pi) % (2*np.pi)) - np.pi
+            # Copy into the preallocated buffers; angles normalized to [-pi, pi)
+            angles, ranges = buffers.load(angle, ran)
+            # Isolated phantom returns (glass, edges, dark surfaces) count as no return
+            # for the boundary and are not drawn
+            buffers.reject_outliers()
             
             # Replace invalid ranges (<=0 or >RMAX) with RMAX (interpreted as no-obstacle)
-            ranges_clean = np.copy(ranges)
-            invalid_mask = (ranges_clean <= 0) | (ranges_clean > RMAX) | np.isnan(ranges_clean)
-            ranges_clean[invalid_mask] = RMAX
+            ranges_clean = buffers.clean(RMAX)
             
-            # --- Interpolate the boundary on a dense theta grid to make a smooth boundary ---
-            # We duplicate the angle/range arrays shifted by +/- 2*pi to avoid wrap issues during interpolation
-            idx_sort = np.argsort(angles)
-            a_sorted = angles[idx_sort]
-            r_sorted = ranges_clean[idx_sort]
-            
-            # Extend for wrap-around (avoid gaps at -pi/pi)
-            a_ext = np.concatenate([a_sorted - 2*np.pi, a_sorted, a_sorted + 2*np.pi])
-            r_ext = np.concatenate([r_sorted, r_sorted, r_sorted])
-            
-            # Dense theta grid (720 points -> 0.5 degree resolution)
-            theta_grid = np.linspace(-np.pi, np.pi, 720)
-            r_grid = np.interp(theta_grid, a_ext, r_ext)
-            # Clip r_grid to [0, RMAX]
-            r_grid = np.clip(r_grid, 0.0, RMAX)
+            # Interpolate the boundary on the dense theta grid (720 points -> 0.5 degree
+            # resolution); wrap-around at -pi/pi is handled by the pool
+            r_grid = buffers.boundary(RMAX)
             
             # Fill the outside region between boundary (r_grid) and RMAX
             # We only fill where r_grid < RMAX (i.e., obstacle detected closer than max range)
             # This creates a darker band outside the detected boundary to RMAX
-            lidar_polar.fill_between(theta_grid, r_grid, RMAX,
-                                     where=(r_grid < RMAX),
-                                     interpolate=True,
-                                     color='black', alpha=0.35, zorder=2, linewidth=0)
-            
-            # Now compute colors for each raw point based on distance to wheelchair boundary
-            colors = []
-            for ang, rr in zip(angles, ranges_clean):
-                # Convert to Cartesian coordinates (lidar is assumed at origin)
-                x = rr * np.cos(ang)
-                y = rr * np.sin(ang)
-                
-                # Calculate distance to wheelchair boundary
-                dist_to_boundary = get_distance_to_wheelchair_boundary(x, y)
-                
-                # Get color based on distance
-                color = get_point_color(dist_to_boundary)
-                colors.append(color)
+            shading.update(r_grid, RMAX)
+            lidar_polar.add_patch(shading.patch)  # clear() detaches it every frame
             
-            colors = np.array(colors)
+            # Now compute colors for each point based on distance to wheelchair boundary
+            colors = buffers.colors(ranges_clean)
+            shown = ~buffers.rejected
             # Plot with gradient colors; place on top of the shading
-            lidar_polar.scatter(angles, ranges_clean, c=colors, s=18, alpha=0.95, edgecolors='none', zorder=6)
+            lidar_polar.scatter(angles[shown], ranges_clean[shown], c=colors[shown], s=18, alpha=0.95,
+                                edgecolors='none', zorder=6)
         
         # Add wheelchair footprint (light gray semi-transparent rectangle)
         # Draw it BELOW all LiDAR data so it doesn't hide any points or boundaries
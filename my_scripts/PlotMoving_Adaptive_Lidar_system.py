@@ -7,11 +7,22 @@ import os
 import ydlidar
 import time
 import sys
-from matplotlib.patches import Arc, FancyArrow, Wedge, Rectangle
+from matplotlib.patches import Arc, FancyArrow, Wedge
 from matplotlib.colors import LinearSegmentedColormap
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
 import numpy as np
+from frame_buffers import FrameBufferPool
+from scan_matching import ScanMatcher, compose_pose
+from dynamic_obstacles import DYNAMIC_COLOR, DynamicObstacleClassifier
+from boundary_shading import BoundaryShading
+from profiling_hook import ProfilingHook
+from latency_trace import LatencyTrace, flush_display
+from zoom_backgrounds import StaticLayer, ZoomBackgroundCache, zoom_levels
+from change_detection import IncrementalFrame
+from outlier_filter import neighbor_outliers
+from deskew import deskew, velocity_from_motion
+from scan_trail import ScanTrail
+from matplotlib.transforms import Bbox
 
 # ============== CONFIGURATION PARAMETERS ==============
 RMAX_ABSOLUTE = 8.0  # Absolute maximum display range in meters - EASILY ADJUSTABLE
@@ -30,24 +41,36 @@ LIDAR_Y = 0.3  # Y position (0.5m = center of 1m length) - EASILY ADJUSTABLE
 DANGER_ZONE = 0.20  # Distance in meters - RED zone (very close, 10-20cm from wheelchair)
 CAUTION_ZONE = 0.70  # Distance from wheelchair boundary - YELLOW zone starts here
 # GREEN zone is beyond CAUTION_ZONE (safe distance)
+DYNAMIC_ALERT_DISTANCE = 1.5  # Warn when a MOVING obstacle is this close to the wheelchair (m)
 
 # Auto-scaling parameters
 SCALE_MARGIN = 1.2  # Add 20% margin to furthest point for better visibility
 SMOOTHING_FACTOR = 0.3  # Smoothing for scale changes (0=instant, 1=no change)
+
+# Fading trail of the previous scans, placed by the ego-motion estimate
+TRAIL_SCANS = 8  # Previous scans in the trail (0 = no trail) - EASILY ADJUSTABLE
+
+# Zoom levels: the smoothed range snaps up to a multiple of ZOOM_STEP, and each
+# level's static layer is cached as a bitmap (about 4 MB per level)
+ZOOM_STEP = 0.5
+MAX_CACHED_LEVELS = 6
 # ======================================================
 
 # Create figure with dark theme
 fig = plt.figure(figsize=(10, 10), facecolor='#0a1929')  # Dark navy background
 fig.canvas.manager.set_window_title('Moving Suggestive LiDAR Navigation')
 lidar_polar = plt.subplot(polar=True)
-lidar_polar.set_theta_zero_location('N')  # Set 0° to top (North)
-lidar_polar.set_theta_direction(-1)  # Counterclockwise
 
-# Style the plot with dark theme
-lidar_polar.set_facecolor('#0a1929')  # Dark navy background
-lidar_polar.grid(True, color='white', alpha=0.3, linestyle='--', linewidth=0.5)
-lidar_polar.tick_params(colors='white')
-lidar_polar.spines['polar'].set_color('white')
+# Static layer (dark theme, grid, footprint, front arrow, range label) drawn
+# once per zoom level and cached as a bitmap; only the scan's artists are
+# redrawn each frame, so they are created once as animated artists
+static_layer = StaticLayer(lidar_polar, WHEELCHAIR_WIDTH, WHEELCHAIR_LENGTH, linewidth=1.5, zorder=1)
+zoom = ZoomBackgroundCache(fig, static_layer.set_zoom, zoom_levels(RMIN_DISPLAY, RMAX_ABSOLUTE, ZOOM_STEP),
+                           MAX_CACHED_LEVELS)
+points = lidar_polar.scatter([], [], s=10, alpha=0.9, edgecolors='white', linewidth=0.3, zorder=6, animated=True)
+trail = ScanTrail(lidar_polar, TRAIL_SCANS, max_range=RMAX_ABSOLUTE)
+title = lidar_polar.set_title('', pad=25, fontsize=13, fontweight='bold', color='white')
+title.set_animated(True)
 
 ports = ydlidar.lidarPortList()
 port = "/dev/ydlidar"
@@ -71,58 +94,32 @@ laser.setlidaropt(ydlidar.LidarPropIntenstiy, False)
 
 scan = ydlidar.LaserScan()
 scan_count = 0
+# Preallocated working buffers for cleaning, boundary and coloring
+buffers = FrameBufferPool(WHEELCHAIR_WIDTH / 2.0, WHEELCHAIR_LENGTH / 2.0, DANGER_ZONE, CAUTION_ZONE)
+# On-demand profiling of the live loop: F9 in the window or kill -USR1 <pid>
+profiling = ProfilingHook('PlotMoving_Adaptive_Lidar_system', fig)
+# Scan age on screen, from scan.stamp to the flush: F10 or kill -USR2 <pid> exports a trace
+latency = LatencyTrace('PlotMoving_Adaptive_Lidar_system', fig)
+# Persistent shading patch - vertices are rewritten in place every frame
+shading = BoundaryShading(color='black', alpha=0.35, zorder=2, animated=True)
+lidar_polar.add_patch(shading.patch)
 current_rmax = RMAX_ABSOLUTE  # Start with max range
-
-def get_distance_to_wheelchair_boundary(x, y):
-    """
-    Calculate the minimum distance from a point (x, y) to the wheelchair boundary.
-    The wheelchair is centered at origin with dimensions WHEELCHAIR_WIDTH x WHEELCHAIR_LENGTH.
-    """
-    half_width = WHEELCHAIR_WIDTH / 2.0
-    half_length = WHEELCHAIR_LENGTH / 2.0
-    
-    # Calculate distance to each edge
-    dx = max(abs(x) - half_width, 0)
-    dy = max(abs(y) - half_length, 0)
-    
-    # Euclidean distance to nearest point on rectangle
-    return np.sqrt(dx**2 + dy**2)
-
-def get_point_color(distance_to_boundary):
-    """
-    Return RGB color based on distance to wheelchair boundary.
-    RED (danger) -> YELLOW (caution) -> GREEN (safe)
-    """
-    if distance_to_boundary <= DANGER_ZONE:
-        # RED zone - very close, danger!
-        return np.array([1.0, 0.0, 0.0])  # Pure red
-    elif distance_to_boundary <= CAUTION_ZONE:
-        # Transition from RED to YELLOW to GREEN
-        normalized = (distance_to_boundary - DANGER_ZONE) / (CAUTION_ZONE - DANGER_ZONE)
-        
-        if normalized < 0.5:
-            # RED to YELLOW transition
-            t = normalized * 2.0
-            r = 1.0
-            g = t
-            b = 0.0
-        else:
-            # YELLOW to GREEN transition
-            t = (normalized - 0.5) * 2.0
-            r = 1.0 - t
-            g = 1.0
-            b = 0.0
-        
-        return np.array([r, g, b])
-    else:
-        # GREEN zone - safe distance
-        return np.array([0.0, 1.0, 0.0])  # Pure green
+# Scan-to-scan ego-motion: chair pose accumulated from the first scan (x, y, heading)
+matcher = ScanMatcher(max_range=RMAX_ABSOLUTE)
+chair_pose = (0.0, 0.0, 0.0)
+velocity = (0.0, 0.0, 0.0)  # Sensor-frame (vx, vy, omega) from the last match, for de-skewing the next scan
+# Static vs dynamic returns from differencing against recent scans
+classifier = DynamicObstacleClassifier()
+# Displayed scan, updated only in the sectors where new scans differ from it
+frame = IncrementalFrame(buffers)
+alert = ''
 
 def animate(num):
-    global scan_count, current_rmax
+    global scan_count, current_rmax, chair_pose, velocity, alert
     
     r = laser.doProcessSimple(scan)
     if r:
+        trace_id = latency.begin(scan.stamp)
         scan_count += 1
         angle = []
         ran = []
@@ -131,9 +128,22 @@ def animate(num):
             angle.append(point.angle)
             ran.append(point.range)
         
+        # Isolated phantom returns (glass, edges, dark surfaces) count as no return,
+        # so they do not pull the zoom out, and are left out of the drawn points
+        ran = np.array(ran)
+        rejected = neighbor_outliers(ran)
+        ran[rejected] = 0.0
+        
+        # Undo the chair's own motion during the revolution (83 ms at 12 Hz), so
+        # walls stay straight and clearances true while turning
+        angle, ran = deskew(angle, ran, velocity, scan.config.scan_time, scan.config.time_increment)
+        
+        # Compare with the scan on screen before doing any work on it
+        status = frame.check(angle, ran, rejected)
+        
         # Calculate dynamic range based on furthest point
         if len(ran) > 0:
-            max_distance = max(ran)
+            max_distance = ran.max()
             target_rmax = min(max_distance * SCALE_MARGIN, RMAX_ABSOLUTE)
             target_rmax = max(target_rmax, RMIN_DISPLAY)  # Don't go below minimum
             
@@ -141,122 +151,76 @@ def animate(num):
             current_rmax = current_rmax * (1 - SMOOTHING_FACTOR) + target_rmax * SMOOTHING_FACTOR
         else:
             current_rmax = RMAX_ABSOLUTE
+        level = zoom.snap(current_rmax)
         
-        lidar_polar.clear()
-        lidar_polar.set_ylim(0, current_rmax)  # Auto-scaling
-        lidar_polar.set_rmax(current_rmax)
-        lidar_polar.set_theta_zero_location('N')  # Front pointing up
-        lidar_polar.set_theta_direction(-1)  # Counterclockwise
-        
-        # Style with dark theme
-        lidar_polar.set_facecolor('#0a1929')
-        lidar_polar.grid(True, color='white', alpha=0.3, linestyle='--', linewidth=0.5)
-        lidar_polar.tick_params(colors='white', labelsize=9)
-        lidar_polar.spines['polar'].set_color('white')
-        
-        # Draw area-based segmentation with interpolated boundary
-        if len(angle) > 0:
-            # Convert to numpy arrays
-            angles = np.array(angle)
-            ranges = np.array(ran)
+        if status != 'unchanged' or not zoom.is_current(level):
+            # Estimate how the chair moved since the previous scan
+            motion = matcher.match(angle, ran)
+            velocity = velocity_from_motion(motion, scan.config.scan_time) if motion.converged else (0.0, 0.0, 0.0)
+            chair_pose = compose_pose(chair_pose, motion)
             
-            # Normalize angles to [-pi, pi)
-            angles = ((angles + np.pi) % (2*np.pi)) - np.pi
+            # Flag returns where something moved into previously free space
+            dynamic = classifier.update(angle, ran, motion if motion.converged else None)
             
-            # Replace invalid ranges with current_rmax
-            ranges_clean = np.copy(ranges)
-            invalid_mask = (ranges_clean <= 0) | (ranges_clean > current_rmax) | np.isnan(ranges_clean)
-            ranges_clean[invalid_mask] = current_rmax
+            # Colors, cleaned ranges and boundary at the zoom level's range, recomputed
+            # only in changed sectors; moving obstacles override the distance colors
+            frame.apply(level, dynamic, DYNAMIC_COLOR)
+            moving = frame.distances[frame.highlighted]
+            alert = f' | MOVING OBSTACLE {moving.min():.1f}m' if moving.size and moving.min() <= DYNAMIC_ALERT_DISTANCE else ''
             
-            # Interpolate the boundary on a dense theta grid
-            idx_sort = np.argsort(angles)
-            a_sorted = angles[idx_sort]
-            r_sorted = ranges_clean[idx_sort]
-            
-            # Extend for wrap-around
-            a_ext = np.concatenate([a_sorted - 2*np.pi, a_sorted, a_sorted + 2*np.pi])
-            r_ext = np.concatenate([r_sorted, r_sorted, r_sorted])
-            
-            # Dense theta grid (720 points -> 0.5 degree resolution)
-            theta_grid = np.linspace(-np.pi, np.pi, 720)
-            r_grid = np.interp(theta_grid, a_ext, r_ext)
-            r_grid = np.clip(r_grid, 0.0, current_rmax)
+            # Previous scans as seen from the current pose, then this scan joins them;
+            # once the chair's motion shifts the trail on screen it is redrawn in full
+            trail_moved = trail.moved(chair_pose, lidar_polar, level)
+            trail.update(chair_pose)
+            trail.push(angle, ran, chair_pose)
+            region = frame.changed_extent(lidar_polar) if zoom.is_current(level) and not trail_moved else None
             
             # Fill the area OUTSIDE the boundary (darker = obstacles/unknown)
-            lidar_polar.fill_between(theta_grid, r_grid, current_rmax,
-                                     where=(r_grid < current_rmax),
-                                     interpolate=True,
-                                     color='black', alpha=0.35, zorder=2, linewidth=0)
-        
-        # Draw the LiDAR points with distance-based color coding
-        if len(angle) > 0:
-            colors = []
-            for ang, r in zip(angle, ran):
-                # Convert to Cartesian coordinates
-                x = r * np.cos(ang)
-                y = r * np.sin(ang)
-                
-                # Calculate distance to wheelchair boundary
-                dist_to_boundary = get_distance_to_wheelchair_boundary(x, y)
-                
-                # Get color based on distance
-                color = get_point_color(dist_to_boundary)
-                colors.append(color)
+            shading.update(frame.r_grid, level)
+            shading.patch.set_visible(len(frame.angles) > 0)
             
-            colors = np.array(colors)
-            lidar_polar.scatter(angle, ran, c=colors, s=10, alpha=0.9, edgecolors='white', linewidth=0.3, zorder=6)
-        
-        # Add wheelchair footprint (drawn BELOW all LiDAR data)
-        half_width = WHEELCHAIR_WIDTH / 2.0
-        half_length = WHEELCHAIR_LENGTH / 2.0
-        rect_x = -half_width
-        rect_y = -half_length
-        
-        wheelchair_rect = Rectangle((rect_x, rect_y), WHEELCHAIR_WIDTH, WHEELCHAIR_LENGTH,
-                                   transform=lidar_polar.transData._b,
-                                   facecolor='lightgray', 
-                                   edgecolor='gray',
-                                   alpha=0.3,
-                                   linewidth=1.5,
-                                   zorder=1)
-        lidar_polar.add_patch(wheelchair_rect)
-        
-        # Add front direction arrow
-        arrow_length = current_rmax * 0.12
-        arrow_start = current_rmax * 0.02
-        arrow_width = 0.20
-        
-        arrow_tip = [0, arrow_start + arrow_length]
-        arrow_left = [arrow_width, arrow_start + arrow_length * 0.7]
-        arrow_right = [-arrow_width, arrow_start + arrow_length * 0.7]
-        
-        lidar_polar.fill([arrow_left[0], 0, arrow_right[0], arrow_left[0]], 
-                        [arrow_left[1], arrow_tip[1], arrow_right[1], arrow_left[1]],
-                        color='#ff3366', alpha=0.9, zorder=10, edgecolor='white', linewidth=1.5)
-        
-        lidar_polar.plot([0, 0], [arrow_start, arrow_start + arrow_length * 0.6], 
-                        color='#ff3366', linewidth=3, alpha=0.9, zorder=10)
-        
-        center_circle = plt.Circle((0, 0), current_rmax * 0.015, transform=lidar_polar.transData._b,
-                                  facecolor='#ff3366', zorder=11, edgecolor='white', linewidth=2)
-        lidar_polar.add_patch(center_circle)
-        
-        lidar_polar.text(0, arrow_start + arrow_length + current_rmax * 0.06, 'FRONT',
-                        ha='center', va='bottom', fontsize=12, fontweight='bold',
-                        color='#ff3366', zorder=12)
-        
-        # Add current range marker
-        lidar_polar.text(np.pi/4, current_rmax * 0.95, f'{current_rmax:.1f}m', 
-                        ha='center', fontsize=9, color='white', alpha=0.7)
+            latency.mark(trace_id, 'process')
+            if region is None:
+                # Background for the zoom level: cached bitmap, drawn only the first time
+                zoom.restore(current_rmax)
+                trail.visible_in(lidar_polar)
+                shown = frame.shown
+                points.set_offsets(np.column_stack([frame.angles[shown], frame.ranges[shown]]))
+                points.set_facecolors(frame.colors[shown])
+            else:
+                # Local change: redraw only the changed sectors and the points reaching into them
+                inside = frame.points_in(lidar_polar, region)
+                trail.visible_in(lidar_polar, region)
+                points.set_offsets(np.column_stack([frame.angles[inside], frame.ranges[inside]]))
+                points.set_facecolors(frame.colors[inside])
+                zoom.blit_region(lidar_polar, [shading.patch, trail.collection, points], region)
+        else:
+            # Same scene as on screen: points, shading and alert stay as drawn
+            region = Bbox.null()
+            latency.mark(trace_id, 'process')
         
-        # Display frequency and stats with zoom level
+        # Display frequency and stats with zoom level and estimated pose
+        previous_title = title.get_window_extent()
+        odom = f'Odom: ({chair_pose[0]:+.2f}, {chair_pose[1]:+.2f})m {np.degrees(chair_pose[2]):+.0f}°{alert}'
+        if latency.completed:
+            odom += f' | Latency p95: {latency.percentile(95) * 1e3:.0f} ms'
         if scan.config.scan_time > 0:
             freq = 1.0 / scan.config.scan_time
-            title = f'Moving Navigation (Auto-Zoom: {current_rmax:.1f}m) | Scan #{scan_count} | Points: {len(angle)} | {freq:.2f} Hz'
+            title.set_text(f'Moving Navigation (Auto-Zoom: {level:.1f}m) | Scan #{scan_count} | Points: {len(angle)} | {freq:.2f} Hz\n{odom}')
         else:
-            title = f'Moving Navigation (Auto-Zoom: {current_rmax:.1f}m) | Scan #{scan_count} | Points: {len(angle)} | Initializing...'
+            title.set_text(f'Moving Navigation (Auto-Zoom: {level:.1f}m) | Scan #{scan_count} | Points: {len(angle)} | Initializing...\n{odom}')
         
-        lidar_polar.set_title(title, pad=25, fontsize=13, fontweight='bold', color='white')
+        if region is None:
+            zoom.blit(lidar_polar, [shading.patch, trail.collection, points, title])
+        else:
+            zoom.blit_region(lidar_polar, [title], Bbox.union([previous_title, title.get_window_extent()]))
+        latency.mark(trace_id, 'draw')
+        flush_display(fig.canvas)
+        latency.end(trace_id)
+        if scan_count % 120 == 0:
+            print(zoom.summary())
+            print(f"Change detection: {frame.summary()}")
+            print(f"Latency: {latency.summary()}")
 
 print("\n=== Moving Suggestive LiDAR Navigation ===")
 print(f"Port: {port}")
@@ -275,8 +239,15 @@ if ret:
         print("✓ LiDAR scanning started!")
         print("\n🔍 Auto-scaling enabled - View adjusts to detected objects")
         print("Close the matplotlib window to stop...\n")
-        ani = animation.FuncAnimation(fig, animate, interval=10, cache_frame_data=False)
+        # A plain timer instead of FuncAnimation: animate() blits its own frames,
+        # and FuncAnimation would follow every frame with a full redraw
+        timer = fig.canvas.new_timer(interval=10)
+        timer.add_callback(animate, 0)
+        timer.start()
         plt.show()
+        print(zoom.summary())
+        print(f"Change detection: {frame.summary()}")
+        print(f"Latency: {latency.summary()}")
     else:
         print("✗ Failed to turn on LiDAR!")
     laser.turnOff()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Boundary Shading - persistent patch for the adaptive viewers
+Shades the region between the interpolated LiDAR boundary and the outer
+display radius with a single compound Path whose vertices are rewritten in
+place every frame, instead of building a new fill_between PolyCollection.
+
+Run directly to benchmark against the fill_between call it replaces.
+"""
+import time
+
+import numpy as np
+from matplotlib.patches import PathPatch
+from matplotlib.path import Path
+
+# Dense theta grid (720 points -> 0.5 degree resolution)
+GRID_POINTS = 720
+
+
+class BoundaryShading:
+    """
+    Shaded band from the boundary r_grid(theta) out to rmax.
+
+    The path holds two closed rings on the same theta grid: the outer ring at
+    rmax (counterclockwise) and the boundary ring (clockwise). With nonzero
+    winding only the band between them is filled, and wherever the boundary
+    sits at rmax the band has zero width - the same result as
+    fill_between(..., where=(r_grid < rmax)).
+    """
+
+    def __init__(self, n_grid=GRID_POINTS, **patch_kwargs):
+        self.theta_grid = np.linspace(-np.pi, np.pi, n_grid)
+        self.n_grid = n_grid
+
+        # [outer ring (n), CLOSEPOLY, boundary ring reversed (n), CLOSEPOLY]
+        self._vertices = np.zeros((2 * n_grid + 2, 2))
+        self._outer = self._vertices[:n_grid]
+        self._inner = self._vertices[n_grid + 1:2 * n_grid + 1]
+        self._outer[:, 0] = self.theta_grid
+        self._inner[:, 0] = self.theta_grid[::-1]
+
+        codes = np.full(2 * n_grid + 2, Path.LINETO, dtype=Path.code_type)
+        codes[0] = codes[n_grid + 1] = Path.MOVETO
+        codes[n_grid] = codes[2 * n_grid + 1] = Path.CLOSEPOLY
+
+        # Path keeps a reference to our float64 array, so in-place writes show
+        # up on the next draw without rebuilding anything
+        self.path = Path(self._vertices, codes)
+        patch_kwargs.setdefault('linewidth', 0)
+        self.patch = PathPatch(self.path, **patch_kwargs)
+
+    def update(self, r_grid, rmax):
+        """Write the new boundary (sampled on theta_grid) and outer radius into the path."""
+        self._outer[:, 1] = rmax
+        # _inner is stored reversed, so walk r_grid backwards into it
+        self._inner[:, 1] = r_grid[::-1]
+        # Closing vertices are ignored by CLOSEPOLY but keep them finite
+        self._vertices[self.n_grid] = self._outer[0]
+        self._vertices[-1] = self._inner[0]
+        self.patch.stale = True
+        return self.patch
+
+
+def _benchmark(frames=200, n_points=500, rmax=6.0):
+    """Time fill_between against the persistent patch on a headless Agg canvas."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    rng = np.random.default_rng(0)
+    style = dict(color='black', alpha=0.35, zorder=2, linewidth=0)
+    theta_grid = np.linspace(-np.pi, np.pi, GRID_POINTS)
+
+    def make_boundary():
+        angles = np.sort(rng.uniform(-np.pi, np.pi, n_points))
+        ranges = 2.0 + 3.0 * np.abs(np.sin(3 * angles + rng.uniform(0, np.pi))) + rng.normal(0, 0.1, n_points)
+        ranges[ranges > rmax] = rmax
+        a_ext = np.concatenate([angles - 2 * np.pi, angles, angles + 2 * np.pi])
+        r_ext = np.concatenate([ranges, ranges, ranges])
+        return np.clip(np.interp(theta_grid, a_ext, r_ext), 0.0, rmax)
+
+    boundaries = [make_boundary() for _ in range(frames)]
+
+    fig = plt.figure(figsize=(10, 10), facecolor='#0a1929')
+    ax = plt.subplot(polar=True)
+    ax.set_theta_zero_location('N')
+    ax.set_theta_direction(-1)
+    ax.set_ylim(0, rmax)
+    ax.set_facecolor('#0a1929')
+    fig.canvas.draw()
+
+    # Current call: a new PolyCollection built and drawn every frame
+    start = time.perf_counter()
+    for r_grid in boundaries:
+        coll = ax.fill_between(theta_grid, r_grid, rmax, where=(r_grid < rmax),
+                               interpolate=True, **style)
+        ax.draw_artist(coll)
+        coll.remove()
+    fill_between_time = (time.perf_counter() - start) / frames
+
+    coll = ax.fill_between(theta_grid, boundaries[-1], rmax, where=(boundaries[-1] < rmax),
+                           interpolate=True, **style)
+    fig.canvas.draw()
+    reference = np.asarray(fig.canvas.buffer_rgba()).astype(np.int16)
+    coll.remove()
+
+    # Persistent patch updated in place
+    shading = BoundaryShading(**style)
+    ax.add_patch(shading.patch)
+    start = time.perf_counter()
+    for r_grid in boundaries:
+        shading.update(r_grid, rmax)
+        ax.draw_artist(shading.patch)
+    patch_time = (time.perf_counter() - start) / frames
+
+    fig.canvas.draw()
+    rendered = np.asarray(fig.canvas.buffer_rgba()).astype(np.int16)
+    plt.close(fig)
+
+    diff = np.abs(rendered - reference).max(axis=2)
+    print(f"Frames: {frames} | Scan points: {n_points} | Grid: {GRID_POINTS}")
+    print(f"fill_between (build + draw): {fill_between_time * 1e3:6.2f} ms/frame")
+    print(f"Persistent patch (update + draw): {patch_time * 1e3:6.2f} ms/frame "
+          f"({patch_time / fill_between_time * 100:.0f}% of fill_between)")
+    print(f"Pixels differing by >8 levels: {np.mean(diff > 8) * 100:.3f}%")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,14 @@
+"""
+Stand-in for the ydlidar SDK that reads scans from scan_broker.
+
+run.sh --broker puts this directory first on PYTHONPATH, so the scripts'
+`import ydlidar` connects to the running broker instead of opening the
+serial port; any number of them can run at once.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulated_lidar import *  # noqa: E402,F401,F403 - option constants, LaserScan, os_init/os_isOk
+from scan_broker import BrokerLidar as CYdLidar, lidarPortList  # noqa: E402,F401
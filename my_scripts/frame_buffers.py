@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Frame Buffers - preallocated working memory for per-frame scan processing
+Runs the cleaning, boundary interpolation and coloring stages of the viewers
+entirely inside buffers sized once for the largest scan, using in-place
+out= operations, so a steady stream of frames allocates (almost) nothing.
+
+Run directly to compare against the original per-frame code and to check
+steady-state allocations with tracemalloc; the run fails if a warmed-up
+frame allocates more than PEAK_BUDGET or the pool keeps growing.
+"""
+import time
+import tracemalloc
+
+import numpy as np
+
+from boundary_shading import GRID_POINTS
+from outlier_filter import neighbor_outliers, outlier_buffers
+
+MAX_POINTS = 2048  # Enough for TOF scans; the pool grows once if a scan is larger
+TWO_PI = 2 * np.pi
+
+# Steady-state allocation bounds enforced by the check run (independent of points per scan)
+PEAK_BUDGET = 8 * 1024     # Bytes of temporaries one warmed-up frame may allocate at its peak (6.3 KiB measured)
+RETAINED_BUDGET = 1024     # Bytes still allocated after all frames of the check
+
+
+class FrameBufferPool:
+    """
+    Reusable buffers for one viewer's frame processing.
+
+    Call load() with the extracted scan, optionally reject_outliers(), then
+    any of clean(), boundary() and colors(). Every method returns views into
+    the pool, valid until the next load() - copy them if they must outlive
+    the frame. Rejected returns stay in the arrays with range 0; rejected
+    marks them, so they can be left out of what is drawn or sent.
+    """
+
+    def __init__(self, half_width, half_length, danger_zone, caution_zone,
+                 max_points=MAX_POINTS, n_grid=GRID_POINTS):
+        self.half_width = half_width
+        self.half_length = half_length
+        self.danger_zone = danger_zone
+        self.caution_zone = caution_zone
+        self.n = 0
+
+        # Boundary grid (fixed for the life of the pool)
+        self.theta_grid = np.linspace(-np.pi, np.pi, n_grid)
+        self._theta0 = self.theta_grid[0]
+        self._step = self.theta_grid[1] - self.theta_grid[0]
+        self.r_grid = np.empty(n_grid)
+        self._hist = np.empty(n_grid + 1, dtype=np.intp)
+        self._j = np.empty(n_grid, dtype=np.intp)
+        self._lo = np.empty(n_grid, dtype=np.intp)
+        self._a_lo = np.empty(n_grid)
+        self._a_hi = np.empty(n_grid)
+        self._r_lo = np.empty(n_grid)
+        self._r_hi = np.empty(n_grid)
+        self._w = np.empty(n_grid)
+        self._w_ok = np.empty(n_grid, dtype=bool)
+
+        self._allocate(max_points)
+
+    def _allocate(self, max_points):
+        self.max_points = max_points
+        self.angles = np.empty(max_points)
+        self.ranges = np.empty(max_points)
+        self.ranges_clean = np.empty(max_points)
+        self._mask = np.empty(max_points, dtype=bool)
+        self._mask_tmp = np.empty(max_points, dtype=bool)
+        self._x = np.empty(max_points)
+        self._y = np.empty(max_points)
+        self.distances = np.empty(max_points)
+        self._rejected = np.zeros(max_points, dtype=bool)
+        self._colors = np.zeros((max_points, 3))
+        # Wrap-extended, angle-sorted boundary samples: [a - 2pi, a, a + 2pi]
+        self._a_ext = np.empty(3 * max_points)
+        self._r_ext = np.empty(3 * max_points)
+        self._bins = np.empty(3 * max_points)
+        self._bin_idx = np.empty(3 * max_points, dtype=np.intp)
+        self._outliers = outlier_buffers(max_points)
+
+    def load(self, angle, ran):
+        """Copy one extracted scan into the pool and normalize angles to [-pi, pi)."""
+        n = len(angle)
+        if n > self.max_points:
+            self._allocate(max(n, 2 * self.max_points))
+        self.n = n
+        self._rejected[:n] = False
+        a = self.angles[:n]
+        r = self.ranges[:n]
+        a[:] = angle
+        r[:] = ran
+        np.add(a, np.pi, out=a)
+        np.remainder(a, TWO_PI, out=a)
+        np.subtract(a, np.pi, out=a)
+        return a, r
+
+    @property
+    def rejected(self):
+        """Mask of the loaded returns removed by reject_outliers() (all False without it)."""
+        return self._rejected[:self.n]
+
+    def reject_outliers(self):
+        """
+        Set isolated phantom returns to range 0 (no return), in place, and
+        mark them in rejected; returns how many.
+        """
+        r = self.ranges[:self.n]
+        mask = neighbor_outliers(r, buffers=self._outliers)
+        np.copyto(r, 0.0, where=mask)
+        np.copyto(self._rejected[:self.n], mask)
+        return int(np.count_nonzero(mask))
+
+    def clean(self, rmax):
+        """Ranges with invalid returns (<=0, >rmax, NaN) replaced by rmax (no obstacle)."""
+        n = self.n
+        r = self.ranges[:n]
+        clean = self.ranges_clean[:n]
+        mask = self._mask[:n]
+        tmp = self._mask_tmp[:n]
+        np.isnan(r, out=mask)
+        np.less_equal(r, 0, out=tmp)
+        np.logical_or(mask, tmp, out=mask)
+        np.greater(r, rmax, out=tmp)
+        np.logical_or(mask, tmp, out=mask)
+        np.copyto(clean, r)
+        np.copyto(clean, rmax, where=mask)
+        return clean
+
+    def boundary(self, rmax):
+        """
+        Cleaned ranges interpolated onto theta_grid, clipped to [0, rmax].
+
+        Same result as np.interp over the wrap-extended sorted scan. Scans
+        arrive angle-ordered (at most one wrap), so the sort is a rotation
+        copied straight into the extension buffer; only unordered input falls
+        back to argsort. The interpolation uses the uniform grid to bucket
+        samples instead of searchsorted, so it needs no temporaries.
+        """
+        n = self.n
+        if n == 0:
+            # Nothing seen anywhere: the boundary runs out to the display range
+            self.r_grid.fill(rmax)
+            return self.r_grid
+        a = self.angles[:n]
+        r = self.ranges_clean[:n]
+        a_mid = self._a_ext[n:2 * n]
+        r_mid = self._r_ext[n:2 * n]
+
+        desc = self._mask[:n - 1]
+        np.less(a[1:], a[:-1], out=desc)
+        drops = np.count_nonzero(desc)
+        if drops == 0 or (drops == 1 and a[-1] <= a[0]):
+            k = int(np.argmax(desc)) + 1 if drops else 0
+            a_mid[:n - k] = a[k:]
+            a_mid[n - k:] = a[:k]
+            r_mid[:n - k] = r[k:]
+            r_mid[n - k:] = r[:k]
+        else:
+            order = np.argsort(a)
+            np.take(a, order, out=a_mid)
+            np.take(r, order, out=r_mid)
+
+        np.subtract(a_mid, TWO_PI, out=self._a_ext[:n])
+        np.add(a_mid, TWO_PI, out=self._a_ext[2 * n:3 * n])
+        self._r_ext[:n] = r_mid
+        self._r_ext[2 * n:3 * n] = r_mid
+        a_ext = self._a_ext[:3 * n]
+        r_ext = self._r_ext[:3 * n]
+
+        # First grid index at or after each sample, then count samples <= each grid angle
+        bins = self._bins[:3 * n]
+        np.subtract(a_ext, self._theta0, out=bins)
+        np.divide(bins, self._step, out=bins)
+        np.ceil(bins, out=bins)
+        np.clip(bins, 0, len(self.theta_grid), out=bins)
+        bin_idx = self._bin_idx[:3 * n]
+        np.copyto(bin_idx, bins, casting='unsafe')
+        self._hist.fill(0)
+        np.add.at(self._hist, bin_idx, 1)
+        np.cumsum(self._hist[:-1], out=self._j)
+
+        # Bracketing samples a_ext[j-1] <= theta < a_ext[j] and linear weights
+        np.subtract(self._j, 1, out=self._lo)
+        np.take(a_ext, self._lo, out=self._a_lo, mode='clip')
+        np.take(a_ext, self._j, out=self._a_hi, mode='clip')
+        np.take(r_ext, self._lo, out=self._r_lo, mode='clip')
+        np.take(r_ext, self._j, out=self._r_hi, mode='clip')
+        w = self._w
+        np.subtract(self._a_hi, self._a_lo, out=self._a_hi)
+        np.subtract(self.theta_grid, self._a_lo, out=w)
+        np.greater(self._a_hi, 0, out=self._w_ok)
+        np.divide(w, self._a_hi, out=w, where=self._w_ok)
+        np.logical_not(self._w_ok, out=self._w_ok)
+        np.copyto(w, 0.0, where=self._w_ok)
+
+        np.subtract(self._r_hi, self._r_lo, out=self._r_hi)
+        np.multiply(self._r_hi, w, out=self._r_hi)
+        np.add(self._r_lo, self._r_hi, out=self.r_grid)
+        np.clip(self.r_grid, 0.0, rmax, out=self.r_grid)
+        return self.r_grid
+
+    def colors(self, ranges):
+        """
+        RGB colors (n, 3) by distance to the wheelchair boundary for the loaded angles.
+
+        Distance is to the rectangle |x| <= half_width, |y| <= half_length.
+        Red up to the danger zone, red -> yellow -> green across the caution
+        band, green beyond it.
+        """
+        n = self.n
+        a = self.angles[:n]
+        x = self._x[:n]
+        y = self._y[:n]
+        d = self.distances[:n]
+        colors = self._colors[:n]
+
+        np.cos(a, out=x)
+        np.multiply(x, ranges, out=x)
+        np.sin(a, out=y)
+        np.multiply(y, ranges, out=y)
+        np.abs(x, out=x)
+        np.subtract(x, self.half_width, out=x)
+        np.maximum(x, 0, out=x)
+        np.abs(y, out=y)
+        np.subtract(y, self.half_length, out=y)
+        np.maximum(y, 0, out=y)
+        np.hypot(x, y, out=d)
+
+        # t: 0 at the danger zone edge, 1 at the caution zone edge
+        t = x
+        np.subtract(d, self.danger_zone, out=t)
+        np.divide(t, self.caution_zone - self.danger_zone, out=t)
+        np.clip(t, 0.0, 1.0, out=t)
+        red = colors[:, 0]
+        green = colors[:, 1]
+        np.multiply(t, -2.0, out=red)
+        np.add(red, 2.0, out=red)
+        np.minimum(red, 1.0, out=red)
+        np.multiply(t, 2.0, out=green)
+        np.minimum(green, 1.0, out=green)
+        return colors
+
+
+def _reference_frame(angle, ran, rmax, half_width, half_length, danger, caution):
+    """The per-frame code the viewers ran before the pool, for comparison."""
+    angles = np.array(angle)
+    ranges = np.array(ran)
+    angles = ((angles + np.pi) % (2 * np.pi)) - np.pi
+    ranges_clean = np.copy(ranges)
+    invalid_mask = (ranges_clean <= 0) | (ranges_clean > rmax) | np.isnan(ranges_clean)
+    ranges_clean[invalid_mask] = rmax
+    idx_sort = np.argsort(angles)
+    a_sorted = angles[idx_sort]
+    r_sorted = ranges_clean[idx_sort]
+    a_ext = np.concatenate([a_sorted - 2 * np.pi, a_sorted, a_sorted + 2 * np.pi])
+    r_ext = np.concatenate([r_sorted, r_sorted, r_sorted])
+    theta_grid = np.linspace(-np.pi, np.pi, GRID_POINTS)
+    r_grid = np.clip(np.interp(theta_grid, a_ext, r_ext), 0.0, rmax)
+
+    colors = []
+    for ang, rr in zip(angles, ranges_clean):
+        x = rr * np.cos(ang)
+        y = rr * np.sin(ang)
+        dist = np.sqrt(max(abs(x) - half_width, 0) ** 2 + max(abs(y) - half_length, 0) ** 2)
+        if dist <= danger:
+            colors.append(np.array([1.0, 0.0, 0.0]))
+        elif dist <= caution:
+            normalized = (dist - danger) / (caution - danger)
+            if normalized < 0.5:
+                colors.append(np.array([1.0, normalized * 2.0, 0.0]))
+            else:
+                colors.append(np.array([1.0 - (normalized - 0.5) * 2.0, 1.0, 0.0]))
+        else:
+            colors.append(np.array([0.0, 1.0, 0.0]))
+    return ranges_clean, r_grid, np.array(colors)
+
+
+def _benchmark(frames=300):
+    from synthetic_scans import TOF_POINTS, TRIANGLE_POINTS, default_room, generate_scan
+
+    rng = np.random.default_rng(0)
+    room = default_room()
+    rmax = 6.0
+    geometry = dict(half_width=0.25, half_length=0.30)
+    zones = dict(danger=0.20, caution=0.70)
+
+    for n_points in (TRIANGLE_POINTS, TOF_POINTS):
+        # Device-style scans: start mid-revolution so there is one angle wrap
+        scans = []
+        for k in range(frames):
+            angles, ranges = generate_scan((rng.uniform(-1, 1), rng.uniform(-1, 1), 0.0), room,
+                                           n_points=n_points, rng=rng)
+            angles = np.roll(angles, k % n_points)
+            ranges = np.roll(ranges, k % n_points)
+            scans.append((list(angles), list(ranges)))
+
+        pool = FrameBufferPool(0.25, 0.30, zones['danger'], zones['caution'])
+
+        def run_pool(angle, ran):
+            pool.load(angle, ran)
+            clean = pool.clean(rmax)
+            pool.boundary(rmax)
+            return pool.colors(clean)
+
+        # Same output as the original code
+        worst = 0.0
+        for angle, ran in scans[:20]:
+            ref_clean, ref_grid, ref_colors = _reference_frame(angle, ran, rmax, geometry['half_width'],
+                                                               geometry['half_length'], **zones)
+            colors = run_pool(angle, ran)
+            worst = max(worst, np.abs(pool.ranges_clean[:pool.n] - ref_clean).max(),
+                        np.abs(pool.r_grid - ref_grid).max(), np.abs(colors - ref_colors).max())
+
+        start = time.perf_counter()
+        for angle, ran in scans:
+            _reference_frame(angle, ran, rmax, geometry['half_width'], geometry['half_length'], **zones)
+        ref_time = (time.perf_counter() - start) / frames
+
+        start = time.perf_counter()
+        for angle, ran in scans:
+            run_pool(angle, ran)
+        pool_time = (time.perf_counter() - start) / frames
+
+        # Steady-state allocations per frame (peak above the starting point)
+        def peak_per_frame(step):
+            tracemalloc.start()
+            for angle, ran in scans[:10]:
+                step(angle, ran)
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            for angle, ran in scans:
+                step(angle, ran)
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return peak - baseline, current - baseline
+
+        ref_peak, _ = peak_per_frame(lambda a, r: _reference_frame(a, r, rmax, geometry['half_width'],
+                                                                   geometry['half_length'], **zones))
+        pool_peak, pool_growth = peak_per_frame(run_pool)
+
+        print(f"Points/scan: {n_points} | max difference vs original: {worst:.2e}")
+        print(f"  original: {ref_time * 1e3:7.3f} ms/frame, peak temporaries {ref_peak / 1024:8.1f} KiB")
+        print(f"  pool:     {pool_time * 1e3:7.3f} ms/frame, peak temporaries {pool_peak / 1024:8.1f} KiB, "
+              f"retained after {frames} frames {pool_growth} B")
+        assert worst < 1e-9, f"pool output differs from the original code by {worst:.2e}"
+        assert pool_peak <= PEAK_BUDGET, \
+            f"{n_points} points: {pool_peak} B of per-frame temporaries, budget {PEAK_BUDGET} B"
+        assert pool_growth <= RETAINED_BUDGET, \
+            f"{n_points} points: {pool_growth} B retained after {frames} frames, budget {RETAINED_BUDGET} B"
+
+    # A scan with no points at all (nothing extracted) leaves the whole grid at rmax
+    pool.load([], [])
+    pool.clean(rmax)
+    assert (pool.boundary(rmax) == rmax).all() and pool.colors(pool.ranges_clean[:0]).shape == (0, 3)
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,549 @@
+#!/usr/bin/env python3
+"""
+Frame Stream - processed scan frames for thin-client displays
+The chair publishes what the viewers would draw instead of drawing it:
+quantized points, a zone class per point, the boundary radii and the zoom
+level. A display device (tablet, laptop, second Pi) subscribes over UDP and
+renders the frames itself, so the chair never runs matplotlib.
+
+Usage:
+    python3 frame_stream.py --publish            # on the chair, headless
+    python3 frame_stream.py --view 192.168.1.20  # on the display device
+    python3 frame_stream.py                      # no device: benchmark + loopback check
+
+Frames are delta-compressed: every KEYFRAME_INTERVAL-th frame stands alone,
+the frames in between only carry their difference from the previous one.
+A subscriber that misses a frame asks for a keyframe and skips deltas until
+it arrives. Subscribers register by sending any datagram to the publisher;
+the publisher never waits on them - a subscriber that cannot keep up only
+loses frames.
+
+Frame layout (little endian):
+    magic 'LV', version u8, flags u8, sequence u32, base u32,
+    n_points u16, n_boundary u16, zoom u16 (mm), points_size u16, then
+    two zlib sections: points (points_size bytes) holding n_points angles
+    u16 (2*pi / 65536 steps), n_points ranges u16 (mm) and n_points zone
+    classes u8, and boundary holding n_boundary radii u16 (mm). The u16
+    values are sent low-byte plane first, then high-byte plane.
+"""
+import argparse
+import collections
+import socket
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from profiling_hook import ProfilingHook
+
+# ============== CONFIGURATION PARAMETERS ==============
+STREAM_PORT = 5006        # UDP port the publisher listens on for subscribers
+KEYFRAME_INTERVAL = 12    # One standalone frame per second at 12 Hz
+SUBSCRIBER_TIMEOUT = 5.0  # Forget subscribers silent for this long (seconds)
+HELLO_INTERVAL = 1.0      # How often a client re-announces itself (seconds)
+COMPRESSION_LEVEL = 1     # zlib level - fastest still gets most of the gain
+FRAME_SIZE_BUDGET = 4096  # Largest frame the benchmark accepts in bytes (3.3 KiB measured at 2000 points)
+PUBLISH_BUDGET = 0.005    # Largest p95 publish() time the benchmark accepts beside a stalled subscriber (0.5-0.7 ms measured)
+
+# Processing on the chair (same values as the moving viewer)
+RMAX_ABSOLUTE = 8.0       # Maximum zoom / sensing range in meters
+RMIN_DISPLAY = 2.0        # Minimum zoom
+SCALE_MARGIN = 1.2        # Zoom to 20% beyond the furthest point
+SMOOTHING_FACTOR = 0.3    # Smoothing for zoom changes
+WHEELCHAIR_WIDTH = .50    # Width in meters
+WHEELCHAIR_LENGTH = .60   # Length in meters
+DANGER_ZONE = 0.20        # RED zone
+CAUTION_ZONE = 0.70       # YELLOW zone
+# ======================================================
+
+ZONE_SAFE = 0
+ZONE_CAUTION = 1
+ZONE_DANGER = 2
+ZONE_DYNAMIC = 3
+ZONE_COLORS = np.array([[0.0, 1.0, 0.0],   # green
+                        [1.0, 1.0, 0.0],   # yellow
+                        [1.0, 0.0, 0.0],   # red
+                        [1.0, 0.0, 1.0]])  # magenta, as in dynamic_obstacles
+
+FRAME_MAGIC = b'LV'
+FRAME_VERSION = 1
+FLAG_POINTS_DELTA = 0x01    # points coded against the base frame
+FLAG_BOUNDARY_DELTA = 0x02  # boundary coded against the base frame
+REQUEST_KEYFRAME = b'K'
+HELLO = b'H'
+ANGLE_SCALE = 65536 / (2 * np.pi)
+_HEADER = struct.Struct('<2sBBIIHHHH')
+
+StreamFrame = collections.namedtuple('StreamFrame', 'sequence zoom angles ranges zones boundary')
+
+
+def zone_classes(distances, danger_zone, caution_zone, dynamic=None):
+    """Zone class per point from its distance to the wheelchair boundary."""
+    zones = (distances <= caution_zone).astype(np.uint8)
+    zones += distances <= danger_zone
+    if dynamic is not None:
+        zones[dynamic] = ZONE_DYNAMIC
+    return zones
+
+
+def _to_mm(values):
+    return np.clip(np.round(np.asarray(values) * 1000.0), 0, 0xFFFF).astype(np.uint16)
+
+
+def _split_planes(words):
+    """uint16 array -> low bytes then high bytes; the high plane is mostly 0/255 after differencing."""
+    return words.view(np.uint8).reshape(-1, 2).T.tobytes()
+
+
+def _join_planes(data, count):
+    planes = np.frombuffer(data, dtype=np.uint8, count=2 * count).reshape(2, count)
+    return np.ascontiguousarray(planes.T).view('<u2').reshape(-1)
+
+
+def _neighbor_delta(words):
+    out = np.empty_like(words)
+    if len(words):
+        out[0] = words[0]
+        np.subtract(words[1:], words[:-1], out=out[1:])
+    return out
+
+
+def _undo_neighbor_delta(words):
+    return np.cumsum(words, dtype=np.uint16)
+
+
+class FrameEncoder:
+    """
+    Quantizes and compresses frames, keeping the previous one as the base for deltas.
+
+    Points and boundary are compressed as two sections. Between keyframes
+    each section is coded both against the previous frame and against its
+    own angular neighbors, and the smaller result is sent: a parked chair
+    sees almost identical scans, a driving one does not, and the zoom moves
+    the clamped boundary every frame.
+    """
+
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.sequence = 0
+        self._since_key = None
+        self._prev = None
+
+    def force_keyframe(self):
+        self._since_key = None
+
+    @staticmethod
+    def _compress(words, classes=b''):
+        return zlib.compress(_split_planes(words) + classes, COMPRESSION_LEVEL)
+
+    def encode(self, angles, ranges, zones, boundary, zoom):
+        a = (np.round((np.asarray(angles) + np.pi) * ANGLE_SCALE).astype(np.int64) & 0xFFFF).astype(np.uint16)
+        r = _to_mm(ranges)
+        b = _to_mm(boundary)
+        z = np.asarray(zones, dtype=np.uint8)
+
+        key = self._since_key is None or self._since_key + 1 >= self.keyframe_interval
+        prev = self._prev
+        flags = 0
+        points = self._compress(np.concatenate([_neighbor_delta(a), _neighbor_delta(r)]), z.tobytes())
+        if not key and len(prev[0]) == len(a):
+            delta = self._compress(np.concatenate([a - prev[0], r - prev[1]]), (z ^ prev[3]).tobytes())
+            if len(delta) < len(points):
+                points = delta
+                flags |= FLAG_POINTS_DELTA
+        bounds = self._compress(_neighbor_delta(b))
+        if not key and len(prev[2]) == len(b):
+            delta = self._compress(b - prev[2])
+            if len(delta) < len(bounds):
+                bounds = delta
+                flags |= FLAG_BOUNDARY_DELTA
+
+        base = self.sequence - 1 if flags else self.sequence
+        header = _HEADER.pack(FRAME_MAGIC, FRAME_VERSION, flags, self.sequence & 0xFFFFFFFF,
+                              base & 0xFFFFFFFF, len(a), len(b), int(_to_mm(zoom)), len(points))
+
+        self._prev = (a, r, b, z)
+        self._since_key = 0 if key else self._since_key + 1
+        self.sequence += 1
+        return header + points + bounds
+
+
+class FrameDecoder:
+    """Inverse of FrameEncoder; returns None for deltas whose base frame was missed."""
+
+    def __init__(self):
+        self._prev = None
+        self._sequence = None
+
+    def decode(self, message):
+        (magic, version, flags, sequence, base, n_points, n_boundary, zoom,
+         points_size) = _HEADER.unpack_from(message)
+        if magic != FRAME_MAGIC or version != FRAME_VERSION:
+            raise ValueError("Not a frame stream message")
+        if flags and (self._prev is None or base != self._sequence):
+            return None
+
+        points = zlib.decompress(message[_HEADER.size:_HEADER.size + points_size])
+        words = _join_planes(points, 2 * n_points)
+        classes = np.frombuffer(points, dtype=np.uint8, count=n_points, offset=4 * n_points)
+        b = _join_planes(zlib.decompress(message[_HEADER.size + points_size:]), n_boundary)
+        a, r = words[:n_points], words[n_points:]
+        if flags & FLAG_POINTS_DELTA:
+            a, r, z = a + self._prev[0], r + self._prev[1], classes ^ self._prev[3]
+        else:
+            a, r, z = _undo_neighbor_delta(a), _undo_neighbor_delta(r), classes.copy()
+        if flags & FLAG_BOUNDARY_DELTA:
+            b = b + self._prev[2]
+        else:
+            b = _undo_neighbor_delta(b)
+
+        self._prev = (a, r, b, z)
+        self._sequence = sequence
+        return StreamFrame(sequence, zoom / 1000.0, a / ANGLE_SCALE - np.pi, r / 1000.0, z, b / 1000.0)
+
+
+class StreamPublisher:
+    """
+    Sends each frame to every live subscriber over a non-blocking UDP socket.
+
+    publish() never waits: incoming hellos are drained without blocking, and
+    a send that would block is counted as dropped for that subscriber. With
+    no subscribers nothing is encoded at all.
+    """
+
+    def __init__(self, port=STREAM_PORT, bind='0.0.0.0', keyframe_interval=KEYFRAME_INTERVAL):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((bind, port))
+        self.sock.setblocking(False)
+        self.encoder = FrameEncoder(keyframe_interval)
+        self.subscribers = {}  # address -> last time heard from
+        self.sent = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+
+    def _poll(self):
+        now = time.monotonic()
+        while True:
+            try:
+                message, address = self.sock.recvfrom(64)
+            except (BlockingIOError, ConnectionRefusedError):
+                break
+            if address not in self.subscribers or message == REQUEST_KEYFRAME:
+                self.encoder.force_keyframe()
+            self.subscribers[address] = now
+        for address, seen in list(self.subscribers.items()):
+            if now - seen > SUBSCRIBER_TIMEOUT:
+                del self.subscribers[address]
+
+    def publish(self, angles, ranges, zones, boundary, zoom):
+        self._poll()
+        if not self.subscribers:
+            return None
+        message = self.encoder.encode(angles, ranges, zones, boundary, zoom)
+        for address in self.subscribers:
+            try:
+                self.sock.sendto(message, address)
+                self.sent += 1
+                self.bytes_sent += len(message)
+            except (BlockingIOError, ConnectionRefusedError):
+                self.dropped += 1
+        return message
+
+    def close(self):
+        self.sock.close()
+
+
+class StreamClient:
+    """Subscribes to a publisher and decodes its frames."""
+
+    def __init__(self, host, port=STREAM_PORT):
+        self.address = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.decoder = FrameDecoder()
+        self.received = 0
+        self.skipped = 0
+        self._last_hello = -np.inf
+        self._expected = None
+
+    def _hello(self, message=HELLO):
+        self.sock.sendto(message, self.address)
+        self._last_hello = time.monotonic()
+
+    def receive(self, timeout=1.0):
+        """Next decodable frame, or None on timeout."""
+        deadline = time.monotonic() + timeout
+        while True:
+            if time.monotonic() - self._last_hello >= HELLO_INTERVAL:
+                self._hello()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self.sock.settimeout(min(remaining, HELLO_INTERVAL))
+            try:
+                message = self.sock.recv(65535)
+            except socket.timeout:
+                continue
+            except ConnectionRefusedError:
+                continue  # publisher not up yet
+            self.received += 1
+            frame = self.decoder.decode(message)
+            if frame is None:
+                self.skipped += 1
+                if self._expected is not None:
+                    self._hello(REQUEST_KEYFRAME)
+                    self._expected = None
+                continue
+            self._expected = frame.sequence + 1
+            return frame
+
+    def close(self):
+        self.sock.close()
+
+
+class ChairProcessor:
+    """The moving viewer's per-scan processing, producing a frame instead of a plot."""
+
+    def __init__(self):
+        from dynamic_obstacles import DynamicObstacleClassifier
+        from frame_buffers import FrameBufferPool
+        from scan_matching import ScanMatcher
+
+        self.buffers = FrameBufferPool(WHEELCHAIR_WIDTH / 2.0, WHEELCHAIR_LENGTH / 2.0, DANGER_ZONE, CAUTION_ZONE)
+        self.matcher = ScanMatcher(max_range=RMAX_ABSOLUTE)
+        self.classifier = DynamicObstacleClassifier()
+        self.current_rmax = RMAX_ABSOLUTE
+
+    def process(self, angle, ran):
+        """
+        (angles, ranges, zones, boundary, zoom) for one scan. Phantom returns
+        rejected by the outlier filter are left out of the points but count as
+        no return in the boundary. Arrays are pool views when nothing was
+        rejected.
+        """
+        motion = self.matcher.match(angle, ran)
+        dynamic = self.classifier.update(angle, ran, motion if motion.converged else None)
+        angles, ranges = self.buffers.load(angle, ran)
+        rejected = self.buffers.reject_outliers()
+        if len(ranges) > 0:
+            target_rmax = min(max(ranges.max() * SCALE_MARGIN, RMIN_DISPLAY), RMAX_ABSOLUTE)
+            self.current_rmax = self.current_rmax * (1 - SMOOTHING_FACTOR) + target_rmax * SMOOTHING_FACTOR
+        else:
+            self.current_rmax = RMAX_ABSOLUTE
+        self.buffers.clean(self.current_rmax)
+        boundary = self.buffers.boundary(self.current_rmax)
+        self.buffers.colors(ranges)
+        zones = zone_classes(self.buffers.distances[:len(ranges)], DANGER_ZONE, CAUTION_ZONE, dynamic)
+        if rejected:
+            shown = ~self.buffers.rejected
+            angles, ranges, zones = angles[shown], ranges[shown], zones[shown]
+        return angles, ranges, zones, boundary, self.current_rmax
+
+
+def run_publisher(port):
+    """Headless chair side: scan, process, publish. No plotting."""
+    import ydlidar
+
+    ydlidar.os_init()
+    ports = ydlidar.lidarPortList()
+    device = "/dev/ydlidar"
+    for key, value in ports.items():
+        device = value
+        print(f"Using port: {device}")
+
+    laser = ydlidar.CYdLidar()
+    laser.setlidaropt(ydlidar.LidarPropSerialPort, device)
+    laser.setlidaropt(ydlidar.LidarPropSerialBaudrate, 115200)
+    laser.setlidaropt(ydlidar.LidarPropLidarType, ydlidar.TYPE_TRIANGLE)
+    laser.setlidaropt(ydlidar.LidarPropDeviceType, ydlidar.YDLIDAR_TYPE_SERIAL)
+    laser.setlidaropt(ydlidar.LidarPropScanFrequency, 12.0)
+    laser.setlidaropt(ydlidar.LidarPropSampleRate, 5)
+    laser.setlidaropt(ydlidar.LidarPropSingleChannel, True)
+    laser.setlidaropt(ydlidar.LidarPropMaxAngle, 180.0)
+    laser.setlidaropt(ydlidar.LidarPropMinAngle, -180.0)
+    laser.setlidaropt(ydlidar.LidarPropMaxRange, RMAX_ABSOLUTE)
+    laser.setlidaropt(ydlidar.LidarPropMinRange, 0.08)
+    laser.setlidaropt(ydlidar.LidarPropIntenstiy, False)
+
+    publisher = StreamPublisher(port)
+    processor = ChairProcessor()
+    print(f"Publishing frames on UDP port {port} - Ctrl+C to stop")
+    profiling = ProfilingHook('frame_stream')  # kill -USR1 <pid> to profile the scan loop
+    ret = laser.initialize()
+    if ret:
+        ret = laser.turnOn()
+        scan = ydlidar.LaserScan()
+        try:
+            while ret and ydlidar.os_isOk():
+                if laser.doProcessSimple(scan):
+                    angle = [p.angle for p in scan.points]
+                    ran = [p.range for p in scan.points]
+                    publisher.publish(*processor.process(angle, ran))
+                else:
+                    print("Failed to get Lidar Data")
+        except KeyboardInterrupt:
+            pass
+        laser.turnOff()
+    else:
+        print("✗ Failed to initialize LiDAR!")
+    laser.disconnecting()
+    print(f"Sent {publisher.sent} frames ({publisher.bytes_sent / 1024:.0f} KiB), dropped {publisher.dropped}")
+    publisher.close()
+
+
+def run_viewer(host, port):
+    """Display side: render frames from the chair with persistent artists."""
+    import matplotlib.animation as animation
+    import matplotlib.pyplot as plt
+    from matplotlib.patches import Rectangle
+    from boundary_shading import BoundaryShading
+
+    client = StreamClient(host, port)
+    fig = plt.figure(figsize=(10, 10), facecolor='#0a1929')
+    fig.canvas.manager.set_window_title(f'LiDAR Thin Client - {host}:{port}')
+    polar = plt.subplot(polar=True)
+    polar.set_theta_zero_location('N')
+    polar.set_theta_direction(-1)
+    polar.set_facecolor('#0a1929')
+    polar.grid(True, color='white', alpha=0.3, linestyle='--', linewidth=0.5)
+    polar.tick_params(colors='white', labelsize=9)
+    polar.spines['polar'].set_color('white')
+
+    shading = None
+    points = polar.scatter([], [], s=10, alpha=0.9, edgecolors='white', linewidth=0.3, zorder=6)
+    polar.add_patch(Rectangle((-WHEELCHAIR_WIDTH / 2.0, -WHEELCHAIR_LENGTH / 2.0), WHEELCHAIR_WIDTH,
+                              WHEELCHAIR_LENGTH, transform=polar.transData._b, facecolor='lightgray',
+                              edgecolor='gray', alpha=0.3, linewidth=2, zorder=5))
+    title = polar.set_title('Waiting for frames...', pad=25, fontsize=13, fontweight='bold', color='white')
+
+    def animate(num):
+        nonlocal shading
+        frame = client.receive(timeout=0.05)
+        if frame is None:
+            return
+        if shading is None or shading.n_grid != len(frame.boundary):
+            if shading is not None:
+                shading.patch.remove()
+            shading = BoundaryShading(len(frame.boundary), color='black', alpha=0.35, zorder=2)
+            polar.add_patch(shading.patch)
+        shading.update(frame.boundary, frame.zoom)
+        points.set_offsets(np.column_stack([frame.angles, frame.ranges]))
+        points.set_facecolors(ZONE_COLORS[frame.zones])
+        polar.set_ylim(0, frame.zoom)
+        title.set_text(f'Thin Client (Zoom: {frame.zoom:.1f}m) | Frame #{frame.sequence} | '
+                       f'Points: {len(frame.angles)} | Skipped: {client.skipped}')
+
+    ani = animation.FuncAnimation(fig, animate, interval=10, cache_frame_data=False)  # noqa: F841
+    plt.show()
+    client.close()
+
+
+def _benchmark(n_scans=240):
+    """
+    Encoding throughput, message size, loopback round trip and a subscriber that never reads.
+
+    Fails if decoded frames differ from the input by more than the
+    quantization step, a frame exceeds FRAME_SIZE_BUDGET, the loopback
+    client misses a frame, or the 95th percentile publish() time exceeds
+    PUBLISH_BUDGET while a subscriber is stalled.
+    """
+    from synthetic_scans import TOF_POINTS, TRIANGLE_POINTS, default_room, generate_scan, random_walk_poses
+
+    rng = np.random.default_rng(0)
+    room = default_room()
+    scenarios = {'parked': np.zeros((n_scans, 3)),
+                 'driving': random_walk_poses(n_scans, rng=rng, bounds=1.0)}
+    for n_points in (TRIANGLE_POINTS, TOF_POINTS):
+        print(f"--- {n_points} points/scan ---")
+        for name, poses in scenarios.items():
+            # The device does not start every revolution at the same angle or
+            # report the same number of points; mimic both
+            frames = []
+            processor = ChairProcessor()
+            for pose in poses:
+                angles, ranges = generate_scan(pose, room, n_points=n_points, rng=rng)
+                angles = (angles + rng.uniform(0, 2 * np.pi / n_points) + np.pi) % (2 * np.pi) - np.pi
+                keep = np.sort(rng.permutation(n_points)[:n_points - rng.integers(0, 2)])
+                frames.append(tuple(np.copy(x) if isinstance(x, np.ndarray) else x
+                                    for x in processor.process(angles[keep], ranges[keep])))
+
+            encoder = FrameEncoder()
+            start = time.perf_counter()
+            messages = [encoder.encode(*frame) for frame in frames]
+            encode_ms = (time.perf_counter() - start) / len(frames) * 1e3
+            raw = np.mean([f[0].nbytes + f[1].nbytes + f[2].nbytes + f[3].nbytes for f in frames])
+            sizes = np.array([len(m) for m in messages])
+            delta = np.mean([m[3] != 0 for m in messages])
+
+            decoder = FrameDecoder()
+            start = time.perf_counter()
+            decoded = [decoder.decode(m) for m in messages]
+            decode_ms = (time.perf_counter() - start) / len(frames) * 1e3
+            worst = max(np.abs(d.ranges - f[1]).max() for d, f in zip(decoded, frames))
+            worst_angle = max(np.abs((d.angles - f[0] + np.pi) % (2 * np.pi) - np.pi).max()
+                              for d, f in zip(decoded, frames))
+            worst_boundary = max(np.abs(d.boundary - f[3]).max() for d, f in zip(decoded, frames))
+            assert all(np.array_equal(d.zones, f[2]) for d, f in zip(decoded, frames))
+            assert worst <= 0.0005 + 1e-9, f"range error {worst * 1000:.3f} mm exceeds the 0.5 mm step"
+            assert worst_angle <= np.pi / 65536 + 1e-9, f"angle error {worst_angle:.2e} rad exceeds half a step"
+            assert worst_boundary <= 0.0005 + 1e-9, f"boundary error {worst_boundary * 1000:.3f} mm exceeds 0.5 mm"
+            assert all(abs(d.zoom - f[4]) <= 0.0005 + 1e-9 for d, f in zip(decoded, frames))
+            assert sizes.max() <= FRAME_SIZE_BUDGET, \
+                f"{name}, {n_points} points: {sizes.max()} B frame, budget {FRAME_SIZE_BUDGET} B"
+
+            print(f"{name:8s} encode {encode_ms:.3f} ms ({1000 / encode_ms:.0f} frames/s), decode {decode_ms:.3f} ms | "
+                  f"{sizes.mean():.0f} B/frame, {raw / sizes.mean():.1f}x smaller than float arrays, "
+                  f"{sizes.mean() * 12 / 1024:.1f} KiB/s at 12 Hz | delta-coded {delta * 100:.0f}% | "
+                  f"range error <= {worst * 1000:.2f} mm")
+
+    # Loopback: a real client over UDP, then a subscriber that never reads
+    publisher = StreamPublisher(port=0, bind='127.0.0.1')
+    port = publisher.sock.getsockname()[1]
+    client = StreamClient('127.0.0.1', port)
+    client._hello()
+    time.sleep(0.05)
+    received = []
+    for frame in frames[:60]:
+        publisher.publish(*frame)
+        got = client.receive(timeout=0.5)
+        received.append(got is not None and np.array_equal(got.zones, frame[2])
+                        and np.abs(got.ranges - frame[1]).max() <= 0.0005 + 1e-9)
+    print(f"Loopback client: {sum(received)}/{len(received)} frames received intact")
+    assert all(received), f"loopback client received {sum(received)}/{len(received)} frames intact"
+
+    stalled = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    stalled.sendto(HELLO, ('127.0.0.1', port))
+    time.sleep(0.05)
+    times = []
+    for frame in frames * 2:
+        start = time.perf_counter()
+        publisher.publish(*frame)
+        times.append(time.perf_counter() - start)
+        client.receive(timeout=0.5)
+    times = np.array(times) * 1e3
+    p95 = np.percentile(times, 95)
+    print(f"With a stalled subscriber: publish p50 {np.percentile(times, 50):.3f} ms, p95 {p95:.3f} ms, "
+          f"max {times.max():.3f} ms, healthy client skipped {client.skipped} deltas")
+    # One scheduler hiccup can make any single publish slow; a blocking send shows in the p95
+    assert p95 <= PUBLISH_BUDGET * 1e3, \
+        f"publish p95 {p95:.3f} ms beside a stalled subscriber, budget {PUBLISH_BUDGET * 1e3:.0f} ms"
+    stalled.close()
+    client.close()
+    publisher.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream processed LiDAR frames to thin-client displays")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--publish', action='store_true', help="run on the chair: scan and publish, no plotting")
+    mode.add_argument('--view', metavar='HOST', help="run on the display: render frames from HOST")
+    parser.add_argument('--port', type=int, default=STREAM_PORT)
+    args = parser.parse_args()
+
+    if args.publish:
+        run_publisher(args.port)
+    elif args.view:
+        run_viewer(args.view, args.port)
+    else:
+        _benchmark()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Latency Trace - how old the scan on screen is
+Every scan gets a trace ID when doProcessSimple() returns; the loop marks
+the end of processing, drawing and the flush to the display against that
+ID, and the end-to-end latency is measured from scan.stamp (the start of
+the revolution, on the system clock) to the flush. Timestamps are
+time.monotonic_ns() values written into a preallocated ring, so tracing a
+long session costs the same few microseconds per scan as a short one and
+no memory beyond the ring.
+
+Press F10 in the plot window, or send SIGUSR2 to the process
+(kill -USR2 <pid>), to write the ring to traces/<name>-<timestamp>.json in
+Chrome trace-event format (open in chrome://tracing or ui.perfetto.dev).
+percentile() gives the live end-to-end latency over the last scans.
+
+Run directly to trace a paced simulated session on Agg.
+"""
+import json
+import os
+import signal
+import threading
+import time
+
+import numpy as np
+
+TRACE_DIR = 'traces'     # Relative to where the script is started
+TRACE_KEY = 'f10'        # Not bound by matplotlib's default keymap
+TRACE_CAPACITY = 4096    # Scans kept in the ring (about 5.5 min at 12 Hz)
+LATENCY_WINDOW = 120     # Scans behind the live percentiles (10 s at 12 Hz)
+STAMP_TOLERANCE = 10.0   # Seconds; older (or future) scan stamps are not on our clock
+
+# Marks recorded per scan; each stage runs from the previous mark to its own
+STAMP, ACQUIRED, PROCESSED, DRAWN, FLUSHED = range(5)
+STAGES = {'scan': ACQUIRED, 'process': PROCESSED, 'draw': DRAWN, 'flush': FLUSHED}
+
+
+def flush_display(canvas):
+    """
+    Push blitted pixels to the screen before the flush mark.
+
+    Tk repaints the canvas from idle callbacks; update_idletasks() runs
+    those without dispatching timers, so animate() is not re-entered the
+    way flush_events() could. Other backends paint on their next event
+    loop pass, and Agg has no display.
+    """
+    widget = getattr(canvas, 'get_tk_widget', None)
+    if widget is not None:
+        widget().update_idletasks()
+
+
+class LatencyTrace:
+    """
+    Ring of per-scan timestamps from scan.stamp to the display flush.
+
+    begin() after doProcessSimple() returns a trace ID, mark(trace, stage)
+    records the end of 'process' and 'draw', end(trace) records the flush
+    and returns the end-to-end latency in seconds. Installs a SIGUSR2
+    handler where the platform has one and, given a figure, a key handler
+    for TRACE_KEY that both call export().
+    """
+
+    def __init__(self, name, fig=None, signum=getattr(signal, 'SIGUSR2', None), key=TRACE_KEY,
+                 directory=TRACE_DIR, capacity=TRACE_CAPACITY, window=LATENCY_WINDOW):
+        self.name = name
+        self.key = key
+        self.directory = directory
+        self.capacity = capacity
+        self._ids = np.full(capacity, -1, dtype=np.int64)
+        self._marks = np.zeros((capacity, len(STAGES) + 1), dtype=np.int64)  # monotonic ns, 0 = not reached
+        self._latency = np.zeros(window)  # Seconds, last `window` completed scans
+        self._from_stamp = np.zeros(window, dtype=bool)  # Whether each of them was measured from scan.stamp
+        self.started = 0
+        self.completed = 0
+        self.bad_stamps = 0
+        # scan.stamp is on the system clock; the ring is on the monotonic one
+        self._wall_offset = time.time_ns() - time.monotonic_ns()
+
+        triggers = []
+        if signum is not None and threading.current_thread() is threading.main_thread():
+            signal.signal(signum, lambda signo, frame: self.export())
+            triggers.append(f"kill -{signal.Signals(signum).name[3:]} {os.getpid()}")
+        if fig is not None:
+            fig.canvas.mpl_connect('key_press_event', self._on_key)
+            triggers.insert(0, f"press {key.upper()}")
+        if triggers:
+            print(f"Latency trace: {' or '.join(triggers)} to export")
+
+    def _on_key(self, event):
+        if event.key == self.key:
+            self.export()
+
+    def begin(self, stamp_ns=0):
+        """Start a trace for a scan just acquired; stamp_ns is its scan.stamp (0 = unknown)."""
+        now = time.monotonic_ns()
+        trace = self.started
+        self.started += 1
+        slot = trace % self.capacity
+        marks = self._marks[slot]
+        marks[:] = 0
+        marks[ACQUIRED] = now
+        if stamp_ns:
+            stamp = stamp_ns - self._wall_offset
+            if -1e6 < now - stamp < STAMP_TOLERANCE * 1e9:
+                marks[STAMP] = min(stamp, now)
+            else:
+                if not self.bad_stamps:
+                    print("Latency trace: scan.stamp is not on the system clock, measuring from acquisition")
+                self.bad_stamps += 1
+        self._ids[slot] = trace
+        return trace
+
+    def mark(self, trace, stage):
+        """Record the end of stage ('process' or 'draw') for trace."""
+        slot = trace % self.capacity
+        if self._ids[slot] == trace:
+            self._marks[slot, STAGES[stage]] = time.monotonic_ns()
+
+    def end(self, trace):
+        """Record the flush for trace; returns its end-to-end latency in seconds (None if overwritten)."""
+        now = time.monotonic_ns()
+        slot = trace % self.capacity
+        if self._ids[slot] != trace:
+            return None
+        marks = self._marks[slot]
+        marks[FLUSHED] = now
+        latency = (now - (marks[STAMP] or marks[ACQUIRED])) * 1e-9
+        self._latency[self.completed % len(self._latency)] = latency
+        self._from_stamp[self.completed % len(self._latency)] = marks[STAMP] != 0
+        self.completed += 1
+        return latency
+
+    def percentile(self, q):
+        """q-th percentile of the end-to-end latency over the last completed scans, in seconds (nan if none)."""
+        n = min(self.completed, len(self._latency))
+        if n == 0:
+            return float('nan')
+        return float(np.percentile(self._latency[:n], q))
+
+    def events(self):
+        """The ring as a list of Chrome trace events, oldest scan first."""
+        done = np.flatnonzero((self._ids >= 0) & (self._marks[:, FLUSHED] > 0))
+        done = done[np.argsort(self._ids[done])]
+        if len(done) == 0:
+            return []
+        marks = self._marks[done]
+        origin = marks[marks > 0].min()
+        times = (marks - origin) / 1e3  # µs, as the format expects
+
+        pid = os.getpid()
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': self.name}},
+                  {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': 1, 'args': {'name': 'LiDAR revolution'}},
+                  {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': 2, 'args': {'name': 'Main loop'}}]
+        for row, trace, slot_marks in zip(times, self._ids[done].tolist(), marks):
+            args = {'trace_id': trace}
+            for stage, end in STAGES.items():
+                begin = end - 1
+                if slot_marks[begin] == 0 or slot_marks[end] == 0:
+                    continue
+                events.append({'name': stage, 'cat': 'scan', 'ph': 'X', 'pid': pid,
+                               'tid': 1 if stage == 'scan' else 2, 'ts': round(row[begin], 3),
+                               'dur': round(row[end] - row[begin], 3), 'args': args})
+            first = STAMP if slot_marks[STAMP] else ACQUIRED
+            events.append({'name': 'latency', 'ph': 'C', 'pid': pid, 'ts': round(row[FLUSHED], 3),
+                           'args': {'end-to-end ms': round((row[FLUSHED] - row[first]) / 1e3, 3)}})
+        return events
+
+    def export(self, path=None):
+        """Write the ring as Chrome trace-event JSON; returns the path."""
+        if path is None:
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = time.strftime('%Y%m%d-%H%M%S')
+            path = os.path.join(self.directory, f"{self.name}-{stamp}.json")
+        events = self.events()
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                       'otherData': {'summary': self.summary()}}, f)
+        print(f"Latency trace: {sum(e['ph'] == 'C' for e in events)} scans -> {path}")
+        return path
+
+    def summary(self):
+        if self.completed == 0:
+            return "no scans traced"
+        p50, p95, p99 = (self.percentile(q) * 1e3 for q in (50, 95, 99))
+        n = min(self.completed, len(self._latency))
+        stamped = int(np.count_nonzero(self._from_stamp[:n]))
+        if stamped == n:
+            origin = "scan.stamp"
+        elif stamped == 0:
+            origin = "acquisition"
+        else:
+            origin = f"scan.stamp ({n - stamped} of {n} from acquisition)"
+        return (f"{self.completed} scans, end-to-end from {origin}: p50 {p50:.0f} ms | p95 {p95:.0f} ms | "
+                f"p99 {p99:.0f} ms (last {n})")
+
+
+def _demo(seconds=3.0):
+    """Paced simulated scans through an Agg frame loop, traced and exported."""
+    import tempfile
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from frame_buffers import FrameBufferPool
+    from simulated_lidar import CYdLidar, LaserScan
+
+    laser = CYdLidar()
+    laser.initialize()
+    laser.turnOn()
+    scan = LaserScan()
+    pool = FrameBufferPool(0.25, 0.30, 0.20, 0.70)
+
+    fig = plt.figure(figsize=(10, 10))
+    ax = plt.subplot(polar=True)
+    ax.set_ylim(0, 8)
+    points = ax.scatter([], [], s=10, animated=True)
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(fig.bbox)
+
+    with tempfile.TemporaryDirectory() as directory:
+        trace = LatencyTrace('demo', directory=directory)
+        end = time.monotonic() + seconds
+        while time.monotonic() < end and laser.doProcessSimple(scan):
+            scan_id = trace.begin(scan.stamp)
+            angles, ranges = pool.load([p.angle for p in scan.points], [p.range for p in scan.points])
+            clean = pool.clean(8.0)
+            colors = pool.colors(clean)
+            trace.mark(scan_id, 'process')
+            fig.canvas.restore_region(background)
+            points.set_offsets(np.column_stack([angles, clean]))
+            points.set_facecolors(colors)
+            ax.draw_artist(points)
+            trace.mark(scan_id, 'draw')
+            fig.canvas.blit(fig.bbox)
+            flush_display(fig.canvas)
+            trace.end(scan_id)
+        laser.turnOff()
+        print(f"Latency trace: {trace.summary()}")
+
+        os.kill(os.getpid(), signal.SIGUSR2)
+        path = os.path.join(directory, os.listdir(directory)[0])
+        with open(path) as f:
+            events = json.load(f)['traceEvents']
+        durations = {stage: [e['dur'] / 1e3 for e in events if e['name'] == stage] for stage in STAGES}
+        print("Stage medians: " + ' | '.join(f"{stage} {np.median(d):.1f} ms" for stage, d in durations.items()))
+    plt.close(fig)
+
+    # Cost of tracing itself: one scan's begin, two marks and end
+    trace = LatencyTrace('overhead', signum=None)
+    n = 20000
+    start = time.perf_counter()
+    for _ in range(n):
+        scan_id = trace.begin(time.time_ns())
+        trace.mark(scan_id, 'process')
+        trace.mark(scan_id, 'draw')
+        trace.end(scan_id)
+    print(f"Tracing overhead: {(time.perf_counter() - start) / n * 1e6:.1f} µs/scan | "
+          f"ring {(trace._ids.nbytes + trace._marks.nbytes) / 1024:.0f} KiB for {trace.capacity} scans")
+
+    # The summary names the origin the windowed percentiles were measured from
+    trace = LatencyTrace('origin', signum=None, window=4)
+    for stamp in (time.time_ns(), 1, time.time_ns(), time.time_ns(), time.time_ns()):
+        trace.end(trace.begin(stamp))
+    assert trace.bad_stamps == 1 and 'end-to-end from scan.stamp (1 of 4 from acquisition)' in trace.summary()
+    trace.end(trace.begin(time.time_ns()))
+    assert 'end-to-end from scan.stamp:' in trace.summary(), trace.summary()
+    trace.end(trace.begin())
+    assert 'end-to-end from scan.stamp (1 of 4 from acquisition)' in trace.summary(), trace.summary()
+
+
+if __name__ == "__main__":
+    _demo()
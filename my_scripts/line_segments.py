@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Line Segments - indoor scans compressed to wall segments plus leftover points
+Split-and-merge over an angle-ordered scan: the scan is cut into runs at
+range gaps, every run is split at its point farthest from the chord
+between its ends until all points lie within the error bound, then
+neighbouring pieces that still fit one line are merged again. Each step
+works on all pieces of the scan at once (grouped reductions over the
+point array), so the Python loop runs once per split level, not per point.
+
+Segments come out as [x1, y1, x2, y2] rows in the sensor frame, the same
+layout as the synthetic_scans worlds, so they can be ray-cast, drawn as
+one LineCollection or checked against the footprint directly. Pieces
+with too few points to be a wall are kept as leftover points.
+
+Run directly for compression, fidelity and timing on generated corridor
+and room scans.
+"""
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from scan_matching import polar_to_points
+from spatial_hash import footprint_clearance_many
+
+ScanSegments = namedtuple('ScanSegments', ['segments', 'counts', 'errors', 'leftover'])
+
+TOLERANCE = 0.03    # Meters; max distance from a point to its segment's line (3x the sensor noise)
+MIN_POINTS = 5      # Fewer points than this stay leftover points
+MAX_GAP = 0.3       # Meters between consecutive points that starts a new run
+MAX_SPLITS = 32     # Split levels at most; each halves the pieces still over the bound
+
+
+def _groups(s, e):
+    """Point index, owning piece and group start offsets for inclusive pieces [s, e]."""
+    lengths = e - s + 1
+    offsets = np.zeros(len(s), dtype=np.intp)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+    owner = np.repeat(np.arange(len(s)), lengths)
+    index = s[owner] + np.arange(len(owner)) - offsets[owner]
+    return index, owner, offsets
+
+
+def _farthest_from_chord(points, s, e):
+    """Per piece: largest point distance from the line through its end points, and where it is."""
+    index, owner, offsets = _groups(s, e)
+    a = points[s][owner]
+    chord = points[e][owner] - a
+    rel = points[index] - a
+    length = np.hypot(chord[:, 0], chord[:, 1])
+    cross = np.abs(chord[:, 0] * rel[:, 1] - chord[:, 1] * rel[:, 0])
+    distance = np.where(length > 1e-9, cross / np.maximum(length, 1e-9), np.hypot(rel[:, 0], rel[:, 1]))
+    worst = np.maximum.reduceat(distance, offsets)
+    at = np.flatnonzero(distance == worst[owner])
+    _, first = np.unique(owner[at], return_index=True)
+    return worst, index[at[first]]
+
+
+def _fit_lines(points, s, e):
+    """Per piece: total-least-squares centroid, unit direction and largest residual."""
+    index, owner, offsets = _groups(s, e)
+    p = points[index]
+    n = (e - s + 1).astype(float)
+    centroid = np.column_stack([np.add.reduceat(p[:, 0], offsets), np.add.reduceat(p[:, 1], offsets)]) / n[:, None]
+    d = p - centroid[owner]
+    sxx = np.add.reduceat(d[:, 0] * d[:, 0], offsets)
+    syy = np.add.reduceat(d[:, 1] * d[:, 1], offsets)
+    sxy = np.add.reduceat(d[:, 0] * d[:, 1], offsets)
+    phi = 0.5 * np.arctan2(2 * sxy, sxx - syy)
+    direction = np.column_stack([np.cos(phi), np.sin(phi)])
+    residual = np.abs(d[:, 1] * direction[owner, 0] - d[:, 0] * direction[owner, 1])
+    return centroid, direction, np.maximum.reduceat(residual, offsets)
+
+
+def extract_segments(angles, ranges, tolerance=TOLERANCE, min_points=MIN_POINTS, max_gap=MAX_GAP,
+                     min_range=0.08, max_range=8.0):
+    """
+    Compress one scan to line segments plus leftover points.
+
+    Every point of a segment lies within tolerance of the segment's line;
+    errors holds each segment's largest such distance and counts its
+    number of points. Range-0 and out-of-range returns are dropped.
+    """
+    points = polar_to_points(angles, ranges, min_range, max_range)
+    empty = ScanSegments(np.empty((0, 4)), np.empty(0, dtype=np.intp), np.empty(0), points)
+    if len(points) < min_points:
+        return empty
+
+    # Runs of consecutive points without a gap; start the scan at the largest
+    # gap so a wall behind the chair is not cut in two at -pi
+    step = np.hypot(*(np.roll(points, -1, axis=0) - points).T)
+    points = np.roll(points, -(int(step.argmax()) + 1), axis=0)
+    step = np.roll(step, -(int(step.argmax()) + 1))
+    breaks = np.flatnonzero(step[:-1] > max_gap)
+    s = np.concatenate([[0], breaks + 1])
+    e = np.concatenate([breaks, [len(points) - 1]])
+    keep = e - s + 1 >= min_points
+    s, e = s[keep], e[keep]
+
+    # Split: every piece over the bound at once, at its farthest point
+    for _ in range(MAX_SPLITS):
+        if len(s) == 0:
+            break
+        worst, at = _farthest_from_chord(points, s, e)
+        split = worst > tolerance
+        if not split.any():
+            break
+        s = np.concatenate([s[~split], s[split], at[split]])
+        e = np.concatenate([e[~split], at[split], e[split]])
+        order = np.argsort(s)
+        s, e = s[order], e[order]
+    keep = e - s + 1 >= min_points
+    s, e = s[keep], e[keep]
+
+    # Merge: neighbours sharing a split point that fit one line together
+    while len(s) > 1:
+        joined = np.flatnonzero(e[:-1] == s[1:])
+        if len(joined) == 0:
+            break
+        _, _, residual = _fit_lines(points, s[joined], e[joined + 1])
+        fits = joined[residual <= tolerance]
+        merged = np.zeros(len(s), dtype=bool)
+        for i in fits.tolist():  # pairs must not overlap; few pieces per scan
+            if not merged[i] and not merged[i + 1]:
+                merged[i] = merged[i + 1] = True
+                e[i] = e[i + 1]
+                s[i + 1] = -1
+        if not merged.any():
+            break
+        keep = s >= 0
+        s, e = s[keep], e[keep]
+    if len(s) == 0:
+        return empty
+
+    # Segments: the fitted line, or the chord where the fit is worse than the
+    # bound the split guaranteed, over the extent of the piece's points on it
+    centroid, direction, errors = _fit_lines(points, s, e)
+    worst, _ = _farthest_from_chord(points, s, e)
+    chord = errors > worst
+    centroid[chord] = points[s[chord]]
+    span = points[e[chord]] - points[s[chord]]
+    direction[chord] = span / np.maximum(np.hypot(span[:, 0], span[:, 1]), 1e-9)[:, None]
+    errors = np.minimum(errors, worst)
+    index, owner, offsets = _groups(s, e)
+    t = ((points[index] - centroid[owner]) * direction[owner]).sum(axis=1)
+    t0, t1 = np.minimum.reduceat(t, offsets), np.maximum.reduceat(t, offsets)
+    backwards = t[offsets] > t[offsets + e - s]  # keep segments running in scan order
+    t0[backwards], t1[backwards] = t1[backwards], t0[backwards]
+    segments = np.column_stack([centroid + t0[:, None] * direction, centroid + t1[:, None] * direction])
+
+    covered = np.zeros(len(points), dtype=bool)
+    covered[index] = True
+    return ScanSegments(segments, e - s + 1, errors, points[~covered])
+
+
+def compression_ratio(n_points, result):
+    """Numbers stored for the raw scan (angle, range per point) over the segments plus leftover points."""
+    return 2 * n_points / max(4 * len(result.segments) + 2 * len(result.leftover), 1)
+
+
+def point_to_segments(points, segments):
+    """Distance from each point (N, 2) to the closest of the segments (K, 4); inf if there are none."""
+    if len(segments) == 0:
+        return np.full(len(points), np.inf)
+    a = segments[None, :, 0:2]
+    ab = segments[None, :, 2:4] - a
+    ap = points[:, None, :] - a
+    t = np.clip((ap * ab).sum(axis=2) / np.maximum((ab * ab).sum(axis=2), 1e-12), 0.0, 1.0)
+    closest = ap - t[..., None] * ab
+    return np.hypot(closest[..., 0], closest[..., 1]).min(axis=1)
+
+
+def fidelity(angles, ranges, result, min_range=0.08, max_range=8.0):
+    """
+    (RMS, max) distance in meters from the raw scan's points to what
+    replaces them: the closest segment, or 0 for a leftover point.
+    """
+    points = polar_to_points(angles, ranges, min_range, max_range)
+    distance = point_to_segments(points, result.segments)
+    if len(result.leftover):
+        leftover = {tuple(p) for p in result.leftover.tolist()}
+        distance[[tuple(p) in leftover for p in points.tolist()]] = 0.0
+    if len(distance) == 0:
+        return 0.0, 0.0
+    return float(np.sqrt(np.mean(distance ** 2))), float(distance.max())
+
+
+def segment_clearance(segments, poses, half_x, half_y, search_radius=1.0):
+    """
+    Distance from the footprint at each (x, y, theta) pose to the closest segment.
+
+    Same conventions as spatial_hash.footprint_clearance(): 0 where a
+    segment crosses the footprint, inf beyond search_radius.
+    """
+    poses = np.asarray(poses, dtype=float).reshape(-1, 3)
+    clearance = np.full(len(poses), np.inf)
+    if len(segments) == 0:
+        return clearance
+
+    # Segment end points in each pose's footprint frame (P, K, 2)
+    c = np.cos(poses[:, 2])[:, None]
+    s = np.sin(poses[:, 2])[:, None]
+    ends = []
+    for x, y in ((segments[:, 0], segments[:, 1]), (segments[:, 2], segments[:, 3])):
+        dx = x[None, :] - poses[:, 0:1]
+        dy = y[None, :] - poses[:, 1:2]
+        ends.append(np.stack([c * dx + s * dy, -s * dx + c * dy], axis=-1))
+    a, b = ends
+    half = np.array([half_x, half_y])
+
+    # Crossing: the part of the segment inside the box is not empty (Liang-Barsky)
+    d = b - a
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1 = (-half - a) / d
+        t2 = (half - a) / d
+    inside = np.abs(a) <= half
+    low = np.where(d == 0, np.where(inside, -np.inf, np.inf), np.minimum(t1, t2))
+    high = np.where(d == 0, np.where(inside, np.inf, -np.inf), np.maximum(t1, t2))
+    crosses = np.maximum(low.max(axis=-1), 0.0) <= np.minimum(high.min(axis=-1), 1.0)
+
+    # Otherwise the closest pair involves a segment end or a footprint corner
+    def box_distance(p):
+        gap = np.maximum(np.abs(p) - half, 0.0)
+        return np.hypot(gap[..., 0], gap[..., 1])
+
+    distance = np.minimum(box_distance(a), box_distance(b))
+    length2 = np.maximum((d * d).sum(axis=-1), 1e-12)
+    for corner in ((-half_x, -half_y), (half_x, -half_y), (half_x, half_y), (-half_x, half_y)):
+        ap = np.asarray(corner) - a
+        t = np.clip((ap * d).sum(axis=-1) / length2, 0.0, 1.0)
+        closest = ap - t[..., None] * d
+        distance = np.minimum(distance, np.hypot(closest[..., 0], closest[..., 1]))
+    distance[crosses] = 0.0
+    clearance = distance.min(axis=1)
+    clearance[clearance > search_radius] = np.inf
+    return clearance
+
+
+def footprint_clearance_segments(result, poses, half_x, half_y, search_radius=1.0):
+    """Footprint clearance against a compressed scan: its segments and its leftover points."""
+    clearance = segment_clearance(result.segments, poses, half_x, half_y, search_radius)
+    if len(result.leftover):
+        clearance = np.minimum(clearance, footprint_clearance_many(result.leftover, poses, half_x, half_y,
+                                                                   search_radius))
+    return clearance
+
+
+def _benchmark(scans=40):
+    """Compression, fidelity and timing on corridor and room scans, plus drawing and clearance costs."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+    from spatial_hash import SpatialHash, footprint_clearance
+    from synthetic_scans import TOF_POINTS, TRIANGLE_POINTS, corridor, default_room, generate_scan
+
+    rng = np.random.default_rng(0)
+    half_x, half_y = 0.25, 0.30
+    worlds = {'corridor': (corridor(), lambda k: (1.0 + k * 0.4, rng.normal(0, 0.2), rng.normal(0, 0.1))),
+              'room': (default_room(), lambda k: (rng.uniform(-1.5, 1.5), rng.uniform(-1, 1), rng.uniform(-3, 3)))}
+
+    print(f"Error bound {TOLERANCE * 100:.0f} cm | min {MIN_POINTS} points/segment | {scans} scans per row")
+    print(f"{'world':9s} {'points':>6s} {'segments':>8s} {'leftover':>8s} {'ratio':>6s} {'RMS':>7s} "
+          f"{'max':>7s} {'extract':>9s}")
+    for name, (world, pose) in worlds.items():
+        for n_points in (TRIANGLE_POINTS, TOF_POINTS):
+            data = [generate_scan(pose(k), world, n_points=n_points, rng=rng) for k in range(scans)]
+            start = time.perf_counter()
+            results = [extract_segments(*scan) for scan in data]
+            elapsed = (time.perf_counter() - start) / scans
+            quality = np.array([fidelity(*scan, result) for scan, result in zip(data, results)])
+            valid = np.mean([np.count_nonzero(r > 0) for _, r in data])
+            print(f"{name:9s} {valid:6.0f} {np.mean([len(r.segments) for r in results]):8.1f} "
+                  f"{np.mean([len(r.leftover) for r in results]):8.1f} "
+                  f"{np.mean([compression_ratio(np.count_nonzero(r > 0), res) for (_, r), res in zip(data, results)]):5.1f}x "
+                  f"{np.mean(quality[:, 0]) * 100:5.2f}cm {quality[:, 1].max() * 100:5.2f}cm {elapsed * 1e3:7.2f}ms")
+
+    # Drawing: every point as a marker against the segments as one LineCollection
+    angles, ranges = generate_scan((4.0, 0.0, 0.0), corridor(), n_points=TOF_POINTS, rng=rng)
+    result = extract_segments(angles, ranges)
+    points = polar_to_points(angles, ranges)
+    fig, ax = plt.subplots(figsize=(10, 10))
+    ax.set_xlim(-8, 8)
+    ax.set_ylim(-8, 8)
+    markers = ax.scatter(points[:, 0], points[:, 1], s=10, animated=True)
+    lines = LineCollection(result.segments.reshape(-1, 2, 2), linewidths=2, animated=True)
+    ax.add_collection(lines)
+    rest = ax.scatter(result.leftover[:, 0], result.leftover[:, 1], s=10, animated=True)
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(fig.bbox)
+    timings = []
+    for artists in ([markers], [lines, rest]):
+        start = time.perf_counter()
+        for _ in range(50):
+            fig.canvas.restore_region(background)
+            for artist in artists:
+                ax.draw_artist(artist)
+            fig.canvas.blit(fig.bbox)
+        timings.append((time.perf_counter() - start) / 50)
+    plt.close(fig)
+    print(f"Draw ({len(points)} points -> {len(result.segments)} segments + {len(result.leftover)} points): "
+          f"{timings[0] * 1e3:.2f} ms -> {timings[1] * 1e3:.2f} ms")
+
+    # Footprint clearance for rollout-sized pose sets
+    poses = np.column_stack([rng.uniform(-1, 6, 2000), rng.uniform(-0.6, 0.6, 2000), rng.uniform(-np.pi, np.pi, 2000)])
+    start = time.perf_counter()
+    raw = footprint_clearance(SpatialHash(points), poses, half_x, half_y)
+    raw_time = time.perf_counter() - start
+    start = time.perf_counter()
+    compressed = footprint_clearance_segments(result, poses, half_x, half_y)
+    compressed_time = time.perf_counter() - start
+    both = np.isfinite(raw) & np.isfinite(compressed)
+    print(f"Footprint clearance ({len(poses)} poses): points {raw_time * 1e3:.2f} ms, segments "
+          f"{compressed_time * 1e3:.2f} ms | max difference {np.abs(raw - compressed)[both].max() * 100:.1f} cm, "
+          f"same reach: {np.array_equal(np.isfinite(raw), np.isfinite(compressed))}")
+
+
+if __name__ == "__main__":
+    _benchmark()
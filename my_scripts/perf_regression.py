@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Performance Regression Check - per-stage timings against stored baselines
+Times each stage of the viewers' frame on generated scans at triangle
+(~500 points) and TOF (~2000 points) sizes:
+
+    extraction  scan.points -> angle/range lists (the viewers' loop)
+    cleaning    load into the frame buffers + invalid ranges -> rmax
+    outliers    isolated phantom returns -> no return
+    boundary    720-point boundary interpolation
+    coloring    footprint distance + red/yellow/green colors
+    render      one full Adaptive viewer frame drawn on an Agg canvas
+
+Timings are compared as ratios to a fixed calibration workload timed
+alongside each stage, so baselines recorded on one Linux box can be
+checked on another.
+A stage fails when it is slower than its baseline by more than its
+tolerance; the exit status is 1 if any stage fails. No device needed.
+
+Usage:
+    python3 perf_regression.py            # check against perf_baselines.json
+    python3 perf_regression.py --update   # record new baselines after an intended change
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'perf_baselines.json')
+DEFAULT_TOLERANCE = 0.50  # Allowed slowdown (fraction) for stages without their own entry
+REPEATS = 15              # Timing runs per stage; the fastest one counts
+FRAMES = 40               # Distinct scans per run
+RENDER_FRAMES = 5         # Rendering is ~100x slower than the other stages
+
+# Same geometry as the viewers
+RMAX = 6.0
+WHEELCHAIR_WIDTH = .50
+WHEELCHAIR_LENGTH = .60
+DANGER_ZONE = 0.20
+CAUTION_ZONE = 0.70
+
+
+class _Point:
+    """Stand-in for ydlidar's LaserPoint: attribute access per point, as in the viewers."""
+    __slots__ = ('angle', 'range', 'intensity')
+
+    def __init__(self, angle, range_):
+        self.angle = angle
+        self.range = range_
+        self.intensity = 0.0
+
+
+def _scans(n_points, count, seed=0):
+    from synthetic_scans import default_room, generate_scan
+
+    rng = np.random.default_rng(seed)
+    room = default_room()
+    scans = []
+    for k in range(count):
+        angles, ranges = generate_scan((rng.uniform(-1, 1), rng.uniform(-1, 1), rng.uniform(-np.pi, np.pi)),
+                                       room, n_points=n_points, rng=rng)
+        # Device-style: the revolution starts mid-scan, so there is one angle wrap
+        shift = rng.integers(n_points)
+        scans.append((np.roll(angles, shift), np.roll(ranges, shift)))
+    return scans
+
+
+def _calibration_workload(values):
+    """Fixed mixed Python/numpy work; stage timings are compared in multiples of it."""
+    np.sort(values)
+    np.interp(values, _CAL_XP, _CAL_FP)
+    total = 0.0
+    for v in values[:1024].tolist():
+        total += v * v
+    return total
+
+
+_CAL_DATA = [np.random.default_rng(1).random(4096) for _ in range(4)]
+_CAL_XP = np.linspace(0, 1, 512)
+_CAL_FP = np.linspace(1, 2, 512)
+
+
+def _time_pass(step, inputs, prepare=None):
+    """
+    Mean seconds per step(item) over one pass through inputs.
+
+    prepare(item), if given, runs untimed before each step(item) - for
+    stages that read state left behind by an earlier stage.
+    """
+    clock = time.perf_counter
+    elapsed = 0.0
+    for item in inputs:
+        if prepare is not None:
+            prepare(item)
+        start = clock()
+        step(item)
+        elapsed += clock() - start
+    return elapsed / len(inputs)
+
+
+def _time_stage(step, inputs, repeats, prepare=None):
+    """
+    (fastest ms per call, median ratio to the calibration workload).
+
+    Every timed pass is paired with a calibration pass run right before it,
+    so CPU frequency changes and noisy neighbours during the run cancel out
+    of the ratio - and a faster or slower box does too.
+    """
+    times = []
+    ratios = []
+    for _ in range(repeats):
+        calibration = _time_pass(_calibration_workload, _CAL_DATA)
+        elapsed = _time_pass(step, inputs, prepare)
+        times.append(elapsed)
+        ratios.append(elapsed / calibration)
+    return min(times) * 1e3, float(np.median(ratios))
+
+
+def _render_setup():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(10, 10), facecolor='#0a1929')
+    return fig, plt.subplot(polar=True)
+
+
+def _render_frame(fig, lidar_polar, shading, angles, ranges_clean, r_grid, colors):
+    """The Adaptive viewer's animate() drawing, minus the device."""
+    import matplotlib.pyplot as plt
+    from matplotlib.patches import Rectangle
+
+    lidar_polar.clear()
+    lidar_polar.set_ylim(0, RMAX)
+    lidar_polar.set_rmax(RMAX)
+    lidar_polar.set_theta_zero_location('N')
+    lidar_polar.set_theta_direction(-1)
+    lidar_polar.set_facecolor('#0a1929')
+    lidar_polar.grid(True, color='white', alpha=0.3, linestyle='--', linewidth=0.5)
+    lidar_polar.tick_params(colors='white', labelsize=9)
+    lidar_polar.spines['polar'].set_color('white')
+
+    shading.update(r_grid, RMAX)
+    lidar_polar.add_patch(shading.patch)
+    lidar_polar.scatter(angles, ranges_clean, c=colors, s=18, alpha=0.95, edgecolors='none', zorder=6)
+    lidar_polar.add_patch(Rectangle((-WHEELCHAIR_WIDTH / 2.0, -WHEELCHAIR_LENGTH / 2.0), WHEELCHAIR_WIDTH,
+                                    WHEELCHAIR_LENGTH, transform=lidar_polar.transData._b, facecolor='lightgray',
+                                    edgecolor='gray', alpha=0.3, linewidth=1.5, zorder=1))
+
+    arrow_length = RMAX * 0.12
+    arrow_start = RMAX * 0.02
+    lidar_polar.fill([0.20, 0, -0.20, 0.20],
+                     [arrow_start + arrow_length * 0.7, arrow_start + arrow_length,
+                      arrow_start + arrow_length * 0.7, arrow_start + arrow_length * 0.7],
+                     color='#ff3366', alpha=0.95, zorder=11, edgecolor='white', linewidth=1.5)
+    lidar_polar.plot([0, 0], [arrow_start, arrow_start + arrow_length * 0.6],
+                     color='#ff3366', linewidth=3, alpha=0.95, zorder=11)
+    lidar_polar.add_patch(plt.Circle((0, 0), RMAX * 0.015, transform=lidar_polar.transData._b,
+                                     facecolor='#ff3366', zorder=12, edgecolor='white', linewidth=2))
+    lidar_polar.text(0, arrow_start + arrow_length + RMAX * 0.06, 'FRONT', ha='center', va='bottom',
+                     fontsize=12, fontweight='bold', color='#ff3366', zorder=12)
+    lidar_polar.text(np.pi / 4, RMAX * 0.95, f'{RMAX}m', ha='center', fontsize=9, color='white', alpha=0.7)
+    lidar_polar.set_title(f'Wheelchair Navigation System | Points: {len(angles)} | Frequency: 12.00 Hz',
+                          pad=25, fontsize=13, fontweight='bold', color='white')
+    fig.canvas.draw()
+
+
+def measure(repeats=REPEATS, stages=None):
+    """(ms per frame, calibration ratio) for every stage and scan size, keyed 'stage/points'."""
+    from boundary_shading import BoundaryShading
+    from frame_buffers import FrameBufferPool
+    from synthetic_scans import TOF_POINTS, TRIANGLE_POINTS
+
+    results = {}
+    for n_points in (TRIANGLE_POINTS, TOF_POINTS):
+        scans = _scans(n_points, FRAMES)
+        point_lists = [[_Point(a, r) for a, r in zip(angles.tolist(), ranges.tolist())] for angles, ranges in scans]
+        lists = [(angles.tolist(), ranges.tolist()) for angles, ranges in scans]
+        pool = FrameBufferPool(WHEELCHAIR_WIDTH / 2.0, WHEELCHAIR_LENGTH / 2.0, DANGER_ZONE, CAUTION_ZONE)
+
+        def extraction(points):
+            angle = []
+            ran = []
+            for point in points:
+                angle.append(point.angle)
+                ran.append(point.range)
+
+        def cleaning(scan):
+            pool.load(*scan)
+            pool.clean(RMAX)
+
+        # reject_outliers(), boundary() and colors() work on the scan loaded
+        # last; loading is part of the cleaning stage, so here it is done untimed
+
+        steps = [('extraction', extraction, point_lists, None),
+                 ('cleaning', cleaning, lists, None),
+                 ('outliers', lambda scan: pool.reject_outliers(), lists, cleaning),
+                 ('boundary', lambda scan: pool.boundary(RMAX), lists, cleaning),
+                 ('coloring', lambda scan: pool.colors(pool.ranges_clean[:pool.n]), lists, cleaning)]
+        for name, step, inputs, prepare in steps:
+            if stages is None or name in stages:
+                results[f'{name}/{n_points}'] = _time_stage(step, inputs, repeats, prepare)
+
+        if stages is None or 'render' in stages:
+            fig, polar = _render_setup()
+            shading = BoundaryShading(color='black', alpha=0.35, zorder=2)
+            frames = []
+            for scan in lists[:RENDER_FRAMES]:
+                angles, ranges = pool.load(*scan)
+                clean = pool.clean(RMAX)
+                frames.append((angles.copy(), clean.copy(), pool.boundary(RMAX).copy(), pool.colors(clean).copy()))
+            _render_frame(fig, polar, shading, *frames[0])  # font cache, first-draw setup
+            results[f'render/{n_points}'] = _time_stage(lambda f: _render_frame(fig, polar, shading, *f),
+                                                        frames, max(3, repeats // 3))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage performance regression check")
+    parser.add_argument('--update', action='store_true', help="record the current timings as the baselines")
+    parser.add_argument('--baselines', default=BASELINE_FILE)
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    parser.add_argument('--stage', action='append', choices=['extraction', 'cleaning', 'outliers', 'boundary',
+                                                              'coloring', 'render'], help="only this stage (repeatable)")
+    args = parser.parse_args()
+
+    # Baselines get twice the timing runs; they are recorded once and checked often
+    results = measure(args.repeats * (2 if args.update else 1), args.stage)
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+    tolerances = baselines.get('tolerance', {})
+    recorded = baselines.get('stages', {})
+
+    if args.update:
+        # Keep tolerances and stages that were not re-measured this time
+        recorded.update({key: {'ms': round(ms, 4), 'relative': round(relative, 4)}
+                         for key, (ms, relative) in results.items()})
+        baselines = {'machine': f"{os.uname().machine} {os.cpu_count()} CPU",
+                     'tolerance': tolerances or {'default': DEFAULT_TOLERANCE},
+                     'stages': dict(sorted(recorded.items()))}
+        with open(args.baselines, 'w') as f:
+            json.dump(baselines, f, indent=2)
+            f.write('\n')
+        for key, (ms, relative) in results.items():
+            print(f"{key:18s} {ms:9.3f} ms  {relative:9.3f}x calibration  recorded")
+        print(f"Baselines written to {args.baselines}")
+        return 0
+
+    failed = []
+    print(f"{'stage/points':18s} {'ms':>9s} {'baseline':>9s} {'change':>8s} {'limit':>7s}")
+    for key, (ms, relative) in results.items():
+        if key not in recorded:
+            print(f"{key:18s} {ms:9.3f}       new  (no baseline - run with --update)")
+            continue
+        stage = key.split('/')[0]
+        tolerance = tolerances.get(stage, tolerances.get('default', DEFAULT_TOLERANCE))
+        # Compare in calibration units so a slower or faster box does not count
+        change = relative / recorded[key]['relative'] - 1.0
+        status = 'FAIL' if change > tolerance else 'ok'
+        if status == 'FAIL':
+            failed.append(key)
+        print(f"{key:18s} {ms:9.3f} {recorded[key]['ms']:9.3f} {change * 100:+7.1f}% {tolerance * 100:+6.0f}%  {status}")
+
+    if failed:
+        print(f"\n✗ Regressed: {', '.join(failed)}")
+        return 1
+    print("\n✓ No stage regressed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
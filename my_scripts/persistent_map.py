@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Persistent Map - tiled occupancy grid kept on disk across sessions
+The map is cut into fixed-size square tiles of log-odds occupancy, one
+memory-mapped .npy file per tile in the map directory. Only a bounded
+number of tiles is mapped at a time (LRU cache); tiles touched by new scans
+are marked dirty and a background thread msyncs them to disk, so the scan
+loop never waits on storage. However large the explored area gets, memory
+stays at MAX_TILES tiles.
+
+Scans are inserted with the pose that comes with them (x, y, theta of the
+sensor in the map frame): cells along each beam become more likely free,
+the cell at the return more likely occupied. Tiles nobody has seen are
+not created until something is written to them.
+
+The map directory holds map.json (resolution, tile size, the last pose)
+and tile_<tx>_<ty>.npy files. On startup only the tiles around the last
+pose are loaded; scan matching carries on from that pose, assuming the
+chair is started where it was parked.
+
+Usage:
+    python3 persistent_map.py --map maps/home              # build/extend the map with the LiDAR
+    python3 persistent_map.py --map maps/home --simulate   # corridor drive on generated scans
+    python3 persistent_map.py                              # no device: benchmark + consistency check
+"""
+import argparse
+import collections
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+RESOLUTION = 0.05          # Cell size (m)
+TILE_CELLS = 128           # Tile side in cells: 6.4 m, 16 KiB per tile
+MAX_TILES = 36             # Tiles mapped at once (~590 KiB); one 8 m scan touches at most 16
+PRELOAD_RADIUS = 8.0       # Tiles within this distance of the start pose are loaded at startup (m)
+FLUSH_INTERVAL = 2.0       # Seconds between background flushes of dirty tiles
+MAX_RANGE = 8.0
+
+# Log-odds in int8 steps: a hit counts more than a pass-through, both saturate
+LOG_ODDS_HIT = 9
+LOG_ODDS_FREE = -4
+LOG_ODDS_MIN = -100
+LOG_ODDS_MAX = 100
+LOG_ODDS_SCALE = 10.0      # int8 step -> natural log-odds
+
+MAP_VERSION = 1
+_TILE_KEY_SPAN = 1 << 20   # Tile index pairs packed into one int64 key
+
+
+class PersistentMap:
+    """
+    Occupancy map in memory-mapped tiles with a bounded LRU cache.
+
+    insert_scan() and the queries run on the caller's thread; flushing runs
+    on a daemon thread. close() (or leaving the with-block) flushes
+    everything and records the last pose for the next session.
+    """
+
+    def __init__(self, directory, resolution=RESOLUTION, tile_cells=TILE_CELLS, max_tiles=MAX_TILES,
+                 flush_interval=FLUSH_INTERVAL, preload_radius=PRELOAD_RADIUS):
+        self.directory = directory
+        self.max_tiles = max_tiles
+        os.makedirs(directory, exist_ok=True)
+
+        self._meta_path = os.path.join(directory, 'map.json')
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+            if meta['resolution'] != resolution or meta['tile_cells'] != tile_cells:
+                raise ValueError(f"{directory} was built with resolution {meta['resolution']} m and "
+                                 f"{meta['tile_cells']}-cell tiles, not {resolution} m / {tile_cells}")
+            self.last_pose = tuple(meta.get('last_pose', (0.0, 0.0, 0.0)))
+        else:
+            self.last_pose = (0.0, 0.0, 0.0)
+        self.resolution = resolution
+        self.tile_cells = tile_cells
+        self.tile_size = resolution * tile_cells
+
+        self._tiles = collections.OrderedDict()  # (tx, ty) -> memmap, least recently used first
+        self._dirty = set()
+        self._evicted = []                       # Dirty memmaps dropped from the cache, still to be flushed
+        self._lock = threading.Lock()            # Guards _tiles, _dirty and _evicted against the flush thread
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.flushes = 0
+
+        self._stop = threading.Event()
+        self._flush_interval = flush_interval
+        self._thread = threading.Thread(target=self._run, name='map-flush', daemon=True)
+        self._thread.start()
+
+        if preload_radius > 0:
+            self.preload(self.last_pose, preload_radius)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"tile_{key[0]:+05d}_{key[1]:+05d}.npy")
+
+    def _tile(self, key, create):
+        """Memmap of a tile through the LRU cache; None if it does not exist and create is False."""
+        # The flush thread reads the cache under the lock, so reordering it
+        # takes the lock too; opening the file does not need it
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                self.hits += 1
+                return tile
+
+        path = self._path(key)
+        if os.path.exists(path):
+            tile = np.lib.format.open_memmap(path, mode='r+')
+        elif create:
+            tile = np.lib.format.open_memmap(path, mode='w+', dtype=np.int8,
+                                             shape=(self.tile_cells, self.tile_cells))
+        else:
+            return None
+        self.misses += 1
+
+        with self._lock:
+            self._tiles[key] = tile
+            while len(self._tiles) > self.max_tiles:
+                old_key, old = self._tiles.popitem(last=False)
+                self.evictions += 1
+                if old_key in self._dirty:
+                    # The flush thread writes it out and drops the last reference;
+                    # reopening meanwhile is safe, both map the same file pages
+                    self._dirty.discard(old_key)
+                    self._evicted.append(old)
+        return tile
+
+    def preload(self, pose, radius):
+        """Map the existing tiles within radius of pose; returns how many were loaded."""
+        lo = np.floor((np.asarray(pose[:2]) - radius) / self.tile_size).astype(int)
+        hi = np.floor((np.asarray(pose[:2]) + radius) / self.tile_size).astype(int)
+        keys = [(tx, ty) for tx in range(lo[0], hi[0] + 1) for ty in range(lo[1], hi[1] + 1)]
+        # Closest last, so they are the most recently used if not all fit
+        center = np.asarray(pose[:2]) / self.tile_size - 0.5
+        keys.sort(key=lambda k: -np.hypot(k[0] - center[0], k[1] - center[1]))
+        return sum(self._tile(key, create=False) is not None for key in keys[-self.max_tiles:])
+
+    def _split(self, cells):
+        """Group (N, 2) global cell indices by tile: yields (tile key, flat in-tile indices, positions)."""
+        tiles = np.floor_divide(cells, self.tile_cells)
+        local = cells - tiles * self.tile_cells
+        flat = local[:, 0] * self.tile_cells + local[:, 1]
+        tile_keys = tiles[:, 0] * _TILE_KEY_SPAN + tiles[:, 1]
+        order = np.argsort(tile_keys, kind='stable')
+        tile_keys = tile_keys[order]
+        starts = np.flatnonzero(np.r_[True, tile_keys[1:] != tile_keys[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        for start, end in zip(starts, ends):
+            tx, ty = tiles[order[start]]
+            yield (int(tx), int(ty)), flat[order[start:end]], order[start:end]
+
+    def insert_scan(self, angles, ranges, pose, max_range=MAX_RANGE):
+        """Ray-cast one scan (sensor-frame angles/ranges) taken at pose (x, y, theta) into the map."""
+        angles = np.asarray(angles, dtype=float)
+        ranges = np.asarray(ranges, dtype=float)
+        valid = (ranges > 0) & (ranges <= max_range)
+        if not valid.any():
+            return
+        x, y, theta = pose
+        a = angles[valid] + theta
+        r = ranges[valid]
+        cos_a, sin_a = np.cos(a), np.sin(a)
+
+        # Free cells: samples every cell size along each beam, short of the return
+        n_steps = np.floor(r / self.resolution).astype(np.intp)
+        beam = np.repeat(np.arange(len(r)), n_steps)
+        step = np.arange(len(beam)) - np.repeat(np.cumsum(n_steps) - n_steps, n_steps)
+        along = step * self.resolution
+        free = np.floor(np.column_stack([x + along * cos_a[beam], y + along * sin_a[beam]])
+                        / self.resolution).astype(np.int64)
+        hit = np.floor(np.column_stack([x + r * cos_a, y + r * sin_a]) / self.resolution).astype(np.int64)
+
+        # Every cell changes at most once per scan; a cell with a return is not also freed
+        free_keys = free[:, 0] * (1 << 32) + free[:, 1]
+        hit_keys = hit[:, 0] * (1 << 32) + hit[:, 1]
+        hit_keys, first = np.unique(hit_keys, return_index=True)
+        hit = hit[first]
+        free_keys, first = np.unique(free_keys, return_index=True)
+        free = free[first[~np.isin(free_keys, hit_keys, assume_unique=True)]]
+
+        # One pass over the touched tiles for both kinds of update
+        cells = np.vstack([free, hit])
+        deltas = np.r_[np.full(len(free), LOG_ODDS_FREE, dtype=np.int16),
+                       np.full(len(hit), LOG_ODDS_HIT, dtype=np.int16)]
+        for key, flat, positions in self._split(cells):
+            values = self._tile(key, create=True).reshape(-1)
+            values[flat] = np.clip(values[flat] + deltas[positions], LOG_ODDS_MIN, LOG_ODDS_MAX)
+            with self._lock:
+                self._dirty.add(key)
+
+    def log_odds(self, points):
+        """Stored log-odds (int8 steps) at (N, 2) map-frame points; 0 where nothing is known."""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        values = np.zeros(len(points), dtype=np.int8)
+        if len(points) == 0:
+            return values
+        cells = np.floor(points / self.resolution).astype(np.int64)
+        for key, flat, positions in self._split(cells):
+            tile = self._tile(key, create=False)
+            if tile is not None:
+                values[positions] = tile.reshape(-1)[flat]
+        return values
+
+    def probability(self, points):
+        """Occupancy probability at map-frame points (0.5 = unknown)."""
+        return 1.0 / (1.0 + np.exp(-self.log_odds(points) / LOG_ODDS_SCALE))
+
+    def _flush_dirty(self):
+        with self._lock:
+            keys = list(self._dirty)
+            self._dirty.clear()
+            tiles = [self._tiles[key] for key in keys if key in self._tiles] + self._evicted
+            self._evicted = []
+        for tile in tiles:
+            tile.flush()
+        self.flushes += len(tiles)
+
+    def _run(self):
+        while not self._stop.wait(self._flush_interval):
+            self._flush_dirty()
+
+    def flush(self):
+        """Write all dirty tiles now (the background thread does this every flush interval)."""
+        self._flush_dirty()
+
+    def close(self, pose=None):
+        """Stop the flush thread, write everything out and remember pose for the next session."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        self._flush_dirty()
+        if pose is not None:
+            self.last_pose = tuple(float(v) for v in pose)
+        with open(self._meta_path, 'w') as f:
+            json.dump({'version': MAP_VERSION, 'resolution': self.resolution, 'tile_cells': self.tile_cells,
+                       'last_pose': self.last_pose}, f, indent=2)
+        self._tiles.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self):
+        """Cache and disk usage as a dict."""
+        on_disk = sum(name.startswith('tile_') for name in os.listdir(self.directory))
+        lookups = self.hits + self.misses
+        return dict(resident_tiles=len(self._tiles), resident_kib=len(self._tiles) * self.tile_cells ** 2 / 1024,
+                    max_kib=self.max_tiles * self.tile_cells ** 2 / 1024, tiles_on_disk=on_disk,
+                    hit_rate=self.hits / lookups if lookups else None, evictions=self.evictions,
+                    flushed=self.flushes)
+
+
+def _report(grid, label):
+    s = grid.stats()
+    print(f"{label}: {s['resident_tiles']} tiles resident ({s['resident_kib']:.0f}/{s['max_kib']:.0f} KiB), "
+          f"{s['tiles_on_disk']} on disk, hit rate {s['hit_rate'] or 0:.1%}, {s['evictions']} evictions, "
+          f"{s['flushed']} tile flushes")
+
+
+def run_device(directory):
+    """Build/extend the map on the real LiDAR with scan-matching poses; no plotting."""
+    import ydlidar
+    from scan_matching import ScanMatcher, compose_pose
+
+    ydlidar.os_init()
+    ports = ydlidar.lidarPortList()
+    port = "/dev/ydlidar"
+    for key, value in ports.items():
+        port = value
+        print(f"Using port: {port}")
+
+    laser = ydlidar.CYdLidar()
+    laser.setlidaropt(ydlidar.LidarPropSerialPort, port)
+    laser.setlidaropt(ydlidar.LidarPropSerialBaudrate, 115200)
+    laser.setlidaropt(ydlidar.LidarPropLidarType, ydlidar.TYPE_TRIANGLE)
+    laser.setlidaropt(ydlidar.LidarPropDeviceType, ydlidar.YDLIDAR_TYPE_SERIAL)
+    laser.setlidaropt(ydlidar.LidarPropScanFrequency, 12.0)
+    laser.setlidaropt(ydlidar.LidarPropSampleRate, 5)
+    laser.setlidaropt(ydlidar.LidarPropSingleChannel, True)
+    laser.setlidaropt(ydlidar.LidarPropMaxAngle, 180.0)
+    laser.setlidaropt(ydlidar.LidarPropMinAngle, -180.0)
+    laser.setlidaropt(ydlidar.LidarPropMaxRange, MAX_RANGE)
+    laser.setlidaropt(ydlidar.LidarPropMinRange, 0.08)
+    laser.setlidaropt(ydlidar.LidarPropIntenstiy, False)
+
+    grid = PersistentMap(directory)
+    _report(grid, f"Opened {directory}")
+    matcher = ScanMatcher(max_range=MAX_RANGE)
+    pose = grid.last_pose
+    ret = laser.initialize()
+    if ret:
+        ret = laser.turnOn()
+        scan = ydlidar.LaserScan()
+        count = 0
+        try:
+            while ret and ydlidar.os_isOk():
+                if laser.doProcessSimple(scan):
+                    angle = [p.angle for p in scan.points]
+                    ran = [p.range for p in scan.points]
+                    motion = matcher.match(angle, ran)
+                    pose = compose_pose(pose, motion)
+                    grid.insert_scan(angle, ran, pose)
+                    count += 1
+                    if count % 120 == 0:
+                        _report(grid, f"Scan {count}, pose ({pose[0]:+.2f}, {pose[1]:+.2f})")
+                else:
+                    print("Failed to get Lidar Data")
+        except KeyboardInterrupt:
+            pass
+        laser.turnOff()
+    else:
+        print("✗ Failed to initialize LiDAR!")
+    laser.disconnecting()
+    _report(grid, f"Saving {directory}")
+    grid.close(pose)
+
+
+def run_simulated(directory, n_scans=1200, n_points=500):
+    """Drive down a long generated corridor with ground-truth poses, reporting cache use as the map grows."""
+    from synthetic_scans import corridor, generate_scan
+
+    rng = np.random.default_rng(0)
+    world = corridor(length=60.0, width=1.6, doors=12)
+    with PersistentMap(directory) as grid:
+        start = grid.last_pose
+        _report(grid, f"Opened {directory} at ({start[0]:+.2f}, {start[1]:+.2f})")
+        times = []
+        pose = start
+        for k in range(n_scans):
+            pose = (start[0] + 0.045 * k, 0.0, 0.0)
+            angles, ranges = generate_scan(pose, world, n_points=n_points, rng=rng)
+            t0 = time.perf_counter()
+            grid.insert_scan(angles, ranges, pose)
+            times.append(time.perf_counter() - t0)
+            if (k + 1) % 300 == 0:
+                _report(grid, f"Scan {k + 1}, x = {pose[0]:.1f} m")
+        _report(grid, f"Saving {directory}")
+        grid.close(pose)
+    times = np.array(times) * 1e3
+    print(f"insert_scan(): {times.mean():.2f} ms mean, {np.percentile(times, 99):.2f} ms p99")
+
+
+def _benchmark():
+    """Insertion cost, bounded cache over a long drive, and the map reopening identically from disk."""
+    import tempfile
+    from synthetic_scans import TOF_POINTS, TRIANGLE_POINTS, corridor, generate_scan
+
+    rng = np.random.default_rng(0)
+    world = corridor(length=60.0, width=1.6, doors=12)
+    poses = [(0.5 + 0.045 * k, 0.0, 0.0) for k in range(1200)]
+    with tempfile.TemporaryDirectory() as directory:
+        for n_points in (TRIANGLE_POINTS, TOF_POINTS):
+            scans = [generate_scan(pose, world, n_points=n_points, rng=rng) for pose in poses[:120]]
+            with PersistentMap(os.path.join(directory, f'timing{n_points}')) as grid:
+                times = []
+                for pose, (angles, ranges) in zip(poses, scans):
+                    start = time.perf_counter()
+                    grid.insert_scan(angles, ranges, pose)
+                    times.append(time.perf_counter() - start)
+            times = np.array(times) * 1e3
+            print(f"{n_points} points/scan: insert {times.mean():.2f} ms mean, "
+                  f"{np.percentile(times, 99):.2f} ms p99 (12 Hz budget {1000 / 12:.0f} ms)")
+
+        # 54 m of corridor with a cache of 10 tiles (410 m²): memory must stay put
+        path = os.path.join(directory, 'corridor')
+        grid = PersistentMap(path, max_tiles=10, flush_interval=0.2)
+        for k, pose in enumerate(poses):
+            angles, ranges = generate_scan(pose, world, n_points=TRIANGLE_POINTS, rng=rng)
+            grid.insert_scan(angles, ranges, pose)
+            assert len(grid._tiles) <= 10
+        probe = np.column_stack([np.linspace(0.5, 54.0, 2000), rng.uniform(-1.0, 1.0, 2000)])
+        before = grid.log_odds(probe)
+        _report(grid, "After 1200 scans")
+        grid.close(poses[-1])
+
+        # A new session sees exactly what was written, loading only the tiles near the last pose
+        reopened = PersistentMap(path, max_tiles=10)
+        near = len(reopened._tiles)
+        same = np.array_equal(reopened.log_odds(probe), before)
+        walls = reopened.probability(np.array([[30.0, 0.82], [30.0, 0.0]]))
+        reopened.close()
+        print(f"Reopened: {near} tiles preloaded around x = {reopened.last_pose[0]:.1f} m, "
+              f"all {len(probe)} probes identical: {same}, "
+              f"P(occupied) wall {walls[0]:.2f} / corridor middle {walls[1]:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Persistent tiled occupancy map built from the LiDAR")
+    parser.add_argument('--map', help="map directory (created if missing)")
+    parser.add_argument('--simulate', action='store_true', help="use generated scans instead of the LiDAR")
+    args = parser.parse_args()
+
+    if args.map is None:
+        _benchmark()
+    elif args.simulate:
+        run_simulated(args.map)
+    else:
+        run_device(args.map)
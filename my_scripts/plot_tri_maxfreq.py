@@ -12,6 +12,8 @@ from matplotlib.colors import LinearSegmentedColormap
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import numpy as np
+from frame_buffers import FrameBufferPool
+from profiling_hook import ProfilingHook
 
 # ============== CONFIGURATION PARAMETERS ==============
 RMAX = 5.0  # Maximum display range in meters - EASILY ADJUSTABLE
@@ -68,54 +70,12 @@ laser.setlidaropt(ydlidar.LidarPropIntenstiy, False)
 
 scan = ydlidar.LaserScan()
 scan_count = 0
+# Preallocated working buffers for cleaning, boundary and coloring
+buffers = FrameBufferPool(WHEELCHAIR_WIDTH / 2.0, WHEELCHAIR_LENGTH / 2.0, DANGER_ZONE, CAUTION_ZONE)
+# On-demand profiling of the live loop: F9 in the window or kill -USR1 <pid>
+profiling = ProfilingHook('plot_tri_maxfreq', fig)
 freq_text = None
 
-def get_distance_to_wheelchair_boundary(x, y):
-    """
-    Calculate the minimum distance from a point (x, y) to the wheelchair boundary.
-    The wheelchair is centered at origin with dimensions WHEELCHAIR_WIDTH x WHEELCHAIR_LENGTH.
-    """
-    half_width = WHEELCHAIR_WIDTH / 2.0
-    half_length = WHEELCHAIR_LENGTH / 2.0
-    
-    # Calculate distance to each edge
-    dx = max(abs(x) - half_width, 0)
-    dy = max(abs(y) - half_length, 0)
-    
-    # Euclidean distance to nearest point on rectangle
-    return np.sqrt(dx**2 + dy**2)
-
-def get_point_color(distance_to_boundary):
-    """
-    Return RGB color based on distance to wheelchair boundary.
-    RED (danger) -> YELLOW (caution) -> GREEN (safe)
-    """
-    if distance_to_boundary <= DANGER_ZONE:
-        # RED zone - very close, danger!
-        return np.array([1.0, 0.0, 0.0])  # Pure red
-    elif distance_to_boundary <= CAUTION_ZONE:
-        # Transition from RED to YELLOW to GREEN
-        # DANGER_ZONE to CAUTION_ZONE: red -> yellow -> green
-        normalized = (distance_to_boundary - DANGER_ZONE) / (CAUTION_ZONE - DANGER_ZONE)
-        
-        if normalized < 0.5:
-            # RED to YELLOW transition (0.0 to 0.5)
-            t = normalized * 2.0  # Scale to 0-1
-            r = 1.0
-            g = t  # Increase green from 0 to 1
-            b = 0.0
-        else:
-            # YELLOW to GREEN transition (0.5 to 1.0)
-            t = (normalized - 0.5) * 2.0  # Scale to 0-1
-            r = 1.0 - t  # Decrease red from 1 to 0
-            g = 1.0
-            b = 0.0
-        
-        return np.array([r, g, b])
-    else:
-        # GREEN zone - safe distance
-        return np.array([0.0, 1.0, 0.0])  # Pure green
-
 def animate(num):
     global scan_count, freq_text
     
@@ -143,25 +103,16 @@ def animate(num):
         
         # Draw the LiDAR points with distance-based color coding
         if len(angle) > 0:
-            # Convert polar coordinates to Cartesian for distance calculation
-            colors = []
-            for ang, r in zip(angle, ran):
-                # Convert to Cartesian coordinates
-                x = r * np.cos(ang)
-                y = r * np.sin(ang)
-                
-                # Calculate distance to wheelchair boundary
-                dist_to_boundary = get_distance_to_wheelchair_boundary(x, y)
-                
-                # Get color based on distance
-                color = get_point_color(dist_to_boundary)
-                colors.append(color)
-            
-            # Convert to numpy array for matplotlib
-            colors = np.array(colors)
+            # Color each point by distance to the wheelchair boundary; isolated
+            # phantom returns are not drawn
+            angles, ranges = buffers.load(angle, ran)
+            buffers.reject_outliers()
+            colors = buffers.colors(ranges)
+            shown = ~buffers.rejected
             
             # Plot with gradient colors
-            lidar_polar.scatter(angle, ran, c=colors, s=10, alpha=0.9, edgecolors='white', linewidth=0.3, zorder=6)
+            lidar_polar.scatter(angles[shown], ranges[shown], c=colors[shown], s=10, alpha=0.9, edgecolors='white',
+                                linewidth=0.3, zorder=6)
         
         # Add wheelchair footprint (light gray semi-transparent square)
         # The LiDAR is at the center (0,0) in polar coordinates
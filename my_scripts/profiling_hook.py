@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Profiling Hook - start/stop cProfile on a running viewer or headless loop
+Press F9 in the plot window, or send SIGUSR1 to the process
+(kill -USR1 <pid>), to start profiling; do it again to stop. Each session
+is written to profiles/<name>-<timestamp>.prof (open with snakeviz or
+python3 -m pstats) plus a .txt summary of the hottest functions, which is
+also printed to the console.
+
+Nothing is installed on the interpreter until profiling is started, so an
+idle hook costs nothing per frame.
+
+Run directly for a demo on generated scans that triggers itself by signal.
+"""
+import atexit
+import cProfile
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+
+PROFILE_DIR = 'profiles'  # Relative to where the script is started
+PROFILE_KEY = 'f9'        # Not bound by matplotlib's default keymap
+TOP_N = 25                # Functions listed in the summary
+
+
+class ProfilingHook:
+    """
+    Toggleable cProfile session for the main (animate/processing) thread.
+
+    Installs a SIGUSR1 handler where the platform has one and, given a
+    figure, a key handler for PROFILE_KEY. A session still running at exit
+    is written out too.
+    """
+
+    def __init__(self, name, fig=None, signum=getattr(signal, 'SIGUSR1', None), key=PROFILE_KEY,
+                 directory=PROFILE_DIR, top=TOP_N):
+        self.name = name
+        self.key = key
+        self.directory = directory
+        self.top = top
+        self.profiler = None
+        self.started = None
+
+        triggers = []
+        if signum is not None and threading.current_thread() is threading.main_thread():
+            signal.signal(signum, lambda signo, frame: self.toggle())
+            triggers.append(f"kill -{signal.Signals(signum).name[3:]} {os.getpid()}")
+        if fig is not None:
+            fig.canvas.mpl_connect('key_press_event', self._on_key)
+            triggers.insert(0, f"press {key.upper()}")
+        if triggers:
+            print(f"Profiling: {' or '.join(triggers)} to start/stop")
+        atexit.register(self._stop_at_exit)
+
+    @property
+    def active(self):
+        return self.profiler is not None
+
+    def _on_key(self, event):
+        if event.key == self.key:
+            self.toggle()
+
+    def toggle(self):
+        if self.active:
+            self.stop()
+        else:
+            self.start()
+
+    def start(self):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as exc:  # another profiler/tracer already owns the thread
+            print(f"Profiling: cannot start ({exc})")
+            return
+        self.profiler = profiler
+        self.started = time.time()
+        print("Profiling: started")
+
+    def stop(self):
+        """Stop the session and write it out; returns the .prof path."""
+        if not self.active:
+            return None
+        self.profiler.disable()
+        profiler, self.profiler = self.profiler, None
+        duration = time.time() - self.started
+
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started))
+        path = os.path.join(self.directory, f"{self.name}-{stamp}.prof")
+        profiler.dump_stats(path)
+
+        tables = []
+        for order in ('tottime', 'cumulative'):
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).strip_dirs().sort_stats(order).print_stats(self.top)
+            tables.append(f"=== Top {self.top} by {order} ===\n{text.getvalue().strip()}\n")
+        summary = os.path.splitext(path)[0] + '.txt'
+        with open(summary, 'w') as f:
+            f.write(f"{self.name}: {duration:.1f} s profiled\n\n" + '\n'.join(tables))
+
+        # Console gets the short version: the tottime table only
+        print(tables[0])
+        print(f"Profiling: stopped after {duration:.1f} s -> {path} (+ {os.path.basename(summary)})")
+        return path
+
+    def _stop_at_exit(self):
+        if self.active:
+            self.stop()
+
+
+def _demo(seconds=1.0):
+    """Frame loop on generated scans: idle overhead, then a session started and stopped by SIGUSR1."""
+    import tempfile
+
+    import numpy as np
+    from frame_buffers import FrameBufferPool
+    from synthetic_scans import default_room, generate_scan
+
+    rng = np.random.default_rng(0)
+    room = default_room()
+    scans = [generate_scan((0.0, 0.0, 0.0), room, rng=rng) for _ in range(24)]
+    pool = FrameBufferPool(0.25, 0.3, 0.20, 0.70)
+
+    def frames(duration):
+        count = 0
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            angles, ranges = pool.load(*scans[count % len(scans)])
+            pool.clean(6.0)
+            pool.boundary(6.0)
+            pool.colors(ranges)
+            count += 1
+        return count / duration
+
+    with tempfile.TemporaryDirectory() as directory:
+        hook = ProfilingHook('demo', directory=directory, top=8)
+        handler = signal.getsignal(signal.SIGUSR1)
+
+        # Alternate short runs with and without the hook installed, so
+        # scheduler noise averages out instead of passing for overhead
+        baseline, idle = [], []
+        for _ in range(10):
+            signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+            baseline.append(frames(seconds / 20))
+            signal.signal(signal.SIGUSR1, handler)
+            idle.append(frames(seconds / 20))
+        baseline, idle = np.median(baseline), np.median(idle)
+        assert sys.getprofile() is None
+
+        os.kill(os.getpid(), signal.SIGUSR1)
+        profiled = frames(seconds)
+        os.kill(os.getpid(), signal.SIGUSR1)
+        assert not hook.active
+        files = sorted(os.listdir(directory))
+    print(f"Frames/s: no hook {baseline:.0f} | hook idle {idle:.0f} ({(idle / baseline - 1) * 100:+.1f}%) | "
+          f"profiling {profiled:.0f}")
+    print(f"Written: {files}")
+
+
+if __name__ == "__main__":
+    _demo()
@@ -4,14 +4,34 @@
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
 export PYTHONPATH=/usr/local/lib/python3/dist-packages:$PYTHONPATH
 
+# --sim: the scripts' `import ydlidar` gets the ray-cast simulator instead of the SDK
+if [ "$1" == "--sim" ]; then
+    export PYTHONPATH="$SCRIPT_DIR/sim:$PYTHONPATH"
+    shift
+fi
+
+# --broker: the scripts read scans from a running scan_broker.py instead of the serial port
+if [ "$1" == "--broker" ]; then
+    export PYTHONPATH="$SCRIPT_DIR/broker:$PYTHONPATH"
+    shift
+fi
+
 # Check if a script name was provided
 if [ $# -eq 0 ]; then
-    echo "Usage: ./run.sh <script_name.py>"
+    echo "Usage: ./run.sh [--sim | --broker] <script_name.py>"
     echo ""
     echo "Available scripts:"
-    echo "  tri_test_maxfreq.py      - Console test at max frequency"
+    echo "  tri_test_maxfreq.py      - Console test at max frequency (--stats for summaries)"
     echo "  plot_tri_maxfreq.py      - Real-time visualization"
-    echo "  tof_test_maxfreq.py      - TOF LiDAR console test"
+    echo "  tof_test_maxfreq.py      - TOF LiDAR console test (--stats for summaries)"
+    echo "  sector_feedback.py       - Haptic/audio sector packets (--udp / --serial)"
+    echo "  frame_stream.py          - Stream frames to a display (--publish / --view HOST)"
+    echo "  persistent_map.py        - Build the persistent map (--map DIR)"
+    echo "  session_render.py        - Record a session (--record DIR) or render one to video"
+    echo "  scan_broker.py           - Own the LiDAR and share its scans with --broker scripts"
+    echo ""
+    echo "  --sim runs any of them on the simulated LiDAR (world: LIDAR_SIM_WORLD=worlds/doorway.json)"
+    echo "  --broker runs any of them as a client of a running scan_broker.py"
     echo ""
     exit 1
 fi
@@ -26,4 +46,4 @@ fi
 
 # Run the script
 cd "$SCRIPT_DIR"
-python3 "$SCRIPT_NAME"
+python3 "$SCRIPT_NAME" "${@:2}"
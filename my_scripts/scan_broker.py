@@ -0,0 +1,617 @@
+#!/usr/bin/env python3
+"""
+Scan Broker - one process owns the LiDAR, any number of scripts read it
+Only one process can hold the serial port, so the viewers, a logger and a
+safety monitor could not run side by side. The broker owns the CYdLidar
+and writes every scan into a ring of RING_SLOTS slots in a shared file
+(/dev/shm); clients map the same file and get each scan's angles and
+ranges as NumPy views into it, without a copy.
+
+Clients connect to a Unix socket. The broker answers with one JSON line
+describing the ring and the client's entry in the client table, then
+sends a one-byte wakeup per scan. Wakeups are sent without blocking and
+only tell the client to look at the ring, so a client that stops reading
+loses nothing but wakeups and never delays the broker. Each client reads
+at its own pace: in order (a logger) or always the newest scan (a
+display). A client that falls more than a ring behind skips ahead;
+the scans it never saw are counted as dropped. Clients keep their read
+position and counters in the shared client table, from which the broker
+reports each client's lag and drops.
+
+Slots use a sequence check: a slot's sequence number is cleared before it
+is rewritten and set after, and a reader checks it before and after
+taking a scan. ScanReader.valid(scan) tells whether views into a slot
+still hold that scan; copy the arrays to keep them longer than the ring
+(RING_SLOTS / 12 Hz, about 1.3 s).
+
+Usage:
+    ./run.sh scan_broker.py                          # on the chair: owns the LiDAR
+    ./run.sh --sim scan_broker.py                    # same, on the simulator
+    ./run.sh --broker PlotMoving_Adaptive_Lidar_system.py   # any script, as a client
+    python3 scan_broker.py --demo                    # simulated broker with four clients
+
+run.sh --broker puts broker/ydlidar.py first on PYTHONPATH: its CYdLidar
+is a BrokerLidar that hands the client the newest scan in the ring. The
+client's setlidaropt() calls are ignored - the broker configures the
+device.
+"""
+import argparse
+import collections
+import json
+import os
+import select
+import socket
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from simulated_lidar import LaserPoint, LaserPointVector
+
+# ============== CONFIGURATION PARAMETERS ==============
+SOCKET_PATH = os.environ.get('LIDAR_BROKER_SOCKET', '/tmp/lidar-broker.sock')
+RING_SLOTS = 16           # Scans kept (1.3 s at 12 Hz)
+MAX_POINTS = 2048         # Points per slot - enough for TOF scans
+MAX_CLIENTS = 16          # Entries in the client table
+STATUS_INTERVAL = 10.0    # Seconds between client status lines
+CONNECT_TIMEOUT = 2.0     # Seconds a client waits for the broker's announcement
+SCAN_TIMEOUT = 1.0        # Seconds BrokerLidar.doProcessSimple() waits for a scan
+RMAX_ABSOLUTE = 8.0       # Device range limits, as in the viewers
+RMIN_ABSOLUTE = 0.08
+# ======================================================
+
+BROKER_VERSION = 1
+RING_MAGIC = b'LSB'
+_ALIGN = 64
+_HEADER = np.dtype([('magic', 'S4'), ('version', '<u4'), ('slots', '<u4'), ('capacity', '<u4'),
+                    ('max_clients', '<u4'), ('pad', '<u4'), ('latest', '<u8'), ('broker_pid', '<i8')])
+_CLIENT = np.dtype([('name', 'S24'), ('pid', '<i8'), ('cursor', '<u8'), ('delivered', '<u8'), ('dropped', '<u8')])
+_SLOT = np.dtype([('sequence', '<u8'), ('stamp', '<i8'), ('scan_time', '<f8'), ('time_increment', '<f8'),
+                  ('count', '<u4'), ('pad', '<u4')])
+WAKEUP = b'\x01'
+
+BrokerScan = collections.namedtuple('BrokerScan', 'sequence stamp scan_time time_increment angles ranges')
+ClientStats = collections.namedtuple('ClientStats', 'index name pid lag delivered dropped wakeups_skipped')
+
+
+def _ring_layout(slots, capacity, max_clients):
+    """Byte offsets of header, client table, slot headers, angles and ranges, and the total size."""
+    offsets = {}
+    size = 0
+    for name, nbytes in (('header', _HEADER.itemsize), ('clients', max_clients * _CLIENT.itemsize),
+                         ('slots', slots * _SLOT.itemsize), ('angles', slots * capacity * 4),
+                         ('ranges', slots * capacity * 4)):
+        offsets[name] = size
+        size += -(-nbytes // _ALIGN) * _ALIGN
+    return offsets, size
+
+
+class _Ring:
+    """Typed views into the mapped ring file."""
+
+    def __init__(self, path, slots, capacity, max_clients, mode):
+        offsets, size = _ring_layout(slots, capacity, max_clients)
+        self.memory = np.memmap(path, dtype=np.uint8, mode=mode, shape=(size,))
+
+        def view(name, dtype, count):
+            start = offsets[name]
+            return self.memory[start:start + count * np.dtype(dtype).itemsize].view(dtype)
+
+        self.header = view('header', _HEADER, 1)
+        self.clients = view('clients', _CLIENT, max_clients)
+        slot = view('slots', _SLOT, slots)
+        self.sequence = slot['sequence']
+        self.stamp = slot['stamp']
+        self.scan_time = slot['scan_time']
+        self.time_increment = slot['time_increment']
+        self.count = slot['count']
+        self.angles = view('angles', np.float32, slots * capacity).reshape(slots, capacity)
+        self.ranges = view('ranges', np.float32, slots * capacity).reshape(slots, capacity)
+
+
+def _shm_directory():
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def _claim_socket(path):
+    """Remove a socket left behind by a broker that is gone; raise RuntimeError if a broker still answers on it."""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    probe.settimeout(CONNECT_TIMEOUT)
+    try:
+        probe.connect(path)
+    except FileNotFoundError:
+        return
+    except ConnectionRefusedError:
+        os.unlink(path)  # left behind by a broker that did not shut down
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"A scan broker is already running on {path}")
+
+
+class ScanBroker:
+    """
+    Publishes scans into the shared ring and serves the Unix socket.
+
+    publish() never waits: new connections and hang-ups are polled without
+    blocking, and a wakeup that would block is skipped for that client.
+    """
+
+    def __init__(self, path=SOCKET_PATH, slots=RING_SLOTS, capacity=MAX_POINTS, max_clients=MAX_CLIENTS,
+                 min_range=RMIN_ABSOLUTE, max_range=RMAX_ABSOLUTE):
+        _claim_socket(path)
+        self.path = path
+        self.slots = slots
+        self.capacity = capacity
+        self.ring_path = os.path.join(_shm_directory(), f'lidar-broker-{os.getpid()}')
+        _, size = _ring_layout(slots, capacity, max_clients)
+        with open(self.ring_path, 'wb') as f:
+            f.truncate(size)
+        self.ring = _Ring(self.ring_path, slots, capacity, max_clients, 'r+')
+        header = self.ring.header[0]
+        header['magic'] = RING_MAGIC
+        header['version'] = BROKER_VERSION
+        header['slots'] = slots
+        header['capacity'] = capacity
+        header['max_clients'] = max_clients
+        header['broker_pid'] = os.getpid()
+        self._announcement = {'version': BROKER_VERSION, 'ring': self.ring_path, 'slots': slots,
+                              'capacity': capacity, 'max_clients': max_clients, 'min_range': min_range,
+                              'max_range': max_range}
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self._inode = os.stat(path).st_ino
+        self.sock.listen(MAX_CLIENTS)
+        self.sock.setblocking(False)
+        self.clients = {}    # table index -> connection
+        self.skipped = {}    # table index -> wakeups not sent because the client's socket was full
+        self.sequence = 0
+        self.truncated = 0
+
+    def _poll(self):
+        while True:
+            try:
+                connection, _ = self.sock.accept()
+            except BlockingIOError:
+                break
+            free = [i for i in range(len(self.ring.clients)) if i not in self.clients]
+            if free:
+                index = free[0]
+                entry = self.ring.clients[index:index + 1]
+                entry['name'] = b''
+                entry['pid'] = 0
+                entry['cursor'] = self.sequence  # the client starts reading after the current scan
+                entry['delivered'] = 0
+                entry['dropped'] = 0
+            reply = dict(self._announcement, client=free[0]) if free else {'error': 'broker full'}
+            try:
+                connection.sendall(json.dumps(reply).encode() + b'\n')
+            except OSError:
+                connection.close()
+                continue
+            if not free:
+                connection.close()
+                continue
+            connection.setblocking(False)
+            self.clients[index] = connection
+            self.skipped[index] = 0
+        for index, connection in list(self.clients.items()):
+            try:
+                if connection.recv(64) == b'':
+                    self._disconnect(index)
+            except BlockingIOError:
+                pass
+            except OSError:
+                self._disconnect(index)
+
+    def _disconnect(self, index):
+        stats = self.client_stats(index)
+        print(f"Client {stats.name or '?'} (pid {stats.pid}) left: {stats.delivered} scans delivered, "
+              f"{stats.dropped} dropped")
+        self.clients.pop(index).close()
+        self.skipped.pop(index)
+        self.ring.clients['pid'][index] = 0
+        self.ring.clients['name'][index] = b''
+
+    def publish(self, angles, ranges, stamp=0, scan_time=0.0, time_increment=0.0):
+        """Write one scan into the ring and wake the clients; returns its sequence number."""
+        self._poll()
+        ring = self.ring
+        sequence = self.sequence + 1
+        slot = sequence % self.slots
+        n = len(angles)
+        if n > self.capacity:
+            self.truncated += 1
+            n = self.capacity
+        ring.sequence[slot] = 0  # readers treat the slot as being rewritten
+        ring.angles[slot, :n] = angles[:n]
+        ring.ranges[slot, :n] = ranges[:n]
+        ring.count[slot] = n
+        ring.stamp[slot] = stamp
+        ring.scan_time[slot] = scan_time
+        ring.time_increment[slot] = time_increment
+        ring.sequence[slot] = sequence
+        ring.header['latest'] = sequence
+        self.sequence = sequence
+
+        for index, connection in list(self.clients.items()):
+            try:
+                connection.send(WAKEUP)
+            except BlockingIOError:
+                self.skipped[index] += 1
+            except OSError:
+                self._disconnect(index)
+        return sequence
+
+    def client_stats(self, index=None):
+        """ClientStats of one connected client, or a list of all of them."""
+        if index is None:
+            return [self.client_stats(i) for i in sorted(self.clients)]
+        entry = self.ring.clients[index]
+        return ClientStats(index, entry['name'].decode(errors='replace'), int(entry['pid']),
+                           self.sequence - int(entry['cursor']), int(entry['delivered']), int(entry['dropped']),
+                           self.skipped[index])
+
+    def summary(self):
+        lines = [f"Broker: {self.sequence} scans published, {len(self.clients)} client(s)"]
+        for stats in self.client_stats():
+            lines.append(f"  {stats.name or '?':24s} pid {stats.pid:<7d} lag {stats.lag:3d} scans | "
+                         f"delivered {stats.delivered} | dropped {stats.dropped} | "
+                         f"wakeups skipped {stats.wakeups_skipped}")
+        return '\n'.join(lines)
+
+    def close(self):
+        for index in list(self.clients):
+            self.clients.pop(index).close()
+        self.sock.close()
+        try:
+            if os.stat(self.path).st_ino == self._inode:  # not a socket a later broker bound
+                os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        os.unlink(self.ring_path)  # clients keep their mappings until they exit
+
+
+class ScanReader:
+    """
+    Client side: maps the broker's ring and reads scans from it.
+
+    next() returns the scan after the last one read (or the newest with
+    latest=True) as a BrokerScan whose arrays are float32 views into the
+    ring. The views hold the scan only until the broker wraps around to its
+    slot; check valid() after using or copying them. Reading starts at the
+    scan being published when connecting.
+    """
+
+    def __init__(self, path=SOCKET_PATH, name=None, timeout=CONNECT_TIMEOUT):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        received = b''
+        while b'\n' not in received:
+            data = self.sock.recv(4096)
+            if not data:
+                raise ConnectionError(f"Broker at {path} closed the connection")
+            received += data
+        self.config = json.loads(received.split(b'\n', 1)[0])  # wakeups may follow in the same read
+        if 'error' in self.config:
+            raise ConnectionError(f"Broker at {path}: {self.config['error']}")
+        if self.config['version'] != BROKER_VERSION:
+            raise ConnectionError(f"Broker at {path} speaks version {self.config['version']}, "
+                                  f"expected {BROKER_VERSION}")
+        self.sock.setblocking(False)
+        self.slots = self.config['slots']
+        self.ring = _Ring(self.config['ring'], self.slots, self.config['capacity'], self.config['max_clients'], 'r+')
+        self._entry = self.ring.clients[self.config['client']:self.config['client'] + 1]
+        self._entry['name'] = (name or os.path.basename(sys.argv[0]) or 'client').encode()[:_CLIENT['name'].itemsize]
+        self._entry['pid'] = os.getpid()
+        self.cursor = int(self._entry['cursor'][0])
+        self.delivered = 0
+        self.dropped = 0
+
+    def _take(self, newest, latest):
+        ring = self.ring
+        target = newest if latest else self.cursor + 1
+        # The slot after the newest may already be being rewritten
+        target = max(target, newest - self.slots + 2)
+        slot = target % self.slots
+        if ring.sequence[slot] != target:
+            return None
+        count = int(ring.count[slot])
+        scan = BrokerScan(target, int(ring.stamp[slot]), float(ring.scan_time[slot]),
+                          float(ring.time_increment[slot]), ring.angles[slot, :count], ring.ranges[slot, :count])
+        if ring.sequence[slot] != target:
+            return None
+        self.dropped += target - self.cursor - 1
+        self.cursor = target
+        self.delivered += 1
+        entry = self._entry
+        entry['cursor'] = self.cursor
+        entry['delivered'] = self.delivered
+        entry['dropped'] = self.dropped
+        return scan
+
+    def next(self, timeout=SCAN_TIMEOUT, latest=False):
+        """Next scan, or None on timeout; raises ConnectionError once the broker is gone."""
+        deadline = time.monotonic() + timeout
+        while True:
+            newest = int(self.ring.header['latest'][0])
+            if newest > self.cursor:
+                scan = self._take(newest, latest)
+                if scan is not None:
+                    return scan
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            if select.select([self.sock], [], [], remaining)[0]:
+                try:
+                    if self.sock.recv(4096) == b'':
+                        raise ConnectionError("Broker went away")
+                except BlockingIOError:
+                    pass
+
+    def valid(self, scan):
+        """True while the views of scan still hold it (its slot has not been rewritten)."""
+        return self.ring.sequence[scan.sequence % self.slots] == scan.sequence
+
+    def close(self):
+        self.sock.close()
+
+
+class BrokerLidar:
+    """
+    Drop-in for ydlidar.CYdLidar that reads from the broker.
+
+    doProcessSimple() fills the LaserScan with the newest scan in the ring,
+    so a client that draws slower than the scan rate shows current scans
+    and the ones it skips count as dropped. The scan is copied out of the
+    ring and its slot checked again afterwards; if the broker rewrote the
+    slot during the copy, the copy is thrown away (counted in torn) and the
+    newest scan taken instead.
+    """
+
+    def __init__(self):
+        self.reader = None
+        self.torn = 0
+        self._on = False
+
+    def setlidaropt(self, option, value):
+        return True  # the broker configures the device
+
+    def initialize(self):
+        self.disconnecting()
+        try:
+            self.reader = ScanReader()
+        except (OSError, ConnectionError) as error:
+            print(f"[scan broker] not reachable at {SOCKET_PATH}: {error}")
+            return False
+        print(f"[scan broker] connected to {SOCKET_PATH}: ring of {self.reader.slots} scans")
+        return True
+
+    def turnOn(self):
+        self._on = self.reader is not None
+        return self._on
+
+    def doProcessSimple(self, scan):
+        if not self._on:
+            return False
+        deadline = time.monotonic() + SCAN_TIMEOUT
+        while True:
+            try:
+                frame = self.reader.next(max(deadline - time.monotonic(), 0.0), latest=True)
+            except ConnectionError:
+                self._on = False
+                return False
+            if frame is None:
+                return False
+            points = list(zip(frame.angles.tolist(), frame.ranges.tolist()))
+            if self.reader.valid(frame):
+                break
+            self.torn += 1
+        scan.points = LaserPointVector(LaserPoint(a, r) for a, r in points)
+        scan.stamp = frame.stamp
+        config = scan.config
+        config.scan_time = frame.scan_time
+        config.time_increment = frame.time_increment
+        config.angle_increment = 2 * np.pi / max(len(frame.angles), 1)
+        config.min_range = self.reader.config['min_range']
+        config.max_range = self.reader.config['max_range']
+        return True
+
+    def turnOff(self):
+        self._on = False
+        return True
+
+    def disconnecting(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+    def DescribeError(self):
+        return '' if self.reader is not None else 'broker not connected'
+
+
+def lidarPortList():
+    return {'broker': SOCKET_PATH}
+
+
+def run_broker(path):
+    """Own the LiDAR and publish every scan to the clients."""
+    import ydlidar
+
+    ydlidar.os_init()
+    ports = ydlidar.lidarPortList()
+    device = "/dev/ydlidar"
+    for key, value in ports.items():
+        device = value
+        print(f"Using port: {device}")
+
+    laser = ydlidar.CYdLidar()
+    laser.setlidaropt(ydlidar.LidarPropSerialPort, device)
+    laser.setlidaropt(ydlidar.LidarPropSerialBaudrate, 115200)
+    laser.setlidaropt(ydlidar.LidarPropLidarType, ydlidar.TYPE_TRIANGLE)
+    laser.setlidaropt(ydlidar.LidarPropDeviceType, ydlidar.YDLIDAR_TYPE_SERIAL)
+    laser.setlidaropt(ydlidar.LidarPropScanFrequency, 12.0)
+    laser.setlidaropt(ydlidar.LidarPropSampleRate, 5)
+    laser.setlidaropt(ydlidar.LidarPropSingleChannel, True)
+    laser.setlidaropt(ydlidar.LidarPropMaxAngle, 180.0)
+    laser.setlidaropt(ydlidar.LidarPropMinAngle, -180.0)
+    laser.setlidaropt(ydlidar.LidarPropMaxRange, RMAX_ABSOLUTE)
+    laser.setlidaropt(ydlidar.LidarPropMinRange, RMIN_ABSOLUTE)
+    laser.setlidaropt(ydlidar.LidarPropIntenstiy, False)
+
+    ret = laser.initialize()
+    if ret:
+        # Only once the device is ours, so a failed second start leaves a running broker's socket alone
+        try:
+            broker = ScanBroker(path)
+        except RuntimeError as error:
+            print(f"✗ {error}")
+            laser.disconnecting()
+            return
+        print(f"Scan broker on {path} (ring {broker.ring_path}) - Ctrl+C to stop")
+        ret = laser.turnOn()
+        scan = ydlidar.LaserScan()
+        next_status = time.monotonic() + STATUS_INTERVAL
+        try:
+            while ret and ydlidar.os_isOk():
+                if laser.doProcessSimple(scan):
+                    broker.publish([p.angle for p in scan.points], [p.range for p in scan.points], scan.stamp,
+                                   scan.config.scan_time, scan.config.time_increment)
+                else:
+                    print("Failed to get Lidar Data")
+                if time.monotonic() >= next_status:
+                    print(broker.summary())
+                    next_status += STATUS_INTERVAL
+        except KeyboardInterrupt:
+            pass
+        laser.turnOff()
+        print(broker.summary())
+        broker.close()
+    else:
+        print("✗ Failed to initialize LiDAR!")
+    laser.disconnecting()
+
+
+def _demo_broker(path, seconds, started, results):
+    """Broker process for the demo: simulated scans at 12 Hz, checksums and publish times reported back."""
+    import zlib
+    from simulated_lidar import CYdLidar, LaserScan
+
+    laser = CYdLidar()
+    laser.realtime = True
+    laser.initialize()
+    laser.turnOn()
+    scan = LaserScan()
+    broker = ScanBroker(path)
+    started.set()
+    checksums = {}
+    publish = []
+    end = time.monotonic() + seconds
+    while time.monotonic() < end and laser.doProcessSimple(scan):
+        ranges = np.array([p.range for p in scan.points], dtype=np.float32)
+        angles = np.array([p.angle for p in scan.points], dtype=np.float32)
+        begin = time.perf_counter()
+        sequence = broker.publish(angles, ranges, scan.stamp, scan.config.scan_time, scan.config.time_increment)
+        publish.append(time.perf_counter() - begin)
+        checksums[sequence] = zlib.crc32(ranges.tobytes())
+    results.put((checksums, publish, broker.client_stats(), broker.sequence))
+    time.sleep(0.5)  # let the clients see the last scans before hanging up
+    broker.close()
+
+
+def _demo_client(path, name, delay, latest, results, stall=0.0):
+    """A client reading until the broker goes away; delay is its work per scan in seconds, stall a pause before reading anything."""
+    import zlib
+
+    reader = ScanReader(path, name)
+    seen = {}
+    zero_copy = None
+    time.sleep(stall)
+    try:
+        while True:
+            scan = reader.next(timeout=2.0, latest=latest)
+            if scan is None:
+                break
+            if zero_copy is None:
+                zero_copy = np.shares_memory(scan.ranges, reader.ring.memory)
+            checksum = zlib.crc32(scan.ranges.tobytes())
+            if reader.valid(scan):
+                seen[scan.sequence] = checksum
+            time.sleep(delay)
+    except ConnectionError:
+        pass
+    results.put((name, seen, reader.delivered, reader.dropped, zero_copy))
+    reader.close()
+
+
+def _demo(seconds=6.0):
+    """A simulated broker at 12 Hz with a logger, a display, a slow monitor and a stalled client."""
+    import multiprocessing
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'broker.sock')
+        results = multiprocessing.Queue()
+        started = multiprocessing.Event()
+        broker = multiprocessing.Process(target=_demo_broker, args=(path, seconds, started, results))
+        broker.start()
+        started.wait(10)
+        clients = {'logger': (0.0, False, 0.0), 'display': (0.03, True, 0.0), 'slow monitor': (0.25, False, 0.0),
+                   'stalled': (0.0, False, seconds + 1.0)}
+        processes = [multiprocessing.Process(target=_demo_client, args=(path, name, delay, latest, results, stall))
+                     for name, (delay, latest, stall) in clients.items()]
+        for process in processes:
+            process.start()
+
+        checksums, publish, stats, published = results.get(timeout=seconds + 30)
+        reports = [results.get(timeout=30) for _ in processes]
+        broker.join()
+        for process in processes:
+            process.join()
+
+    publish = np.array(publish) * 1e3
+    print(f"Broker: {published} scans at 12 Hz, publish p50 {np.percentile(publish, 50):.3f} ms, "
+          f"max {publish.max():.3f} ms with {len(clients)} clients (one not reading until the broker stops)")
+    lag = {s.name: s for s in stats}
+    for name, seen, delivered, dropped, zero_copy in sorted(reports):
+        bad = sum(checksums.get(sequence) != checksum for sequence, checksum in seen.items())
+        at_end = lag.get(name)
+        print(f"{name:13s} delivered {delivered:3d} | dropped {dropped:3d} | "
+              f"lag at end {at_end.lag if at_end else '?':>3} scans | corrupted {bad} | "
+              f"zero-copy views {'yes' if zero_copy else 'n/a' if zero_copy is None else 'no'}")
+
+    # A second broker on the same socket must not start, nor take the socket from the first
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'broker.sock')
+        first = ScanBroker(path)
+        try:
+            ScanBroker(path).close()
+            raise AssertionError("second broker started on a live socket")
+        except RuntimeError:
+            pass
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(path)  # FileNotFoundError if the second start removed the first broker's socket
+        client.close()
+        first.close()
+        # A socket left behind by a broker that died is taken over
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+        ScanBroker(path).close()
+        assert not os.path.exists(path)
+    print("Second broker on a live socket refused; stale socket taken over")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Share one LiDAR between several scripts")
+    parser.add_argument('--socket', default=SOCKET_PATH, help="Unix socket the clients connect to")
+    parser.add_argument('--demo', action='store_true', help="simulated broker with four clients, no device")
+    args = parser.parse_args()
+
+    if args.demo:
+        _demo()
+    else:
+        run_broker(args.socket)
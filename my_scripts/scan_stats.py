@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Scan Stats - rate-limited aggregated reporting for the console test tools
+The scan loop only records a few numbers per scan; a background thread
+turns the last few seconds of them into one summary line at a fixed rate
+(scan rate, interval jitter, points, failures, closest obstacle), so a slow
+serial console or SSH session no longer throttles the loop it is measuring.
+Optionally every summary is also appended to a JSON-lines file for soak
+tests.
+
+Run directly for a demo on a simulated 12 Hz source.
+"""
+import collections
+import json
+import sys
+import threading
+import time
+
+import numpy as np
+
+REPORT_INTERVAL = 1.0  # Seconds between summary lines
+WINDOW = 5.0           # Seconds of history each summary covers
+MAX_SCANS = 4096       # Ring size - comfortably more than WINDOW at any scan rate
+
+
+def min_clearance(angles, ranges, half_width, half_length):
+    """Distance from the closest return to the footprint rectangle (np.inf if there is none)."""
+    angles = np.asarray(angles, dtype=float)
+    ranges = np.asarray(ranges, dtype=float)
+    valid = ranges > 0
+    if not valid.any():
+        return np.inf
+    a = angles[valid]
+    r = ranges[valid]
+    dx = np.maximum(np.abs(r * np.cos(a)) - half_width, 0.0)
+    dy = np.maximum(np.abs(r * np.sin(a)) - half_length, 0.0)
+    return float(np.hypot(dx, dy).min())
+
+
+class ScanStatsReporter:
+    """
+    Rolling-window scan statistics printed from a background thread.
+
+    record() and failure() are all the scan loop calls: each is a lock, a
+    few array writes and no I/O. Use as a context manager, or call start()
+    and stop(); stop() prints a final line with the run totals.
+    """
+
+    def __init__(self, label='scan', interval=REPORT_INTERVAL, window=WINDOW, jsonl=None, stream=sys.stdout,
+                 max_scans=MAX_SCANS):
+        self.label = label
+        self.interval = interval
+        self.window = window
+        self.stream = stream
+        self.jsonl = open(jsonl, 'a') if jsonl else None
+
+        self._lock = threading.Lock()
+        self._times = np.zeros(max_scans)
+        self._points = np.zeros(max_scans, dtype=np.int64)
+        self._clearance = np.full(max_scans, np.inf)
+        self._failures = collections.deque()
+        self._head = 0
+        self._count = 0
+        self.total_scans = 0
+        self.total_failures = 0
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='scan-stats', daemon=True)
+        self._started = None
+
+    def record(self, n_points, clearance=np.inf):
+        """One successful scan: point count and closest obstacle distance (meters)."""
+        now = time.monotonic()
+        with self._lock:
+            i = self._head
+            self._times[i] = now
+            self._points[i] = n_points
+            self._clearance[i] = clearance
+            self._head = (i + 1) % len(self._times)
+            self._count = min(self._count + 1, len(self._times))
+            self.total_scans += 1
+
+    def failure(self):
+        now = time.monotonic()
+        with self._lock:
+            self._failures.append(now)
+            self.total_failures += 1
+
+    def summary(self, now=None):
+        """Statistics over the last `window` seconds as a dict."""
+        now = time.monotonic() if now is None else now
+        cutoff = now - self.window
+        with self._lock:
+            n = self._count
+            order = (np.arange(self._head - n, self._head)) % len(self._times)
+            times = self._times[order]
+            points = self._points[order]
+            clearance = self._clearance[order]
+            while self._failures and self._failures[0] < cutoff:
+                self._failures.popleft()
+            failures = len(self._failures)
+            total_scans, total_failures = self.total_scans, self.total_failures
+
+        recent = times >= cutoff
+        times, points, clearance = times[recent], points[recent], clearance[recent]
+        stats = dict(time=time.time(), label=self.label, window_s=self.window, scans=len(times),
+                     failures=failures, total_scans=total_scans, total_failures=total_failures,
+                     rate_hz=None, jitter_ms=None, max_gap_ms=None,
+                     points_mean=None, points_min=None, points_max=None, min_clearance_m=None)
+        if len(times) >= 2:
+            gaps = np.diff(times)
+            stats.update(rate_hz=(len(times) - 1) / (times[-1] - times[0]),
+                         jitter_ms=float(gaps.std() * 1e3), max_gap_ms=float(gaps.max() * 1e3))
+        if len(points):
+            stats.update(points_mean=float(points.mean()), points_min=int(points.min()), points_max=int(points.max()))
+            if np.isfinite(clearance).any():
+                stats['min_clearance_m'] = float(clearance.min())
+        return stats
+
+    def _line(self, stats):
+        def fmt(value, spec, unit=''):
+            return '--' if value is None else f"{value:{spec}}{unit}"
+
+        return (f"[{self.label}] {fmt(stats['rate_hz'], '.2f', ' Hz')} | "
+                f"jitter {fmt(stats['jitter_ms'], '.1f', ' ms')} (max gap {fmt(stats['max_gap_ms'], '.0f', ' ms')}) | "
+                f"points {fmt(stats['points_mean'], '.0f')} [{fmt(stats['points_min'], 'd')}-"
+                f"{fmt(stats['points_max'], 'd')}] | failures {stats['failures']} | "
+                f"closest {fmt(stats['min_clearance_m'], '.2f', ' m')} | total {stats['total_scans']}")
+
+    def report(self):
+        stats = self.summary()
+        # One write per line so the summary never interleaves with other output
+        self.stream.write(self._line(stats) + '\n')
+        self.stream.flush()
+        if self.jsonl is not None:
+            self.jsonl.write(json.dumps(stats) + '\n')
+            self.jsonl.flush()
+        return stats
+
+    def _run(self):
+        next_report = time.monotonic() + self.interval
+        while not self._stop.wait(max(0.0, next_report - time.monotonic())):
+            self.report()
+            next_report += self.interval
+
+    def start(self):
+        self._started = time.monotonic()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._started is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        elapsed = time.monotonic() - self._started
+        self.stream.write(f"[{self.label}] {self.total_scans} scans, {self.total_failures} failures in "
+                          f"{elapsed:.1f} s ({self.total_scans / max(elapsed, 1e-9):.2f} scans/s overall)\n")
+        self.stream.flush()
+        if self.jsonl is not None:
+            self.jsonl.close()
+        self._started = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _demo(seconds=3.5):
+    """Simulated 12 Hz TOF source with timing jitter and occasional failed reads."""
+    import os
+    import tempfile
+    from synthetic_scans import TOF_POINTS, default_room, generate_scan, random_walk_poses
+
+    rng = np.random.default_rng(0)
+    room = default_room()
+    poses = random_walk_poses(int(seconds * 12) + 12, rng=rng, bounds=1.0)
+    path = os.path.join(tempfile.mkdtemp(), 'soak.jsonl')
+
+    record_times = []
+    with ScanStatsReporter('demo', jsonl=path) as stats:
+        end = time.monotonic() + seconds
+        k = 0
+        while time.monotonic() < end:
+            time.sleep(max(0.0, rng.normal(1 / 12.0, 0.004)))
+            if rng.random() < 0.03:
+                stats.failure()
+                continue
+            angles, ranges = generate_scan(poses[k], room, n_points=TOF_POINTS - rng.integers(0, 40), rng=rng)
+            clearance = min_clearance(angles, ranges, 0.25, 0.30)
+            start = time.perf_counter()
+            stats.record(len(angles), clearance)
+            record_times.append(time.perf_counter() - start)
+            k += 1
+
+    with open(path) as f:
+        lines = f.readlines()
+    print(f"record() cost: {np.median(record_times) * 1e6:.1f} us median | JSON lines written: {len(lines)} -> {path}")
+    print(f"Last line: {lines[-1].strip()}")
+
+
+if __name__ == "__main__":
+    _demo()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Scan Trail - the last few scans as one fading point cloud
+While driving, a single scan only shows what is in view right now; a short
+trail of previous scans makes walls and obstacles easier to read. Drawing
+it with one scatter call per scan would grow the artist count with the
+trail length, so every trail point lives in one fixed-capacity ring
+(odometry-frame position plus the scan it came from) and the whole trail
+is a single PathCollection whose offsets and alphas are rewritten in place
+for the current chair pose. Consecutive scans mostly see the same walls,
+so only the newest trail point per 5 cm cell is drawn.
+
+Memory and draw cost depend only on the capacity, not on how long the
+session has run.
+
+Run directly to compare against one scatter per scan on Agg.
+"""
+import time
+
+import numpy as np
+from matplotlib.colors import to_rgba
+
+TRAIL_SCANS = 8        # Previous scans kept in the trail (0 = no trail)
+MAX_POINTS = 720       # Points kept per scan; longer scans are thinned evenly
+TRAIL_COLOR = '#7fb3d5'
+TRAIL_ALPHA = 0.5      # Alpha of the most recent trail scan, fading linearly to 0
+TRAIL_VOXEL = 0.05     # Meters; per grid cell only the newest trail point is drawn
+
+
+class ScanTrail:
+    """
+    Ring of the last `scans` scans, drawn as one animated scatter on ax.
+
+    push() stores a scan at the chair pose it was taken from (odometry
+    frame, as accumulated with compose_pose); update() re-projects the ring
+    into the current chair frame and refreshes the collection. Call
+    update() before pushing the current scan, so the trail shows only
+    previous scans. moved() tells when the trail drawn in full last time
+    has shifted on screen, so a partial redraw would leave it misplaced.
+    """
+
+    def __init__(self, ax, scans=TRAIL_SCANS, max_points=MAX_POINTS, color=TRAIL_COLOR, alpha=TRAIL_ALPHA,
+                 voxel=TRAIL_VOXEL, size=6, zorder=5, max_range=8.0):
+        self.scans = scans
+        self.max_points = max_points
+        self.alpha = alpha
+        self.voxel = voxel
+        self.max_range = max_range
+        capacity = scans * max_points
+        self._xy = np.zeros((capacity, 2))
+        self._stamp = np.full(capacity, -1, dtype=np.int64)  # Scan number of each slot, -1 = empty
+        self._head = 0
+        self.pushed = 0
+        self._shown = 0
+        self.pose = None        # Pose of the last update()
+        self.drawn_pose = None  # Pose of the last update() shown in full by visible_in()
+
+        # Work buffers handed to the collection; only their first n rows are shown
+        self._offsets = np.zeros((capacity, 2))
+        self._colors = np.tile(to_rgba(color), (capacity, 1))
+        self.collection = ax.scatter([], [], s=size, linewidths=0, zorder=zorder, animated=True)
+
+    def push(self, angles, ranges, pose):
+        """Add one scan (sensor-frame angles and ranges) taken at pose (x, y, theta)."""
+        if self.scans == 0:
+            return
+        a = np.asarray(angles, dtype=float)
+        r = np.asarray(ranges, dtype=float)
+        valid = (r > 0) & (r <= self.max_range)
+        a, r = a[valid], r[valid]
+        if len(a) > self.max_points:
+            keep = np.linspace(0, len(a) - 1, self.max_points).astype(np.intp)
+            a, r = a[keep], r[keep]
+
+        x, y, theta = pose
+        world = a + theta
+        slots = (self._head + np.arange(len(a))) % len(self._stamp)
+        self._xy[slots, 0] = x + r * np.cos(world)
+        self._xy[slots, 1] = y + r * np.sin(world)
+        self._stamp[slots] = self.pushed
+        self._head = (self._head + len(a)) % len(self._stamp)
+        self.pushed += 1
+
+    def update(self, pose):
+        """Project the trail into the frame of pose and refresh the collection; returns the point count."""
+        age = self.pushed - 1 - self._stamp
+        live = np.flatnonzero((self._stamp >= 0) & (age < self.scans))
+        if self.voxel > 0 and len(live):
+            # Walls seen in consecutive scans overlap; per-point colors are the
+            # slow path in Agg, so only the newest point of each cell is drawn
+            cells = np.floor(self._xy[live] / self.voxel).astype(np.int64)
+            keys = (cells[:, 0] << 32) + (cells[:, 1] & 0xFFFFFFFF)
+            order = np.lexsort((age[live], keys))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = keys[order[1:]] != keys[order[:-1]]
+            live = live[order[first]]
+        n = len(live)
+
+        x, y, theta = pose
+        dx = self._xy[live, 0] - x
+        dy = self._xy[live, 1] - y
+        c, s = np.cos(theta), np.sin(theta)
+        local_x = c * dx + s * dy
+        local_y = -s * dx + c * dy
+        self._offsets[:n, 0] = np.arctan2(local_y, local_x)
+        self._offsets[:n, 1] = np.hypot(local_x, local_y)
+        self._colors[:n, 3] = self.alpha * (1.0 - age[live] / max(self.scans, 1))
+        self._shown = n
+        self.pose = pose
+        self._select(None)
+        return n
+
+    def moved(self, pose, ax, rmax, tolerance=0.5):
+        """
+        Whether projecting to pose shifts trail points within rmax by at
+        least tolerance pixels of ax from where they were last shown in full.
+        """
+        if self.drawn_pose is None:
+            return self.pushed > 0
+        x, y, theta = self.drawn_pose
+        turn = (pose[2] - theta + np.pi) % (2 * np.pi) - np.pi
+        shift = np.hypot(pose[0] - x, pose[1] - y) + rmax * abs(turn)
+        return shift * ax.bbox.height / (2 * rmax) >= tolerance
+
+    def visible_in(self, ax, bbox=None, pad=4):
+        """
+        Limit the collection to the points whose markers reach into bbox
+        (display pixels), for a partial redraw; bbox None shows them all.
+        """
+        if bbox is None:
+            self.drawn_pose = self.pose
+        self._select(ax, bbox, pad)
+
+    def _select(self, ax, bbox=None, pad=4):
+        offsets = self._offsets[:self._shown]
+        colors = self._colors[:self._shown]
+        if bbox is not None:
+            xy = ax.transData.transform(offsets)
+            inside = ((xy[:, 0] >= bbox.x0 - pad) & (xy[:, 0] <= bbox.x1 + pad)
+                      & (xy[:, 1] >= bbox.y0 - pad) & (xy[:, 1] <= bbox.y1 + pad))
+            offsets, colors = offsets[inside], colors[inside]
+        self.collection.set_offsets(offsets)
+        self.collection.set_facecolors(colors)
+
+    def clear(self):
+        self._stamp[:] = -1
+        self._head = 0
+        self._shown = 0
+        self.drawn_pose = None
+
+    def nbytes(self):
+        return self._xy.nbytes + self._stamp.nbytes + self._offsets.nbytes + self._colors.nbytes
+
+
+def _benchmark(session_lengths=(50, 500, 2000), frames=60):
+    """Per-frame draw cost of one scatter per trail scan against the ring, for several session lengths."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from synthetic_scans import default_room, generate_scan, random_walk_poses
+
+    rng = np.random.default_rng(0)
+    room = default_room()
+    poses = random_walk_poses(max(session_lengths) + frames, rng=rng, bounds=1.0)
+    scans = [generate_scan(pose, room, rng=rng) for pose in poses]
+
+    fig = plt.figure(figsize=(10, 10))
+    ax = plt.subplot(polar=True)
+    ax.set_ylim(0, 8)
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(fig.bbox)
+
+    print(f"Trail: {TRAIL_SCANS} scans | {len(scans[0][0])} points/scan | {frames} frames timed")
+
+    # Before: one scatter per previous scan, re-projected and recreated every frame
+    start = time.perf_counter()
+    for k in range(TRAIL_SCANS, TRAIL_SCANS + frames):
+        fig.canvas.restore_region(background)
+        x, y, theta = poses[k]
+        for age in range(TRAIL_SCANS):
+            a, r = scans[k - 1 - age]
+            px, py, pt = poses[k - 1 - age]
+            valid = r > 0
+            wx = px + r[valid] * np.cos(a[valid] + pt) - x
+            wy = py + r[valid] * np.sin(a[valid] + pt) - y
+            lx = np.cos(theta) * wx + np.sin(theta) * wy
+            ly = -np.sin(theta) * wx + np.cos(theta) * wy
+            artist = ax.scatter(np.arctan2(ly, lx), np.hypot(lx, ly), s=6, linewidths=0, color=TRAIL_COLOR,
+                                alpha=TRAIL_ALPHA * (1 - age / TRAIL_SCANS), animated=True)
+            ax.draw_artist(artist)
+            artist.remove()
+        fig.canvas.blit(fig.bbox)
+    per_scan = (time.perf_counter() - start) / frames
+    print(f"One scatter per scan: {per_scan * 1e3:6.2f} ms/frame ({TRAIL_SCANS} artists)")
+
+    # After: the ring, after sessions of different length
+    for length in session_lengths:
+        trail = ScanTrail(ax)
+        for k in range(length):
+            trail.push(*scans[k], poses[k])
+        start = time.perf_counter()
+        for k in range(length, length + frames):
+            fig.canvas.restore_region(background)
+            n = trail.update(poses[k])
+            ax.draw_artist(trail.collection)
+            fig.canvas.blit(fig.bbox)
+            trail.push(*scans[k], poses[k])
+        ring = (time.perf_counter() - start) / frames
+        print(f"Ring after {length:5d} scans: {ring * 1e3:6.2f} ms/frame | {n} points drawn | "
+              f"{trail.nbytes() / 1024:.0f} KiB")
+        trail.collection.remove()
+    plt.close(fig)
+
+
+if __name__ == "__main__":
+    _benchmark()
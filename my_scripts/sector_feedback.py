@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Sector Feedback - compact clearance packets for haptic/audio devices
+Reduces each scan to K angular sectors of minimum clearance to the wheelchair
+footprint in one vectorized pass and sends it as a fixed-size binary packet
+over local UDP or a serial port, at the scan rate and without any plotting.
+
+Usage:
+    python3 sector_feedback.py --udp 127.0.0.1:5005
+    python3 sector_feedback.py --serial /dev/ttyACM0
+    python3 sector_feedback.py --simulate          # no device: latency benchmark
+
+Packet layout (little endian, 20 + 2*K bytes):
+    magic  'LS'   2 bytes
+    version       u8
+    sectors       u8   K
+    sequence      u32  scan counter
+    stamp_us      u64  scan timestamp in microseconds
+    flags         u8   bit 0: some sector inside DANGER_ZONE
+                       bit 1: some sector inside CAUTION_ZONE
+    reserved      3 bytes
+    clearance     K x u16, millimeters; sector 0 is centered on the front
+                  and sectors go the same way as the scan angles.
+                  0xFFFF = no return in that sector
+"""
+import argparse
+import socket
+import struct
+import time
+
+import numpy as np
+
+from latency_trace import LatencyTrace
+from profiling_hook import ProfilingHook
+
+# ============== CONFIGURATION PARAMETERS ==============
+N_SECTORS = 8            # Belt motors / audio channels - EASILY ADJUSTABLE
+WHEELCHAIR_WIDTH = .50   # Width in meters
+WHEELCHAIR_LENGTH = .60  # Length in meters
+DANGER_ZONE = 0.20       # RED zone (meters from the wheelchair boundary)
+CAUTION_ZONE = 0.70      # YELLOW zone
+MAX_RANGE = 8.0          # Returns beyond this are ignored
+# ======================================================
+
+PACKET_MAGIC = b'LS'
+PACKET_VERSION = 1
+NO_RETURN = 0xFFFF
+FLAG_DANGER = 0x01
+FLAG_CAUTION = 0x02
+MAX_SECTORS = 0xFF  # The sector count is a u8 in the header
+_HEADER = struct.Struct('<2sBBIQB3x')
+
+
+class SectorSummarizer:
+    """Minimum footprint clearance per angular sector."""
+
+    def __init__(self, n_sectors=N_SECTORS, half_width=WHEELCHAIR_WIDTH / 2.0,
+                 half_length=WHEELCHAIR_LENGTH / 2.0, max_range=MAX_RANGE):
+        if not 1 <= n_sectors <= MAX_SECTORS:
+            raise ValueError(f"n_sectors must be between 1 and {MAX_SECTORS}, got {n_sectors}")
+        self.n_sectors = n_sectors
+        self.half_width = half_width
+        self.half_length = half_length
+        self.max_range = max_range
+        self._sector_width = 2 * np.pi / n_sectors
+        self._all_sectors = np.arange(n_sectors)
+
+    def summarize(self, angles, ranges):
+        """
+        (K,) minimum clearance in meters per sector, np.inf where the sector has no return.
+
+        Clearance is the distance from each return to the footprint rectangle,
+        the same measure that drives the viewers' red/yellow/green colors.
+        """
+        angles = np.asarray(angles, dtype=float)
+        ranges = np.asarray(ranges, dtype=float)
+        valid = np.isfinite(ranges) & (ranges > 0) & (ranges <= self.max_range)
+        a = angles[valid]
+        r = ranges[valid]
+
+        dx = np.maximum(np.abs(r * np.cos(a)) - self.half_width, 0.0)
+        dy = np.maximum(np.abs(r * np.sin(a)) - self.half_length, 0.0)
+        clearance = np.hypot(dx, dy)
+
+        # Sector 0 is centered on the front; sort by sector so each one is a
+        # contiguous run, then reduce every run in a single reduceat call
+        sector = np.floor((a + self._sector_width / 2) / self._sector_width).astype(np.intp) % self.n_sectors
+        order = np.argsort(sector, kind='stable')
+        sector = sector[order]
+        clearance = clearance[order]
+
+        summary = np.full(self.n_sectors, np.inf)
+        if len(clearance):
+            # Only occupied sectors get a start index: reduceat needs them
+            # strictly increasing, and the last run extends to the end
+            occupied = np.bincount(sector, minlength=self.n_sectors) > 0
+            starts = np.searchsorted(sector, self._all_sectors[occupied])
+            summary[occupied] = np.minimum.reduceat(clearance, starts)
+        return summary
+
+
+def encode_packet(summary, sequence, stamp_us, danger_zone=DANGER_ZONE, caution_zone=CAUTION_ZONE):
+    """Pack a sector summary into the fixed-size wire format."""
+    closest = np.min(summary) if len(summary) else np.inf
+    flags = (FLAG_DANGER if closest <= danger_zone else 0) | (FLAG_CAUTION if closest <= caution_zone else 0)
+    millimeters = np.where(np.isfinite(summary), np.round(summary * 1000.0), NO_RETURN)
+    millimeters = np.clip(millimeters, 0, NO_RETURN).astype('<u2')
+    header = _HEADER.pack(PACKET_MAGIC, PACKET_VERSION, len(summary), sequence & 0xFFFFFFFF,
+                          int(stamp_us) & 0xFFFFFFFFFFFFFFFF, flags)
+    return header + millimeters.tobytes()
+
+
+def decode_packet(packet):
+    """Inverse of encode_packet: (sequence, stamp_us, flags, clearance in meters)."""
+    magic, version, n_sectors, sequence, stamp_us, flags = _HEADER.unpack_from(packet)
+    if magic != PACKET_MAGIC or version != PACKET_VERSION:
+        raise ValueError("Not a sector feedback packet")
+    millimeters = np.frombuffer(packet, dtype='<u2', count=n_sectors, offset=_HEADER.size)
+    clearance = np.where(millimeters == NO_RETURN, np.inf, millimeters / 1000.0)
+    return sequence, stamp_us, flags, clearance
+
+
+class UdpSender:
+    """Fire-and-forget datagrams to a local listener; never blocks the scan loop."""
+
+    def __init__(self, host, port):
+        self.address = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.dropped = 0
+
+    def send(self, packet):
+        try:
+            self.sock.sendto(packet, self.address)
+        except (BlockingIOError, ConnectionRefusedError):
+            self.dropped += 1
+
+    def close(self):
+        self.sock.close()
+
+
+class SerialSender:
+    """Packets over a serial link (needs pyserial); stale packets are dropped, not queued."""
+
+    def __init__(self, port, baudrate=115200):
+        try:
+            import serial
+        except ImportError:
+            raise SystemExit("Serial output needs pyserial: pip3 install pyserial")
+        self.port = serial.Serial(port, baudrate, timeout=0, write_timeout=0)
+        self.dropped = 0
+
+    def send(self, packet):
+        # If the device has not drained the previous packet, skip this one
+        # rather than building latency in the OS buffer
+        if self.port.out_waiting > len(packet):
+            self.dropped += 1
+            return
+        try:
+            self.port.write(packet)
+        except Exception:
+            self.dropped += 1
+
+    def close(self):
+        self.port.close()
+
+
+class LatencyStats:
+    """Latency samples (seconds), summarized every few seconds."""
+
+    def __init__(self, report_every=2.0):
+        self.report_every = report_every
+        self.samples = []
+        self.last_report = time.monotonic()
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        now = time.monotonic()
+        if now - self.last_report >= self.report_every and self.samples:
+            ms = np.array(self.samples) * 1e3
+            print(f"Packets: {len(ms):4d} | latency p50 {np.percentile(ms, 50):.3f} ms, "
+                  f"p99 {np.percentile(ms, 99):.3f} ms, max {ms.max():.3f} ms")
+            self.samples.clear()
+            self.last_report = now
+
+
+def run_device(sender, summarizer):
+    """Scan loop on the real LiDAR: one packet per scan, no plotting."""
+    import ydlidar
+
+    ydlidar.os_init()
+    ports = ydlidar.lidarPortList()
+    port = "/dev/ydlidar"
+    for key, value in ports.items():
+        port = value
+        print(f"Using port: {port}")
+
+    laser = ydlidar.CYdLidar()
+    laser.setlidaropt(ydlidar.LidarPropSerialPort, port)
+    laser.setlidaropt(ydlidar.LidarPropSerialBaudrate, 115200)
+    laser.setlidaropt(ydlidar.LidarPropLidarType, ydlidar.TYPE_TRIANGLE)
+    laser.setlidaropt(ydlidar.LidarPropDeviceType, ydlidar.YDLIDAR_TYPE_SERIAL)
+    laser.setlidaropt(ydlidar.LidarPropScanFrequency, 12.0)
+    laser.setlidaropt(ydlidar.LidarPropSampleRate, 5)
+    laser.setlidaropt(ydlidar.LidarPropSingleChannel, True)
+    laser.setlidaropt(ydlidar.LidarPropMaxAngle, 180.0)
+    laser.setlidaropt(ydlidar.LidarPropMinAngle, -180.0)
+    laser.setlidaropt(ydlidar.LidarPropMaxRange, MAX_RANGE)
+    laser.setlidaropt(ydlidar.LidarPropMinRange, 0.08)
+    laser.setlidaropt(ydlidar.LidarPropIntenstiy, False)
+
+    stats = LatencyStats()
+    profiling = ProfilingHook('sector_feedback')  # kill -USR1 <pid> to profile the scan loop
+    # End-to-end from scan.stamp (start of the revolution) to the packet leaving; kill -USR2 <pid> exports a trace
+    latency = LatencyTrace('sector_feedback')
+    ret = laser.initialize()
+    if ret:
+        ret = laser.turnOn()
+        scan = ydlidar.LaserScan()
+        sequence = 0
+        while ret and ydlidar.os_isOk():
+            if laser.doProcessSimple(scan):
+                trace_id = latency.begin(scan.stamp)
+                angles = np.fromiter((p.angle for p in scan.points), dtype=float, count=scan.points.size())
+                ranges = np.fromiter((p.range for p in scan.points), dtype=float, count=scan.points.size())
+                packet = encode_packet(summarizer.summarize(angles, ranges), sequence, scan.stamp // 1000)
+                latency.mark(trace_id, 'process')
+                sender.send(packet)
+                stats.add(latency.end(trace_id))
+                sequence += 1
+            else:
+                print("Failed to get Lidar Data")
+        laser.turnOff()
+    else:
+        print("✗ Failed to initialize LiDAR!")
+    laser.disconnecting()
+    print(f"Scan to packet: {latency.summary()}")
+
+
+def run_simulated(sender, summarizer, n_scans=600, n_points=500):
+    """
+    Benchmark the same path on generated scans: summarize, encode, send.
+
+    Generated scans have no acquisition time, so this is the processing
+    part of the latency only; run_device() measures from scan.stamp.
+    """
+    from synthetic_scans import default_room, generate_scan, random_walk_poses
+
+    rng = np.random.default_rng(0)
+    room = default_room()
+    scans = [generate_scan(pose, room, n_points=n_points, rng=rng)
+             for pose in random_walk_poses(n_scans, rng=rng, bounds=1.0)]
+    latencies = np.empty(n_scans)
+    for sequence, (angles, ranges) in enumerate(scans):
+        received = time.perf_counter()
+        packet = encode_packet(summarizer.summarize(angles, ranges), sequence, time.time_ns() // 1000)
+        sender.send(packet)
+        latencies[sequence] = time.perf_counter() - received
+    ms = latencies * 1e3
+    print(f"Scans: {n_scans} | Points/scan: {n_points} | Packet: {len(packet)} bytes")
+    print(f"Processing latency (summarize, encode, send): p50 {np.percentile(ms, 50):.3f} ms, p99 {np.percentile(ms, 99):.3f} ms, "
+          f"max {ms.max():.3f} ms")
+    print(f"Last packet: {decode_packet(packet)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send per-sector clearance packets for haptic/audio feedback")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--udp', default='127.0.0.1:5005', help="host:port of the feedback unit (default %(default)s)")
+    target.add_argument('--serial', help="serial port of the feedback unit, e.g. /dev/ttyACM0")
+    parser.add_argument('--baudrate', type=int, default=115200)
+    parser.add_argument('--sectors', type=int, default=N_SECTORS, help=f"1 to {MAX_SECTORS} (default %(default)s)")
+    parser.add_argument('--simulate', action='store_true', help="use generated scans instead of the LiDAR")
+    args = parser.parse_args()
+    if not 1 <= args.sectors <= MAX_SECTORS:
+        parser.error(f"--sectors must be between 1 and {MAX_SECTORS}")
+
+    if args.serial:
+        sender = SerialSender(args.serial, args.baudrate)
+    else:
+        host, port = args.udp.rsplit(':', 1)
+        sender = UdpSender(host, int(port))
+    summarizer = SectorSummarizer(n_sectors=args.sectors)
+
+    try:
+        if args.simulate:
+            run_simulated(sender, summarizer)
+        else:
+            run_device(sender, summarizer)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Dropped packets: {sender.dropped}")
+        sender.close()
@@ -0,0 +1,12 @@
+"""
+Stand-in for the ydlidar SDK backed by simulated_lidar.
+
+run.sh --sim puts this directory first on PYTHONPATH, so the scripts'
+`import ydlidar` gets the simulator without any change to them.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulated_lidar import *  # noqa: E402,F401,F403
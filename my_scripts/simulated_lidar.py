@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Simulated LiDAR - ray-cast scans from a world file, behind the ydlidar API
+Load tests at TOF-scale point counts, or a crowded doorway, should not need
+the device and a real room. This module ray-casts every beam of a
+revolution against every wall and agent segment in one batched NumPy
+evaluation (synthetic_scans.raycast), adds range noise, dropouts and the
+MinRange/MaxRange clipping the device applies, and serves the result
+through the CYdLidar / LaserScan calls the scripts use:
+
+    ./run.sh --sim plot_tri_maxfreq.py                      # default room
+    LIDAR_SIM_WORLD=worlds/doorway.json ./run.sh --sim PlotMoving_Adaptive_Lidar_system.py
+    LIDAR_SIM_REALTIME=0 ./run.sh --sim tri_test_maxfreq.py --stats   # as fast as possible
+    LIDAR_SIM_WORLD=worlds/open.json ./run.sh --sim PlotMoving_Adaptive_Lidar_system.py   # no returns
+
+--sim puts sim/ydlidar.py (a re-export of this module) ahead of the real
+SDK. Scan frequency, sample rate and range limits come from the scripts'
+own setlidaropt() calls.
+
+World files are JSON, in meters and radians:
+
+    {"walls":    [[[x, y], [x, y], ...], ...],    open polylines
+     "polygons": [[[x, y], [x, y], ...], ...],    closed outlines (furniture, pillars)
+     "agents":   [{"path": [[x, y], ...], "speed": 1.2, "radius": 0.25}, ...],
+     "sensor":   {"pose": [x, y, theta]}  or  {"path": [[x, y], ...], "speed": 0.5}}
+
+Agents walk their path back and forth; a sensor on a path faces along it.
+Each beam is cast from the sensor pose at its own time in the revolution,
+so a moving sensor produces the same skew as the device.
+
+Run directly to measure simulated scan rates against real time.
+"""
+import argparse
+import json
+import os
+import signal
+import time
+
+import numpy as np
+
+from synthetic_scans import default_room, raycast
+
+SCAN_FREQUENCY = 12.0  # Hz, until setlidaropt() says otherwise
+SAMPLE_RATE = 5        # kHz
+MIN_RANGE = 0.08       # m
+MAX_RANGE = 8.0        # m
+NOISE_STD = 0.01       # m, Gaussian range noise
+DROPOUT = 0.01         # Fraction of beams that randomly return nothing
+AGENT_SIDES = 8        # Agents are drawn as regular polygons with this many sides
+
+# ydlidar constants the scripts pass to setlidaropt(); the values only need to be distinct
+(LidarPropSerialPort, LidarPropSerialBaudrate, LidarPropLidarType, LidarPropDeviceType,
+ LidarPropScanFrequency, LidarPropSampleRate, LidarPropSingleChannel, LidarPropMaxAngle,
+ LidarPropMinAngle, LidarPropMaxRange, LidarPropMinRange, LidarPropIntenstiy) = range(12)
+TYPE_TOF, TYPE_TRIANGLE = 0, 1
+YDLIDAR_TYPE_SERIAL = 0
+
+
+class PathMover:
+    """Constant-speed motion along a polyline, back and forth."""
+
+    def __init__(self, waypoints, speed):
+        self.waypoints = np.asarray(waypoints, dtype=float).reshape(-1, 2)
+        self.speed = float(speed)
+        lengths = np.hypot(*np.diff(self.waypoints, axis=0).T)
+        self._distance = np.concatenate([[0.0], np.cumsum(lengths)])
+
+    def at(self, t):
+        """Positions (len(t), 2) and headings (len(t),) at times t (seconds)."""
+        t = np.atleast_1d(np.asarray(t, dtype=float))
+        total = self._distance[-1]
+        if total <= 0:
+            return np.repeat(self.waypoints[:1], len(t), axis=0), np.zeros(len(t))
+        # Ping-pong: distance along the path folds back at both ends
+        d = np.mod(self.speed * t, 2 * total)
+        backward = d > total
+        d = np.where(backward, 2 * total - d, d)
+        i = np.clip(np.searchsorted(self._distance, d, side='right') - 1, 0, len(self.waypoints) - 2)
+        a, b = self.waypoints[i], self.waypoints[i + 1]
+        f = ((d - self._distance[i]) / np.maximum(self._distance[i + 1] - self._distance[i], 1e-12))[:, None]
+        direction = b - a
+        heading = np.arctan2(direction[:, 1], direction[:, 0]) + np.where(backward, np.pi, 0.0)
+        return a + f * direction, heading
+
+
+class World:
+    """Static segments, moving agents and the sensor's pose over time."""
+
+    def __init__(self, segments, agents=(), sensor_pose=(0.0, 0.0, 0.0), sensor_path=None):
+        self.segments = np.asarray(segments, dtype=float).reshape(-1, 4)
+        self.agents = [(PathMover(agent['path'], agent.get('speed', 1.0)), agent.get('radius', 0.25))
+                       for agent in agents]
+        self.sensor_pose = tuple(sensor_pose)
+        self.sensor_path = sensor_path
+        angles = np.linspace(0.0, 2 * np.pi, AGENT_SIDES + 1)
+        self._outline = np.column_stack([np.cos(angles), np.sin(angles)])
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            spec = json.load(f)
+        segments = []
+        for line in spec.get('walls', []):
+            points = np.asarray(line, dtype=float)
+            segments.append(np.hstack([points[:-1], points[1:]]))
+        for outline in spec.get('polygons', []):
+            points = np.asarray(outline, dtype=float)
+            segments.append(np.hstack([points, np.roll(points, -1, axis=0)]))
+        sensor = spec.get('sensor', {})
+        path = PathMover(sensor['path'], sensor.get('speed', 0.5)) if 'path' in sensor else None
+        return cls(np.vstack(segments) if segments else np.empty((0, 4)), spec.get('agents', []),
+                   sensor.get('pose', (0.0, 0.0, 0.0)), path)
+
+    @classmethod
+    def default(cls):
+        """The synthetic default room with two people walking through it and a parked sensor."""
+        return cls(default_room(), [{'path': [[-3.0, 0.8], [3.0, 0.8]], 'speed': 1.1},
+                                    {'path': [[0.5, -2.5], [0.5, 1.0], [-2.5, 1.0]], 'speed': 0.8}])
+
+    def segments_at(self, t):
+        """Static segments plus the agents' outlines at time t."""
+        if not self.agents:
+            return self.segments
+        centers = np.vstack([mover.at(t)[0] for mover, _ in self.agents])
+        radii = np.array([radius for _, radius in self.agents])
+        corners = centers[:, None, :] + radii[:, None, None] * self._outline[None, :, :]   # (A, S+1, 2)
+        outlines = np.concatenate([corners[:, :-1], corners[:, 1:]], axis=2).reshape(-1, 4)
+        return np.vstack([self.segments, outlines])
+
+    def sensor_at(self, t):
+        """Sensor poses (len(t), 3) at times t."""
+        t = np.atleast_1d(np.asarray(t, dtype=float))
+        if self.sensor_path is None:
+            return np.tile(self.sensor_pose, (len(t), 1))
+        xy, heading = self.sensor_path.at(t)
+        return np.column_stack([xy, heading])
+
+
+class LidarSimulator:
+    """
+    One revolution per scan() call at the configured frequency and sample rate.
+
+    Time is simulated: each scan advances it by one revolution, so output
+    does not depend on how fast the caller consumes it.
+    """
+
+    def __init__(self, world=None, frequency=SCAN_FREQUENCY, sample_rate=SAMPLE_RATE, min_range=MIN_RANGE,
+                 max_range=MAX_RANGE, noise_std=NOISE_STD, dropout=DROPOUT, seed=None):
+        self.world = World.default() if world is None else world
+        self.frequency = frequency
+        self.sample_rate = sample_rate
+        self.min_range = min_range
+        self.max_range = max_range
+        self.noise_std = noise_std
+        self.dropout = dropout
+        self.rng = np.random.default_rng(seed)
+        self.time = 0.0
+
+    @property
+    def points_per_scan(self):
+        return int(round(self.sample_rate * 1000.0 / self.frequency))
+
+    def scan(self):
+        """(angles, ranges, start_time, time_increment) for the next revolution."""
+        n = self.points_per_scan
+        period = 1.0 / self.frequency
+        increment = period / n
+        start = self.time
+        self.time += period
+
+        # The revolution starts wherever the head happens to be, as on the device
+        offset = self.rng.uniform(0.0, 2 * np.pi)
+        angles = np.mod(offset + np.arange(n) * (2 * np.pi / n) + np.pi, 2 * np.pi) - np.pi
+
+        poses = self.world.sensor_at(start + np.arange(n) * increment)
+        world_angles = angles + poses[:, 2]
+        directions = np.column_stack([np.cos(world_angles), np.sin(world_angles)])
+        ranges = raycast(poses[:, :2], directions, self.world.segments_at(start + period / 2), self.max_range)
+
+        if self.noise_std > 0:
+            ranges = ranges + self.rng.normal(0.0, self.noise_std, n)
+        lost = self.rng.random(n) < self.dropout
+        ranges[lost | ~np.isfinite(ranges) | (ranges < self.min_range) | (ranges > self.max_range)] = 0.0
+        return angles, ranges, start, increment
+
+
+# ---- ydlidar surface ----
+
+class LaserPoint:
+    __slots__ = ('angle', 'range', 'intensity')
+
+    def __init__(self, angle, range_, intensity=0.0):
+        self.angle = angle
+        self.range = range_
+        self.intensity = intensity
+
+
+class LaserPointVector(list):
+    def size(self):
+        return len(self)
+
+
+class LaserConfig:
+    def __init__(self):
+        self.min_angle = -np.pi
+        self.max_angle = np.pi
+        self.angle_increment = 0.0
+        self.time_increment = 0.0
+        self.scan_time = 0.0
+        self.min_range = MIN_RANGE
+        self.max_range = MAX_RANGE
+
+
+class LaserScan:
+    def __init__(self):
+        self.stamp = 0  # ns
+        self.points = LaserPointVector()
+        self.config = LaserConfig()
+
+
+class CYdLidar:
+    """
+    Drop-in for ydlidar.CYdLidar on a LidarSimulator.
+
+    The world comes from $LIDAR_SIM_WORLD (default: World.default()). With
+    $LIDAR_SIM_REALTIME=0 doProcessSimple() returns immediately instead of
+    pacing scans at the scan frequency.
+    """
+
+    def __init__(self):
+        self._options = {LidarPropScanFrequency: SCAN_FREQUENCY, LidarPropSampleRate: SAMPLE_RATE,
+                         LidarPropMinRange: MIN_RANGE, LidarPropMaxRange: MAX_RANGE, LidarPropIntenstiy: False}
+        self.realtime = os.environ.get('LIDAR_SIM_REALTIME', '1') != '0'
+        self.simulator = None
+        self._started = None
+        self._epoch_ns = 0
+
+    def setlidaropt(self, option, value):
+        self._options[option] = value
+        return True
+
+    def initialize(self):
+        path = os.environ.get('LIDAR_SIM_WORLD')
+        world = World.load(path) if path else World.default()
+        self.simulator = LidarSimulator(world, frequency=float(self._options[LidarPropScanFrequency]),
+                                        sample_rate=float(self._options[LidarPropSampleRate]),
+                                        min_range=float(self._options[LidarPropMinRange]),
+                                        max_range=float(self._options[LidarPropMaxRange]))
+        print(f"[simulated lidar] {path or 'default room'}: {self.simulator.points_per_scan} points/scan "
+              f"at {self.simulator.frequency:g} Hz{'' if self.realtime else ', not paced'}")
+        return True
+
+    def turnOn(self):
+        self._started = time.monotonic()
+        self._epoch_ns = time.time_ns()  # scan.stamp is system-clock ns, as from the SDK
+        return self.simulator is not None
+
+    def doProcessSimple(self, scan):
+        if self._started is None:
+            return False
+        angles, ranges, start, increment = self.simulator.scan()
+        if self.realtime:
+            # Like the device, a revolution is available only once it is complete
+            delay = self._started + self.simulator.time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        intensity = 100.0 if self._options[LidarPropIntenstiy] else 0.0
+        scan.points = LaserPointVector(LaserPoint(a, r, intensity if r > 0 else 0.0)
+                                       for a, r in zip(angles.tolist(), ranges.tolist()))
+        scan.stamp = self._epoch_ns + int(start * 1e9)
+        config = scan.config
+        config.scan_time = 1.0 / self.simulator.frequency
+        config.time_increment = increment
+        config.angle_increment = 2 * np.pi / len(angles)
+        config.min_range = self.simulator.min_range
+        config.max_range = self.simulator.max_range
+        return True
+
+    def turnOff(self):
+        self._started = None
+        return True
+
+    def disconnecting(self):
+        self.simulator = None
+
+    def DescribeError(self):
+        return '' if self.simulator is not None else 'simulator not initialized'
+
+
+_ok = True
+
+
+def _interrupted(signum, frame):
+    global _ok
+    _ok = False
+
+
+def os_init():
+    """As in the SDK, Ctrl-C makes os_isOk() return False instead of raising."""
+    signal.signal(signal.SIGINT, _interrupted)
+
+
+def os_isOk():
+    return _ok
+
+
+def lidarPortList():
+    return {'simulated': '/dev/simulated-lidar'}
+
+
+def _benchmark(world_path=None, n_scans=120):
+    """Simulated seconds per wall-clock second at triangle and TOF sample rates."""
+    world = World.load(world_path) if world_path else World.default()
+    print(f"World: {world_path or 'default room'} | {len(world.segments)} static segments, "
+          f"{len(world.agents)} agents | {n_scans} scans per rate")
+    for sample_rate in (5, 10, 20):
+        simulator = LidarSimulator(world, sample_rate=sample_rate, seed=0)
+        start = time.perf_counter()
+        for _ in range(n_scans):
+            simulator.scan()
+        arrays = time.perf_counter() - start
+
+        # Same through the ydlidar surface, including the per-point objects the scripts iterate over
+        laser = CYdLidar()
+        laser.realtime = False
+        laser.setlidaropt(LidarPropSampleRate, sample_rate)
+        laser.simulator = LidarSimulator(world, sample_rate=sample_rate, seed=0)
+        laser.turnOn()
+        scan = LaserScan()
+        start = time.perf_counter()
+        for _ in range(n_scans):
+            laser.doProcessSimple(scan)
+        surface = time.perf_counter() - start
+
+        simulated = n_scans / simulator.frequency
+        print(f"{sample_rate:2d} kHz ({simulator.points_per_scan} points/scan): "
+              f"arrays {simulated / arrays:6.1f}x real time ({arrays / n_scans * 1e3:.2f} ms/scan) | "
+              f"LaserScan {simulated / surface:6.1f}x ({surface / n_scans * 1e3:.2f} ms/scan)")
+
+    # Open space (nothing within MaxRange, or no geometry at all) gives scans of range-0 points
+    open_space = LidarSimulator(World.load(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'worlds',
+                                                        'open.json')), seed=0)
+    angles, ranges, _, _ = open_space.scan()
+    assert len(angles) == open_space.points_per_scan and not ranges.any(), "open world returned hits"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ray-cast LiDAR simulator (benchmark)")
+    parser.add_argument('--world', help="world JSON file (default: the synthetic default room)")
+    parser.add_argument('--scans', type=int, default=120)
+    args = parser.parse_args()
+    _benchmark(args.world, args.scans)
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Spatial Hash - uniform grid index over one scan's points
+Buckets the scan into square cells once per scan (counting sort, linear in
+the number of points) and answers batched nearest-point, radius and
+polygon-containment queries by only looking at nearby cells. Everything is
+vectorized over queries; the only Python loop is over search ring sizes.
+
+footprint_clearance() builds on it to check the wheelchair footprint at any
+number of candidate poses against the scan; footprint_clearance_many()
+hashes the poses instead when they far outnumber the points.
+
+Run directly to compare against brute force.
+"""
+import time
+
+import numpy as np
+
+DEFAULT_CELL_SIZE = 0.25  # meters
+
+
+class SpatialHash:
+    """Uniform grid hash over (N, 2) points in meters."""
+
+    def __init__(self, points, cell_size=DEFAULT_CELL_SIZE):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.cell_size = float(cell_size)
+        if len(self.points) == 0:
+            self.origin = np.zeros(2, dtype=np.int64)
+            self.shape = np.ones(2, dtype=np.int64)
+            self.order = np.zeros(0, dtype=np.intp)
+            self.starts = np.zeros(2, dtype=np.intp)
+            self.counts = np.zeros(1, dtype=np.intp)
+            return
+
+        keys = np.floor(self.points / self.cell_size).astype(np.int64)
+        self.origin = keys.min(axis=0)
+        keys -= self.origin
+        self.shape = keys.max(axis=0) + 1
+        n_cells = int(self.shape[0] * self.shape[1])
+        flat = keys[:, 0] * self.shape[1] + keys[:, 1]
+
+        # Small integer keys let numpy use its radix sort, keeping the build linear
+        if n_cells <= np.iinfo(np.uint16).max:
+            flat = flat.astype(np.uint16)
+        self.order = np.argsort(flat, kind='stable')
+        self.counts = np.bincount(flat, minlength=n_cells)
+        self.starts = np.concatenate([[0], np.cumsum(self.counts)])
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell_keys(self, queries):
+        return np.floor(queries / self.cell_size).astype(np.int64) - self.origin
+
+    def _gather(self, keys, offsets):
+        """
+        Candidate (query, point) pairs from the cells at keys + offsets.
+
+        Cells are expanded CSR-style with np.repeat, so the work is
+        proportional to the points actually found - no padding to the
+        fullest cell. Pairs come out grouped by query in ascending order.
+        """
+        cells = keys[:, None, :] + offsets[None, :, :]
+        inside = np.all((cells >= 0) & (cells < self.shape), axis=2)
+        flat = np.where(inside, cells[..., 0] * self.shape[1] + cells[..., 1], 0)
+        counts = np.where(inside, self.counts[flat], 0).ravel()
+        starts = self.starts[flat].ravel()
+
+        total = int(counts.sum())
+        query_idx = np.repeat(np.arange(len(keys)).repeat(len(offsets)), counts)
+        offset_in_cell = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        point_idx = self.order[np.repeat(starts, counts) + offset_in_cell]
+        return query_idx, point_idx
+
+    def nearest(self, queries, max_distance=np.inf):
+        """
+        Nearest point to each query.
+
+        Returns (indices, distances). Queries with no point within
+        max_distance get index -1 and distance inf.
+        """
+        queries = np.asarray(queries, dtype=float).reshape(-1, 2)
+        best_idx = np.full(len(queries), -1, dtype=np.intp)
+        best_d2 = np.full(len(queries), np.inf)
+        if len(self.points) == 0 or len(queries) == 0:
+            return best_idx, np.sqrt(best_d2)
+
+        keys = self._cell_keys(queries)
+        pending = np.arange(len(queries))
+        # Beyond this many rings every query has seen the whole grid
+        last_ring = int(np.max(np.abs(keys)) + self.shape.max())
+        # First pass covers the 3x3 block, then one extra ring per pass
+        ring = 1
+        offsets = _box_offsets(1)
+        while len(pending):
+            q_idx, p_idx = self._gather(keys[pending], offsets)
+            if len(q_idx):
+                diff = self.points[p_idx] - queries[pending[q_idx]]
+                d2 = diff[:, 0] * diff[:, 0] + diff[:, 1] * diff[:, 1]
+                # Closest pair per query: sort by (query, distance), take each group's first
+                order = np.lexsort((d2, q_idx))
+                q_sorted = q_idx[order]
+                first = order[np.r_[True, q_sorted[1:] != q_sorted[:-1]]]
+                owners = pending[q_idx[first]]
+                better = d2[first] < best_d2[owners]
+                best_d2[owners[better]] = d2[first][better]
+                best_idx[owners[better]] = p_idx[first][better]
+
+            # Anything outside rings 0..ring is at least ring * cell_size away
+            reach = ring * self.cell_size
+            done = (best_d2[pending] <= reach * reach) | (reach >= max_distance) | (ring >= last_ring)
+            pending = pending[~done]
+            ring += 1
+            offsets = _ring_offsets(ring)
+
+        best_dist = np.sqrt(best_d2)
+        too_far = best_dist > max_distance
+        best_idx[too_far] = -1
+        best_dist[too_far] = np.inf
+        return best_idx, best_dist
+
+    def query_radius(self, queries, radius):
+        """
+        All (query, point) pairs closer than radius.
+
+        Returns (query_indices, point_indices, distances) as flat arrays.
+        """
+        queries = np.asarray(queries, dtype=float).reshape(-1, 2)
+        if len(self.points) == 0 or len(queries) == 0:
+            empty = np.zeros(0, dtype=np.intp)
+            return empty, empty, np.zeros(0)
+        rings = int(np.ceil(radius / self.cell_size))
+        q_idx, p_idx = self._gather(self._cell_keys(queries), _box_offsets(rings))
+        diff = self.points[p_idx] - queries[q_idx]
+        d2 = diff[:, 0] * diff[:, 0] + diff[:, 1] * diff[:, 1]
+        hit = d2 <= radius * radius
+        return q_idx[hit], p_idx[hit], np.sqrt(d2[hit])
+
+    def points_in_polygons(self, polygons):
+        """
+        All (polygon, point) pairs with the point inside the polygon.
+
+        polygons is (P, V, 2) - a batch of polygons with the same vertex
+        count, e.g. footprint rectangles at many candidate poses.
+        """
+        polygons = np.asarray(polygons, dtype=float)
+        lo = polygons.min(axis=1)
+        hi = polygons.max(axis=1)
+        centers = (lo + hi) / 2.0
+        radius = float(np.max(np.hypot(*(hi - lo).T)) / 2.0) if len(polygons) else 0.0
+        poly_idx, point_idx, _ = self.query_radius(centers, radius)
+        inside = _inside(self.points[point_idx], polygons[poly_idx])
+        return poly_idx[inside], point_idx[inside]
+
+    def any_in_polygons(self, polygons):
+        """True for every polygon that contains at least one point."""
+        poly_idx, _ = self.points_in_polygons(polygons)
+        return np.bincount(poly_idx, minlength=len(polygons)) > 0
+
+
+def _box_offsets(rings):
+    """Cell offsets of the (2*rings+1)^2 block around a cell."""
+    span = np.arange(-rings, rings + 1)
+    return np.stack(np.meshgrid(span, span, indexing='ij'), axis=-1).reshape(-1, 2)
+
+
+def _ring_offsets(ring):
+    """Cell offsets exactly `ring` cells away (Chebyshev distance) from a cell."""
+    offsets = _box_offsets(ring)
+    return offsets[np.abs(offsets).max(axis=1) == ring]
+
+
+def _inside(points, polygons):
+    """Crossing-number test of points (N, 2) against their own polygon (N, V, 2)."""
+    a = polygons
+    b = np.roll(polygons, -1, axis=1)
+    px = points[:, None, 0]
+    py = points[:, None, 1]
+    straddle = (a[..., 1] > py) != (b[..., 1] > py)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = a[..., 0] + (py - a[..., 1]) * (b[..., 0] - a[..., 0]) / (b[..., 1] - a[..., 1])
+    crossings = np.count_nonzero(straddle & (px < x_cross), axis=1)
+    return (crossings % 2) == 1
+
+
+def footprint_polygons(poses, half_x, half_y):
+    """Corners (P, 4, 2) of the rectangular footprint at each (x, y, theta) pose."""
+    poses = np.asarray(poses, dtype=float).reshape(-1, 3)
+    corners = np.array([[-half_x, -half_y], [half_x, -half_y], [half_x, half_y], [-half_x, half_y]])
+    c = np.cos(poses[:, 2])[:, None]
+    s = np.sin(poses[:, 2])[:, None]
+    x = c * corners[:, 0] - s * corners[:, 1] + poses[:, 0:1]
+    y = s * corners[:, 0] + c * corners[:, 1] + poses[:, 1:2]
+    return np.stack([x, y], axis=-1)
+
+
+def footprint_clearance(index, poses, half_x, half_y, search_radius=1.0):
+    """
+    Distance from the footprint at each (x, y, theta) pose to the closest point.
+
+    The footprint is the rectangle |x| <= half_x, |y| <= half_y in its own
+    frame - the same convention as the viewers' point coloring. Points
+    inside the footprint give 0; poses with nothing within search_radius
+    of the footprint give inf.
+    """
+    poses = np.asarray(poses, dtype=float).reshape(-1, 3)
+    reach = np.hypot(half_x, half_y) + search_radius
+    pose_idx, point_idx, _ = index.query_radius(poses[:, :2], reach)
+    return _pair_clearance(index.points, poses, pose_idx, point_idx, half_x, half_y, search_radius)
+
+
+def footprint_clearance_many(points, poses, half_x, half_y, search_radius=1.0):
+    """
+    footprint_clearance() for many more poses than points.
+
+    Hashes the poses instead of the points and queries from each point, so
+    the per-cell cost scales with the (few) points near the chair rather
+    than with the number of poses - e.g. thousands of trajectory rollout
+    steps against a voxel-thinned scan. Same result as footprint_clearance().
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    poses = np.asarray(poses, dtype=float).reshape(-1, 3)
+    reach = np.hypot(half_x, half_y) + search_radius
+    # One ring of cells covers the reach, so each point looks at 9 cells
+    pose_index = SpatialHash(poses[:, :2], cell_size=reach)
+    point_idx, pose_idx, _ = pose_index.query_radius(points, reach)
+    return _pair_clearance(points, poses, pose_idx, point_idx, half_x, half_y, search_radius)
+
+
+def _pair_clearance(points, poses, pose_idx, point_idx, half_x, half_y, search_radius):
+    """Per-pose minimum footprint distance over candidate (pose, point) pairs."""
+    clearance = np.full(len(poses), np.inf)
+    if len(pose_idx) == 0:
+        return clearance
+
+    # Candidate points in the footprint frame of their pose
+    c_pose = np.cos(poses[:, 2])
+    s_pose = np.sin(poses[:, 2])
+    rel = points[point_idx] - poses[pose_idx, :2]
+    c = c_pose[pose_idx]
+    s = s_pose[pose_idx]
+    local_x = c * rel[:, 0] + s * rel[:, 1]
+    local_y = -s * rel[:, 0] + c * rel[:, 1]
+    dx = np.maximum(np.abs(local_x) - half_x, 0.0)
+    dy = np.maximum(np.abs(local_y) - half_y, 0.0)
+    np.minimum.at(clearance, pose_idx, np.sqrt(dx * dx + dy * dy))
+    clearance[clearance > search_radius] = np.inf
+    return clearance
+
+
+def _benchmark():
+    from synthetic_scans import TOF_POINTS, TRIANGLE_POINTS, default_room, generate_scan
+    from scan_matching import polar_to_points
+
+    rng = np.random.default_rng(0)
+    room = default_room()
+    half_x, half_y = 0.25, 0.30
+
+    print("Build time (should grow linearly with points):")
+    for n_points in (TRIANGLE_POINTS, TOF_POINTS, 4 * TOF_POINTS, 16 * TOF_POINTS):
+        points = polar_to_points(*generate_scan((0.0, 0.0, 0.0), room, n_points=n_points, rng=rng))
+        start = time.perf_counter()
+        for _ in range(20):
+            SpatialHash(points)
+        build = (time.perf_counter() - start) / 20
+        print(f"  {len(points):6d} points: {build * 1e3:6.3f} ms ({build / len(points) * 1e9:.0f} ns/point)")
+
+    points = polar_to_points(*generate_scan((0.0, 0.0, 0.0), room, n_points=TOF_POINTS, rng=rng))
+    index = SpatialHash(points)
+    poses = np.column_stack([rng.uniform(-1.5, 1.5, 500), rng.uniform(-1.5, 1.5, 500),
+                             rng.uniform(-np.pi, np.pi, 500)])
+
+    # Nearest point against brute force
+    start = time.perf_counter()
+    idx, dist = index.nearest(poses[:, :2])
+    hash_time = time.perf_counter() - start
+    start = time.perf_counter()
+    brute = np.sqrt(((points[None, :, :] - poses[:, None, :2]) ** 2).sum(axis=2))
+    brute_idx = brute.argmin(axis=1)
+    brute_time = time.perf_counter() - start
+    print(f"Nearest ({len(poses)} queries, {len(points)} points): hash {hash_time * 1e3:.2f} ms, "
+          f"brute force {brute_time * 1e3:.2f} ms, exact: {np.allclose(dist, brute[np.arange(len(poses)), brute_idx])}")
+
+    # Footprint clearance against brute force
+    start = time.perf_counter()
+    clearance = footprint_clearance(index, poses, half_x, half_y)
+    hash_time = time.perf_counter() - start
+    start = time.perf_counter()
+    rel = points[None, :, :] - poses[:, None, :2]
+    c = np.cos(poses[:, 2])[:, None]
+    s = np.sin(poses[:, 2])[:, None]
+    lx = c * rel[..., 0] + s * rel[..., 1]
+    ly = -s * rel[..., 0] + c * rel[..., 1]
+    brute = np.hypot(np.maximum(np.abs(lx) - half_x, 0), np.maximum(np.abs(ly) - half_y, 0)).min(axis=1)
+    brute[brute > 1.0] = np.inf
+    brute_time = time.perf_counter() - start
+    print(f"Footprint clearance ({len(poses)} poses): hash {hash_time * 1e3:.2f} ms, "
+          f"brute force {brute_time * 1e3:.2f} ms, exact: {np.allclose(clearance, brute)}")
+
+    # Many poses, few points: hashing the poses instead gives the same answer
+    many = np.column_stack([rng.uniform(-1.5, 1.5, 5000), rng.uniform(-1.5, 1.5, 5000),
+                            rng.uniform(-np.pi, np.pi, 5000)])
+    few = points[::8]
+    start = time.perf_counter()
+    by_points = footprint_clearance(SpatialHash(few), many, half_x, half_y)
+    points_time = time.perf_counter() - start
+    start = time.perf_counter()
+    by_poses = footprint_clearance_many(few, many, half_x, half_y)
+    poses_time = time.perf_counter() - start
+    print(f"Footprint clearance ({len(many)} poses, {len(few)} points): points hashed {points_time * 1e3:.2f} ms, "
+          f"poses hashed {poses_time * 1e3:.2f} ms, same: {np.array_equal(by_points, by_poses)}")
+
+    # Polygon containment against the clearance result (inside <=> clearance 0)
+    start = time.perf_counter()
+    occupied = index.any_in_polygons(footprint_polygons(poses, half_x, half_y))
+    print(f"Footprint containment ({len(poses)} polygons): {(time.perf_counter() - start) * 1e3:.2f} ms, "
+          f"consistent: {np.array_equal(occupied, clearance == 0)}")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Synthetic Scans - generated LiDAR scans with known ground truth
+Ray-casts a 2D world of line segments from a given sensor pose so the
+processing stages can be checked without the device or a real room.
+
+Scan convention matches the ydlidar points used by the viewers: angle in
+radians in [-pi, pi), x = range * cos(angle), y = range * sin(angle), and a
+range of 0 where the beam got no return.
+"""
+import numpy as np
+
+# Triangle (X2) and TOF point counts per revolution
+TRIANGLE_POINTS = 500
+TOF_POINTS = 2000
+
+
+def box_segments(x0, y0, x1, y1):
+    """Return the four walls of an axis-aligned box as (4, 4) [x1, y1, x2, y2] rows."""
+    return np.array([
+        [x0, y0, x1, y0],
+        [x1, y0, x1, y1],
+        [x1, y1, x0, y1],
+        [x0, y1, x0, y0],
+    ], dtype=float)
+
+
+def default_room():
+    """An 8m x 6m room with a few pieces of furniture and a pillar."""
+    return np.vstack([
+        box_segments(-4.0, -3.0, 4.0, 3.0),    # outer walls
+        box_segments(1.5, 1.2, 2.7, 2.0),      # table
+        box_segments(-3.2, -2.5, -2.2, -1.6),  # cabinet
+        box_segments(-0.9, 1.8, -0.5, 2.2),    # pillar
+        np.array([[2.0, -3.0, 2.0, -1.4]]),    # half-height partition
+    ])
+
+
+def corridor(length=20.0, width=1.6, doors=4):
+    """A straight corridor along x with door recesses on alternating sides."""
+    half = width / 2.0
+    segments = [[-1.0, -half, length, -half], [-1.0, half, length, half],
+                [-1.0, -half, -1.0, half], [length, -half, length, half]]
+    for k in range(doors):
+        x = (k + 1) * length / (doors + 1)
+        side = half if k % 2 == 0 else -half
+        depth = 0.3 if side > 0 else -0.3
+        segments += [[x - 0.45, side, x - 0.45, side + depth],
+                     [x - 0.45, side + depth, x + 0.45, side + depth],
+                     [x + 0.45, side + depth, x + 0.45, side]]
+    return np.array(segments, dtype=float)
+
+
+def raycast(origin, directions, segments, max_range, return_index=False):
+    """
+    Distance along each unit direction from origin to the nearest segment.
+
+    All beams are intersected against all segments in one batched
+    evaluation: directions is (N, 2), segments is (M, 4), result is (N,)
+    with np.inf where nothing is hit within max_range. origin is one (x, y)
+    for all beams or (N, 2), one per beam (a sensor moving during the
+    revolution). With return_index the index of the segment each beam hit
+    (-1 for none) is returned too.
+    """
+    origin = np.asarray(origin, dtype=float)
+    if len(segments) == 0:
+        # Open space: min() over zero segments has no identity
+        distance = np.full(len(directions), np.inf)
+        return (distance, np.full(len(directions), -1, dtype=np.intp)) if return_index else distance
+    if origin.ndim == 1:
+        px = segments[:, 0] - origin[0]      # segment start relative to origin (M,)
+        py = segments[:, 1] - origin[1]
+    else:
+        px = segments[None, :, 0] - origin[:, 0:1]   # per beam (N, M)
+        py = segments[None, :, 1] - origin[:, 1:2]
+    s = segments[:, 2:4] - segments[:, 0:2]  # segment direction (M, 2)
+    dx = directions[:, 0:1]
+    dy = directions[:, 1:2]
+
+    # Solve origin + t*d = start + u*s for t (beam distance) and u (segment fraction)
+    denom = dx * s[:, 1] - dy * s[:, 0]                  # (N, M)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (px * s[:, 1] - py * s[:, 0]) / denom
+        u = (px * dy - py * dx) / denom
+    hit = (np.abs(denom) > 1e-12) & (t > 0.0) & (u >= 0.0) & (u <= 1.0) & (t <= max_range)
+    t = np.where(hit, t, np.inf)
+    if not return_index:
+        return t.min(axis=1)
+    index = t.argmin(axis=1)
+    distance = t[np.arange(len(t)), index]
+    index[~np.isfinite(distance)] = -1
+    return distance, index
+
+
+def generate_scan(pose, segments, n_points=TRIANGLE_POINTS, max_range=8.0, min_range=0.08,
+                  noise_std=0.01, rng=None):
+    """
+    Generate one scan from sensor pose (x, y, theta) in the world.
+
+    Returns (angles, ranges) in the sensor frame. Beams without a return, or
+    outside [min_range, max_range], report range 0 like the device does.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    x, y, theta = pose
+    angles = np.linspace(-np.pi, np.pi, n_points, endpoint=False)
+    world_angles = angles + theta
+    directions = np.column_stack([np.cos(world_angles), np.sin(world_angles)])
+    ranges = raycast((x, y), directions, segments, max_range)
+    if noise_std > 0:
+        ranges = ranges + rng.normal(0.0, noise_std, n_points)
+    ranges[~np.isfinite(ranges) | (ranges < min_range) | (ranges > max_range)] = 0.0
+    return angles, ranges
+
+
+def random_walk_poses(n_scans, step=0.04, turn=0.03, max_turn=0.1, rng=None, start=(0.0, 0.0, 0.0),
+                      bounds=2.0):
+    """
+    Ground-truth chair poses for a smooth drive, roughly what 12 Hz scans see
+    at walking pace (step in meters and turn rates in radians per scan). The
+    heading changes smoothly and the path stays within bounds.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    poses = np.empty((n_scans, 3))
+    x, y, theta = start
+    omega = 0.0
+    for k in range(n_scans):
+        poses[k] = (x, y, theta)
+        omega = 0.8 * omega + rng.normal(0.0, turn)
+        # Steer back toward the middle of the room when getting close to the edge
+        if abs(x) > bounds or abs(y) > bounds:
+            omega += 0.05 * np.sign(np.sin(np.arctan2(-y, -x) - theta))
+        omega = np.clip(omega, -max_turn, max_turn)
+        theta = (theta + omega + np.pi) % (2 * np.pi) - np.pi
+        x += step * np.cos(theta)
+        y += step * np.sin(theta)
+    return poses
@@ -3,12 +3,25 @@
 TOF LiDAR Test - Maximum Frequency Version
 Optimized for highest scan rate
 """
+import argparse
 import os
 import ydlidar
 import time
 import sys
+import numpy as np
+from profiling_hook import ProfilingHook
+from scan_stats import REPORT_INTERVAL, ScanStatsReporter, min_clearance
+
+WHEELCHAIR_WIDTH = .50   # For the closest-obstacle figure in --stats mode
+WHEELCHAIR_LENGTH = .60
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TOF LiDAR console test")
+    parser.add_argument('--stats', action='store_true', help="one aggregated summary line per interval instead of a line per scan")
+    parser.add_argument('--interval', type=float, default=REPORT_INTERVAL, help="seconds between summaries (default %(default)s)")
+    parser.add_argument('--jsonl', help="also append each summary to this JSON-lines file (implies --stats)")
+    args = parser.parse_args()
+
     ydlidar.os_init()
     ports = ydlidar.lidarPortList()
     port = "/dev/ydlidar"
@@ -35,6 +48,7 @@ if __name__ == "__main__":
     print(f"Dual Channel: Enabled")
     print("=================================\n")
 
+    profiling = ProfilingHook('tof_test_maxfreq')  # kill -USR1 <pid> to profile the scan loop
     ret = laser.initialize()
     if ret:
         print("LiDAR initialized successfully!")
@@ -45,17 +59,33 @@ if __name__ == "__main__":
             count = 0
             start_time = time.time()
             
-            while ret and ydlidar.os_isOk():
-                r = laser.doProcessSimple(scan)
-                if r:
-                    count += 1
-                    actual_freq = 1.0 / scan.config.scan_time
-                    print(f"Scan #{count} [Stamp: {scan.stamp:.3f}] Points: {scan.points.size():4d} | Frequency: {actual_freq:.2f} Hz")
-                else:
-                    print("Failed to get LiDAR Data.")
+            if args.stats or args.jsonl:
+                # Per-scan work is only recording; the reporter thread does the printing
+                with ScanStatsReporter('tof', interval=args.interval, jsonl=args.jsonl) as stats:
+                    try:
+                        while ret and ydlidar.os_isOk():
+                            if laser.doProcessSimple(scan):
+                                n = scan.points.size()
+                                angles = np.fromiter((p.angle for p in scan.points), dtype=float, count=n)
+                                ranges = np.fromiter((p.range for p in scan.points), dtype=float, count=n)
+                                stats.record(n, min_clearance(angles, ranges, WHEELCHAIR_WIDTH / 2.0,
+                                                              WHEELCHAIR_LENGTH / 2.0))
+                            else:
+                                stats.failure()
+                    except KeyboardInterrupt:
+                        pass
+            else:
+                while ret and ydlidar.os_isOk():
+                    r = laser.doProcessSimple(scan)
+                    if r:
+                        count += 1
+                        actual_freq = 1.0 / scan.config.scan_time
+                        print(f"Scan #{count} [Stamp: {scan.stamp:.3f}] Points: {scan.points.size():4d} | Frequency: {actual_freq:.2f} Hz")
+                    else:
+                        print("Failed to get LiDAR Data.")
                 
-                # Minimal sleep to maximize throughput
-                time.sleep(0.001)  # 1ms sleep for minimal CPU usage
+                    # Minimal sleep to maximize throughput
+                    time.sleep(0.001)  # 1ms sleep for minimal CPU usage
                 
         else:
             print("Failed to turn on LiDAR!")
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Trajectory Rollout - dynamic-window suggestion of where to drive
+Samples a grid of (linear, angular) velocity commands around the current
+motion, rolls each one out as a constant-curvature arc for a short horizon
+and checks the wheelchair footprint along every arc against the current
+scan. All candidates go through one batched footprint_clearance_many()
+call against the voxel-thinned scan - there is no Python loop over
+candidates.
+
+Each arc is scored for clearance, progress toward the goal heading, time
+to collision and smoothness (closeness to the current command). Progress
+counts only the part of the arc driven before the chair has to start
+braking for whatever it would get too close to, so full speed toward a
+wall scores less than slowing down or turning into a gap; arcs that could
+not brake to a stop at all are rejected.
+
+Frame: the scan's, with x = range * cos(angle) forward (angle 0 is FRONT)
+and the footprint |x| <= WHEELCHAIR_WIDTH/2, |y| <= WHEELCHAIR_LENGTH/2 as
+in the viewers' point coloring.
+
+Run directly to check timing and behavior on generated scenes.
+"""
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from scan_matching import _voxel_subsample, polar_to_points
+from spatial_hash import footprint_clearance_many
+
+# Wheelchair limits
+MAX_SPEED = 0.8            # m/s forward
+MAX_REVERSE = 0.0          # m/s backward (no reversing by default)
+MAX_TURN_RATE = 1.0        # rad/s
+MAX_ACCEL = 0.6            # m/s^2, also used as braking deceleration
+MAX_ANGULAR_ACCEL = 2.0    # rad/s^2
+
+# Rollout
+SPEED_SAMPLES = 15         # 15 x 31 = 465 candidate commands per scan
+TURN_SAMPLES = 31
+WINDOW_TIME = 0.5          # Reachable commands within this time form the window (s)
+HORIZON = 2.0              # Arc length in time (s)
+HORIZON_STEPS = 10         # Footprint checks along each arc
+SAFETY_MARGIN = 0.05       # Minimum clearance along an arc (m)
+CLEARANCE_CAP = 0.6        # Clearance beyond this scores the same (m)
+OBSTACLE_VOXEL = 0.03      # Scan thinning before the check; clearance is reduced to stay conservative (m)
+
+# Score weights
+CLEARANCE_WEIGHT = 1.0
+PROGRESS_WEIGHT = 1.5
+TTC_WEIGHT = 1.0
+SMOOTHNESS_WEIGHT = 0.4
+
+Rollout = namedtuple('Rollout', ['speeds', 'turn_rates', 'scores', 'clearance', 'admissible', 'order', 'poses'])
+
+
+def arc_poses(speeds, turn_rates, times):
+    """
+    Poses (C, S, 3) reached by driving each (v, omega) from the origin for each time.
+
+    times is (S,) shared by every command or (C, S) per command. Closed-form
+    unicycle motion: constant curvature, straight lines where omega is ~0.
+    """
+    v = np.asarray(speeds, dtype=float)[:, None]
+    w = np.asarray(turn_rates, dtype=float)[:, None]
+    t = np.asarray(times, dtype=float)
+    t = t[None, :] if t.ndim == 1 else t
+    theta = w * t
+    straight = np.abs(w) < 1e-6
+    safe_w = np.where(straight, 1.0, w)
+    x = np.where(straight, v * t, v / safe_w * np.sin(theta))
+    y = np.where(straight, 0.0, v / safe_w * (1.0 - np.cos(theta)))
+    return np.stack([x, y, np.broadcast_to(theta, x.shape)], axis=-1)
+
+
+class TrajectoryPlanner:
+    """
+    Dynamic-window rollout for one footprint.
+
+    evaluate() takes a scan plus the current command (v, omega) and returns
+    a Rollout with every candidate's score; Rollout.order lists admissible
+    candidates best first.
+    """
+
+    def __init__(self, half_width, half_length, max_speed=MAX_SPEED, max_reverse=MAX_REVERSE,
+                 max_turn_rate=MAX_TURN_RATE, max_accel=MAX_ACCEL, max_angular_accel=MAX_ANGULAR_ACCEL,
+                 speed_samples=SPEED_SAMPLES, turn_samples=TURN_SAMPLES, horizon=HORIZON,
+                 horizon_steps=HORIZON_STEPS, max_range=8.0):
+        self.half_width = half_width
+        self.half_length = half_length
+        self.max_speed = max_speed
+        self.max_reverse = max_reverse
+        self.max_turn_rate = max_turn_rate
+        self.max_accel = max_accel
+        self.max_angular_accel = max_angular_accel
+        self.speed_samples = speed_samples
+        self.turn_samples = turn_samples
+        self.horizon = horizon
+        self.max_range = max_range
+        self.times = np.linspace(horizon / horizon_steps, horizon, horizon_steps)
+
+    def window(self, speed=0.0, turn_rate=0.0):
+        """Candidate (speeds, turn_rates), flattened, reachable from the current command."""
+        v_lo = max(-self.max_reverse, speed - self.max_accel * WINDOW_TIME)
+        v_hi = min(self.max_speed, speed + self.max_accel * WINDOW_TIME)
+        w_lo = max(-self.max_turn_rate, turn_rate - self.max_angular_accel * WINDOW_TIME)
+        w_hi = min(self.max_turn_rate, turn_rate + self.max_angular_accel * WINDOW_TIME)
+        v, w = np.meshgrid(np.linspace(v_lo, v_hi, self.speed_samples),
+                           np.linspace(w_lo, w_hi, self.turn_samples), indexing='ij')
+        return v.ravel(), w.ravel()
+
+    def _obstacles(self, angles, ranges):
+        points = polar_to_points(angles, ranges, max_range=self.max_range)
+        # Returns inside the footprint are the chair or its user, not obstacles
+        inside = (np.abs(points[:, 0]) <= self.half_width) & (np.abs(points[:, 1]) <= self.half_length)
+        points = points[~inside]
+        if len(points) == 0:
+            return points
+        return points[_voxel_subsample(points, OBSTACLE_VOXEL)]
+
+    def evaluate(self, angles, ranges, speed=0.0, turn_rate=0.0, goal_heading=0.0):
+        """Score every candidate command in the dynamic window against this scan."""
+        speeds, turn_rates = self.window(speed, turn_rate)
+        n, steps = len(speeds), len(self.times)
+        poses = arc_poses(speeds, turn_rates, self.times)
+
+        # One batched clearance query for every pose of every arc; a dropped
+        # point is at most a voxel diagonal from the one kept in its voxel
+        clearance = footprint_clearance_many(self._obstacles(angles, ranges), poses.reshape(-1, 3),
+                                             self.half_width, self.half_length,
+                                             search_radius=CLEARANCE_CAP).reshape(n, steps)
+        clearance = np.maximum(clearance - OBSTACLE_VOXEL * np.sqrt(2.0), 0.0)
+
+        # Distance driven before the first step that gets too close; the arc
+        # is admissible only if the chair could brake to a stop within it
+        blocked = clearance <= SAFETY_MARGIN
+        first_blocked = np.where(blocked.any(axis=1), blocked.argmax(axis=1), steps)
+        dt = self.times[1] - self.times[0] if steps > 1 else self.times[0]
+        free_time = first_blocked * dt
+        free_distance = free_time * np.abs(speeds)
+        stopping = speeds * speeds / (2 * self.max_accel)
+        admissible = (stopping <= free_distance) & ~blocked[:, 0]
+        unblocked = first_blocked == steps
+
+        # Clearance term: closest approach along the part of the arc that is driven
+        driven = np.arange(steps)[None, :] < np.maximum(first_blocked, 1)[:, None]
+        arc_clearance = np.minimum(np.where(driven, clearance, np.inf).min(axis=1), CLEARANCE_CAP)
+        clearance_score = arc_clearance / CLEARANCE_CAP
+
+        # Progress term: displacement along the goal heading where braking
+        # has to begin on a blocked arc (the whole horizon on a free one) -
+        # the distance eaten by the stop in front of a wall is not progress
+        braking_time = np.maximum(free_distance - stopping, 0.0) / np.maximum(np.abs(speeds), 1e-9)
+        progress_time = np.where(unblocked, self.horizon, np.minimum(braking_time, free_time))
+        end = arc_poses(speeds, turn_rates, progress_time[:, None])[:, 0]
+        along = end[:, 0] * np.cos(goal_heading) + end[:, 1] * np.sin(goal_heading)
+        progress_score = np.clip(along / (self.max_speed * self.horizon), -1.0, 1.0)
+
+        # Time-to-collision term: how long the arc can be followed before it
+        # gets too close to something, the full horizon if it never does
+        ttc_score = np.where(unblocked, self.horizon, free_time) / self.horizon
+
+        # Smoothness term: stay close to the current command
+        v_span = max(self.max_accel * WINDOW_TIME, 1e-9)
+        w_span = max(self.max_angular_accel * WINDOW_TIME, 1e-9)
+        smoothness_score = 1.0 - 0.5 * (np.abs(speeds - speed) / v_span + np.abs(turn_rates - turn_rate) / w_span)
+
+        scores = (CLEARANCE_WEIGHT * clearance_score + PROGRESS_WEIGHT * progress_score
+                  + TTC_WEIGHT * ttc_score + SMOOTHNESS_WEIGHT * smoothness_score)
+        scores[~admissible] = -np.inf
+        order = np.argsort(-scores, kind='stable')[:np.count_nonzero(admissible)]
+        return Rollout(speeds, turn_rates, scores, arc_clearance, admissible, order, poses)
+
+
+def arc_polar(rollout, k=3):
+    """(theta, r) polylines of the k best arcs' center paths, for overlay on the polar plot."""
+    lines = []
+    for i in rollout.order[:k]:
+        xy = np.vstack([[0.0, 0.0], rollout.poses[i, :, :2]])
+        lines.append((np.arctan2(xy[:, 1], xy[:, 0]), np.hypot(xy[:, 0], xy[:, 1])))
+    return lines
+
+
+def _benchmark(n_scans=120):
+    """Timing over a random drive, plus corridor and blocked-ahead behavior checks that must pass."""
+    from synthetic_scans import (TOF_POINTS, TRIANGLE_POINTS, box_segments, corridor, default_room,
+                                 generate_scan, random_walk_poses)
+
+    rng = np.random.default_rng(0)
+    planner = TrajectoryPlanner(0.25, 0.30)
+    print(f"Candidates per scan: {planner.speed_samples * planner.turn_samples} "
+          f"x {len(planner.times)} footprint checks")
+
+    room = default_room()
+    poses = random_walk_poses(n_scans, rng=rng, bounds=1.0)
+    for n_points in (TRIANGLE_POINTS, TOF_POINTS):
+        scans = [generate_scan(pose, room, n_points=n_points, rng=rng) for pose in poses]
+        times = []
+        for angles, ranges in scans:
+            start = time.perf_counter()
+            planner.evaluate(angles, ranges, speed=0.4, turn_rate=0.0)
+            times.append(time.perf_counter() - start)
+        times = np.array(times) * 1e3
+        print(f"{n_points} points/scan: {times.mean():.1f} ms mean, {np.percentile(times, 99):.1f} ms p99 "
+              f"(12 Hz budget {1000 / 12:.0f} ms)")
+
+    # Corridor: the best command should keep going straight ahead
+    angles, ranges = generate_scan((2.0, 0.0, 0.0), corridor(), rng=rng)
+    rollout = planner.evaluate(angles, ranges, speed=0.4)
+    best = rollout.order[0]
+    print(f"Corridor: best v={rollout.speeds[best]:.2f} m/s, omega={rollout.turn_rates[best]:+.2f} rad/s, "
+          f"{np.count_nonzero(rollout.admissible)} admissible")
+    assert abs(rollout.turn_rates[best]) < 0.05 and rollout.speeds[best] >= 0.4, "corridor: should drive straight on"
+
+    # Wall 0.7 m ahead with a gap on the left: too close to keep going
+    # straight at 0.6 m/s, so the best command must turn left or slow down
+    world = np.vstack([box_segments(-4, -4, 4, 4), np.array([[0.7, -4.0, 0.7, 0.2]])])
+    angles, ranges = generate_scan((0.0, 0.0, 0.0), world, rng=rng)
+    rollout = planner.evaluate(angles, ranges, speed=0.6)
+    best = rollout.order[0]
+    straight = np.argmin(np.abs(rollout.turn_rates) + np.abs(rollout.speeds - 0.6))
+    print(f"Wall ahead: best v={rollout.speeds[best]:.2f} m/s, omega={rollout.turn_rates[best]:+.2f} rad/s "
+          f"(straight at 0.6 m/s admissible: {bool(rollout.admissible[straight])})")
+    assert not rollout.admissible[straight], "wall ahead: straight at 0.6 m/s cannot stop in time"
+    assert rollout.turn_rates[best] > 0.1 or rollout.speeds[best] < 0.4, \
+        "wall ahead: should turn toward the gap or slow below 0.4 m/s"
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -1,8 +1,21 @@
+import argparse
 import os
 import ydlidar
 import time
+import numpy as np
+from profiling_hook import ProfilingHook
+from scan_stats import REPORT_INTERVAL, ScanStatsReporter, min_clearance
+
+WHEELCHAIR_WIDTH = .50   # For the closest-obstacle figure in --stats mode
+WHEELCHAIR_LENGTH = .60
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Triangle LiDAR console test")
+    parser.add_argument('--stats', action='store_true', help="one aggregated summary line per interval instead of a line per scan")
+    parser.add_argument('--interval', type=float, default=REPORT_INTERVAL, help="seconds between summaries (default %(default)s)")
+    parser.add_argument('--jsonl', help="also append each summary to this JSON-lines file (implies --stats)")
+    args = parser.parse_args()
+
     ydlidar.os_init()
     ports = ydlidar.lidarPortList()
     port = "/dev/ydlidar"
@@ -24,8 +37,26 @@ if __name__ == "__main__":
     laser.setlidaropt(ydlidar.LidarPropMinRange, 0.08)  # Minimum working range
     laser.setlidaropt(ydlidar.LidarPropIntenstiy, False)
 
+    profiling = ProfilingHook('tri_test_maxfreq')  # kill -USR1 <pid> to profile the scan loop
     ret = laser.initialize()
-    if ret:
+    if ret and (args.stats or args.jsonl):
+        ret = laser.turnOn()
+        scan = ydlidar.LaserScan()
+        # Per-scan work is only recording; the reporter thread does the printing
+        with ScanStatsReporter('tri', interval=args.interval, jsonl=args.jsonl) as stats:
+            try:
+                while ret and ydlidar.os_isOk():
+                    if laser.doProcessSimple(scan):
+                        n = scan.points.size()
+                        angles = np.fromiter((p.angle for p in scan.points), dtype=float, count=n)
+                        ranges = np.fromiter((p.range for p in scan.points), dtype=float, count=n)
+                        stats.record(n, min_clearance(angles, ranges, WHEELCHAIR_WIDTH / 2.0, WHEELCHAIR_LENGTH / 2.0))
+                    else:
+                        stats.failure()
+            except KeyboardInterrupt:
+                pass
+        laser.turnOff()
+    elif ret:
         ret = laser.turnOn()
         scan = ydlidar.LaserScan()
         scan_count = 0
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Zoom Backgrounds - quantized zoom levels with cached static layers
+The auto-scaling viewers used to clear the polar axes every frame and
+redraw the grid, tick labels, footprint, front arrow, center circle and
+range label at the new current_rmax. Here the smoothed range is snapped up
+to one of a fixed set of zoom levels; each level's static layer is drawn
+once, kept as a background bitmap in a bounded LRU cache, and a frame is
+a bitmap restore plus the scan's own artists drawn and blitted on top.
+
+Artists that change every scan (points, shading, title, ...) must be
+created with animated=True so full draws leave them out of the bitmaps.
+
+Run directly to compare against the clear-and-redraw frame on Agg.
+"""
+import collections
+import time
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.patches import Rectangle
+from matplotlib.transforms import Bbox
+
+ZOOM_STEP = 0.5          # Meters between zoom levels
+MAX_CACHED_LEVELS = 6    # Background bitmaps kept (4 MB each for a 10x10 in figure at 100 dpi)
+BACKGROUND_COLOR = '#0a1929'
+ARROW_COLOR = '#ff3366'
+
+
+def zoom_levels(rmin, rmax, step=ZOOM_STEP):
+    """Zoom levels from rmin to rmax (both included) in steps of step."""
+    levels = np.arange(rmin, rmax, step)
+    return np.append(levels[levels < rmax - 1e-9], rmax)
+
+
+class StaticLayer:
+    """
+    The viewers' per-zoom static artists, created once and resized by set_zoom().
+
+    footprint_kwargs override the footprint rectangle style (the viewers
+    differ in line width and stacking).
+    """
+
+    def __init__(self, ax, width, length, **footprint_kwargs):
+        self.ax = ax
+        ax.set_theta_zero_location('N')  # Front pointing up
+        ax.set_theta_direction(-1)
+        ax.set_facecolor(BACKGROUND_COLOR)
+        ax.grid(True, color='white', alpha=0.3, linestyle='--', linewidth=0.5)
+        ax.tick_params(colors='white', labelsize=9)
+        ax.spines['polar'].set_color('white')
+
+        style = dict(facecolor='lightgray', edgecolor='gray', alpha=0.3, linewidth=2, zorder=5)
+        style.update(footprint_kwargs)
+        ax.add_patch(Rectangle((-width / 2.0, -length / 2.0), width, length, transform=ax.transData._b, **style))
+
+        self.arrow_head, = ax.fill([0, 0, 0, 0], [0, 0, 0, 0], color=ARROW_COLOR, alpha=0.9, zorder=10,
+                                   edgecolor='white', linewidth=1.5)
+        self.arrow_shaft, = ax.plot([0, 0], [0, 0], color=ARROW_COLOR, linewidth=3, alpha=0.9, zorder=10)
+        self.center = plt.Circle((0, 0), 0.1, transform=ax.transData._b, facecolor=ARROW_COLOR, zorder=11,
+                                 edgecolor='white', linewidth=2)
+        ax.add_patch(self.center)
+        self.front = ax.text(0, 0, 'FRONT', ha='center', va='bottom', fontsize=12, fontweight='bold',
+                             color=ARROW_COLOR, zorder=12)
+        self.range_label = ax.text(np.pi / 4, 0, '', ha='center', fontsize=9, color='white', alpha=0.7)
+
+    def set_zoom(self, rmax):
+        """Limits and rmax-proportional geometry for one zoom level."""
+        self.ax.set_ylim(0, rmax)
+        self.ax.set_rmax(rmax)
+        arrow_length = rmax * 0.12
+        arrow_start = rmax * 0.02
+        arrow_width = 0.20
+        self.arrow_head.set_xy([[arrow_width, arrow_start + arrow_length * 0.7], [0, arrow_start + arrow_length],
+                                [-arrow_width, arrow_start + arrow_length * 0.7],
+                                [arrow_width, arrow_start + arrow_length * 0.7]])
+        self.arrow_shaft.set_data([0, 0], [arrow_start, arrow_start + arrow_length * 0.6])
+        self.center.set_radius(rmax * 0.015)
+        self.front.set_position((0, arrow_start + arrow_length + rmax * 0.06))
+        self.range_label.set_position((np.pi / 4, rmax * 0.95))
+        self.range_label.set_text(f'{rmax:.1f}m')
+
+
+class ZoomBackgroundCache:
+    """
+    Background bitmap per zoom level, least recently used dropped first.
+
+    set_zoom(level) configures the figure for a level; it runs on every
+    level switch (cheap: limits and a few artist properties), the full
+    canvas draw only on a cache miss. Resizing the window empties the cache.
+    Any other full draw of the figure (an expose, a toolbar action) wipes
+    the animated artists from the screen and sets needs_redraw until the
+    next restore().
+    """
+
+    def __init__(self, fig, set_zoom, levels, max_levels=MAX_CACHED_LEVELS):
+        self.fig = fig
+        self.set_zoom = set_zoom
+        self.levels = np.asarray(levels, dtype=float)
+        self.max_levels = max_levels
+        self.level = None
+        self._backgrounds = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.needs_redraw = False
+        self._drawing = False
+        fig.canvas.mpl_connect('resize_event', lambda event: self.clear())
+        fig.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        if not self._drawing:
+            self.needs_redraw = True
+
+    def snap(self, rmax):
+        """Smallest zoom level that still shows everything out to rmax."""
+        i = np.searchsorted(self.levels, rmax - 1e-9)
+        return float(self.levels[min(i, len(self.levels) - 1)])
+
+    def restore(self, rmax):
+        """Put the background for rmax's zoom level on the canvas; returns the level."""
+        level = self.snap(rmax)
+        if level != self.level:
+            self.set_zoom(level)
+            self.level = level
+
+        canvas = self.fig.canvas
+        background = self._backgrounds.get(level)
+        if background is None:
+            self.misses += 1
+            self._drawing = True
+            try:
+                canvas.draw()  # animated artists are left out
+            finally:
+                self._drawing = False
+            background = canvas.copy_from_bbox(self.fig.bbox)
+            self._backgrounds[level] = background
+            if len(self._backgrounds) > self.max_levels:
+                self._backgrounds.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.hits += 1
+            self._backgrounds.move_to_end(level)
+            canvas.restore_region(background)
+        self.needs_redraw = False
+        return level
+
+    def is_current(self, level):
+        """True if the screen shows level's background with the last blitted artists on it."""
+        return level == self.level and level in self._backgrounds and not self.needs_redraw
+
+    def blit(self, ax, artists):
+        """Draw the per-scan artists over the restored background and show the result."""
+        for artist in artists:
+            ax.draw_artist(artist)
+        self.fig.canvas.blit(self.fig.bbox)
+
+    def blit_region(self, ax, artists, bbox):
+        """
+        Redraw artists only inside bbox (display pixels) over the current
+        level's background, leaving the rest of the screen as it is.
+
+        Only valid while is_current() holds for the level on screen.
+        """
+        canvas = self.fig.canvas
+        width, height = int(self.fig.bbox.width), int(self.fig.bbox.height)
+        x0, y0 = max(int(np.floor(bbox.x0)), 0), max(int(np.floor(bbox.y0)), 0)
+        x1, y1 = min(int(np.ceil(bbox.x1)), width), min(int(np.ceil(bbox.y1)), height)
+        # Agg addresses the saved bitmap in top-down pixel rows
+        canvas.restore_region(self._backgrounds[self.level], bbox=(x0, height - y1, x1, height - y0), xy=(0, 0))
+        clip = Bbox.from_extents(x0, y0 - 1, x1 + 1, y1)
+        for artist in artists:
+            previous = artist.get_clip_box()
+            artist.set_clip_box(clip)
+            ax.draw_artist(artist)
+            artist.set_clip_box(previous)
+        canvas.blit(clip)
+
+    def clear(self):
+        self._backgrounds.clear()
+
+    def memory_bytes(self):
+        total = 0
+        for background in self._backgrounds.values():
+            x0, y0, x1, y1 = background.get_extents()
+            total += (x1 - x0) * (y1 - y0) * 4
+        return total
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        return (f"Zoom cache: {len(self._backgrounds)}/{self.max_levels} levels, "
+                f"{self.memory_bytes() / 2 ** 20:.1f} MiB, hit rate {self.hits / max(lookups, 1):.1%} "
+                f"({self.misses} misses, {self.evictions} evictions)")
+
+
+def _benchmark(frames=240):
+    """Clear-and-redraw frame against the cached-background frame along a simulated zoom sequence."""
+    import matplotlib
+    matplotlib.use('Agg')
+    from boundary_shading import BoundaryShading
+    from frame_buffers import FrameBufferPool
+    from perf_regression import _render_frame
+    from synthetic_scans import box_segments, default_room, generate_scan, random_walk_poses
+
+    rng = np.random.default_rng(0)
+    pool = FrameBufferPool(0.25, 0.30, 0.20, 0.70)
+    levels = zoom_levels(2.0, 8.0)
+
+    # Smoothed auto-zoom as in the viewers, driving between a small and a large room
+    small, large = default_room(), box_segments(-7, -7, 7, 7)
+    frames_data = []
+    current_rmax = 8.0
+    for k, pose in enumerate(random_walk_poses(frames, rng=rng, bounds=1.0)):
+        room = small if (k // 60) % 2 == 0 else large
+        angles, ranges = generate_scan(pose, room, rng=rng)
+        target = min(max(ranges.max() * 1.2, 2.0), 8.0)
+        current_rmax = current_rmax * 0.7 + target * 0.3
+        angles, ranges = pool.load(angles, ranges)
+        clean = pool.clean(current_rmax)
+        frames_data.append((current_rmax, angles.copy(), clean.copy(), pool.boundary(current_rmax).copy(),
+                            pool.colors(clean).copy()))
+
+    # Before: the Adaptive viewer's frame - clear the axes and redraw everything
+    fig = plt.figure(figsize=(10, 10), facecolor=BACKGROUND_COLOR)
+    ax = plt.subplot(polar=True)
+    shading = BoundaryShading(color='black', alpha=0.35, zorder=2)
+    _render_frame(fig, ax, shading, *frames_data[0][1:])
+    start = time.perf_counter()
+    for rmax, angles, clean, r_grid, colors in frames_data:
+        _render_frame(fig, ax, shading, angles, clean, r_grid, colors)
+    redraw = (time.perf_counter() - start) / frames
+    plt.close(fig)
+
+    # After: quantized zoom, cached static layer, only the scan's artists drawn
+    fig = plt.figure(figsize=(10, 10), facecolor=BACKGROUND_COLOR)
+    ax = plt.subplot(polar=True)
+    layer = StaticLayer(ax, 0.5, 0.6)
+    cache = ZoomBackgroundCache(fig, layer.set_zoom, levels)
+    shading = BoundaryShading(color='black', alpha=0.35, zorder=2, animated=True)
+    ax.add_patch(shading.patch)
+    points = ax.scatter([], [], s=10, animated=True)
+    title = ax.set_title('', color='white', animated=True)
+    start = time.perf_counter()
+    for k, (rmax, angles, clean, r_grid, colors) in enumerate(frames_data):
+        level = cache.restore(rmax)
+        shading.update(r_grid, level)
+        points.set_offsets(np.column_stack([angles, clean]))
+        points.set_facecolors(colors)
+        title.set_text(f'Auto-Zoom: {level:.1f}m | Scan #{k}')
+        cache.blit(ax, [shading.patch, points, title])
+    cached = (time.perf_counter() - start) / frames
+    plt.close(fig)
+
+    print(f"Frames: {frames} | Zoom levels: {len(levels)} ({levels[0]:.1f}-{levels[-1]:.1f} m, "
+          f"{ZOOM_STEP} m steps)")
+    print(f"Clear and redraw: {redraw * 1e3:6.1f} ms/frame")
+    print(f"Cached background + blit: {cached * 1e3:6.1f} ms/frame ({cached / redraw * 100:.0f}% of redraw)")
+    print(cache.summary())
+
+
+if __name__ == "__main__":
+    _benchmark()